@@ -1,9 +1,8 @@
 from eva.data.eva_dataset_base import EvaDatasetBase
 from eva.utilities.config import get
-from datetime import datetime
 import xarray as xr
 import numpy as np
-import csv
+import pandas as pd
 
 
 class CsvSpace(EvaDatasetBase):
@@ -33,66 +32,66 @@ class CsvSpace(EvaDatasetBase):
         # get 'groups'
         groups = get(dataset_config, self.logger, 'groups')
 
+        # Number of rows parsed at once, large files are streamed in chunks of this many rows
+        chunk_size = int(get(dataset_config, self.logger, 'chunk_size', 1000000))
+
         # Set the collection name
         collection_name = dataset_config['name']
 
+        # Groups sharing the number of header rows are read together
+        header_rows = {}
+        for group in groups:
+            header_info = get(group, self.logger, 'header', None, False)
+            nrows = 0 if header_info is None else int(header_info.get('rows'))
+            header_rows.setdefault(nrows, []).append(group)
+
         ds_list = []
+        for nrows, header_groups in header_rows.items():
 
-        # Read in the CSV files
-        for file in filenames:
+            # Only the columns used by the groups are parsed, directly into typed arrays
+            dtypes = self.get_column_dtypes(header_groups)
 
-            f = open(file, "r")
-            fd = list(csv.reader(f, delimiter=","))
-            file_data = [[element.strip() for element in row] for row in fd]
-            f.close()
+            # Read in the CSV files
+            file_columns = [self.read_columns(file, dtypes, nrows, chunk_size)
+                            for file in filenames]
+            data = {column: np.concatenate([fc[column] for fc in file_columns])
+                    for column in dtypes}
 
-            for group in groups:
+            for group in header_groups:
                 group_name = get(group, self.logger, 'name')
-                header_info = get(group, self.logger, 'header', None, False)
                 group_vars = get(group, self.logger, 'variables', None, False)
-
-                selected_fields = get(group, self.logger, 'selected_fields', 'all')
                 date_config = get(group, self.logger, 'date', None, False)
 
                 coord_config = get(group, self.logger, 'coordinate', None, False)
                 coord = None if not coord_config else coord_config.get('name')
 
-                # skip header if present
-                if header_info is not None:
-                    nrows = int(header_info.get('rows'))
-                    file_data.pop(nrows-1)
+                data_vars = {}
 
                 # load datetime if available
                 if date_config is not None:
                     coord = 'Cycle'
-                    var_name = group_name + "::datetime"
-                    dt_arr = self.get_datetime_array(file_data, date_config)
-                    ds = xr.Dataset({var_name: (coord, dt_arr),
-                                     coord: range(0, len(dt_arr))})
-
-                    ds_list.append(ds)
+                    data_vars[group_name + "::datetime"] = (coord, self.get_datetime_array(
+                                                            data, date_config))
 
                 # load requested data
                 if group_vars is not None:
+                    if coord is None:
+                        coord = 'Unit'
                     for key, var in group_vars.items():
-                        if coord is None:
-                            coord = 'Unit'
-                        var_name = group_name + "::" + key
-                        st_var_arr = [row[var] for row in file_data]
-                        var_arr = np.array(st_var_arr, dtype=np.float32)
+                        data_vars[group_name + "::" + key] = (coord, data[var].astype(
+                                                              np.float32, copy=False))
 
-                        ds = xr.Dataset({var_name: (coord, var_arr),
-                                         coord: range(0, len(var_arr))})
-                        ds_list.append(ds)
+                if data_vars:
+                    length = len(next(iter(data_vars.values()))[1])
+                    ds_list.append(xr.Dataset(data_vars, coords={coord: range(0, length)}))
 
-        # Concatenate datasets from ds_list into a single dataset
+        # Merge the datasets of all the groups into a single dataset
         ds = xr.merge(ds_list)
 
         # Assert that the collection contains at least one variable
         if not ds.keys():
-            self.logger.abort('Collection \'' + dataset_config['name'] + '\', group \'' +
-                              group + '\' in file ' + filename +
-                              ' does not have any variables.')
+            self.logger.abort('Collection \'' + dataset_config['name'] + '\' read from files ' +
+                              f'{filenames} does not have any variables.')
 
         # add the dataset_config to the collections
         data_collections.create_or_add_to_collection(collection_name, ds)
@@ -100,6 +99,72 @@ class CsvSpace(EvaDatasetBase):
 
     # ----------------------------------------------------------------------------------------------
 
+    def get_column_dtypes(self, groups):
+
+        """
+        Get the columns used by a list of groups and the type each column is parsed as.
+
+        Variables are parsed as float32, date components as integers and datetime strings as
+        strings. A column used both as a variable and a date component is parsed as float64.
+
+        Args:
+            groups (list): List of group configuration dictionaries.
+
+        Returns:
+            dict: Type to parse for each column position.
+        """
+
+        dtypes = {}
+        for group in groups:
+            date_config = get(group, self.logger, 'date', None, False) or {}
+            for key, column in date_config.items():
+                dtypes[column] = str if key == 'datetime' else np.int64
+            group_vars = get(group, self.logger, 'variables', None, False) or {}
+            for column in group_vars.values():
+                if column not in dtypes:
+                    dtypes[column] = np.float32
+                elif dtypes[column] is np.int64:
+                    dtypes[column] = np.float64
+
+        return dtypes
+
+    # ----------------------------------------------------------------------------------------------
+
+    def read_columns(self, filename, dtypes, header_rows=0, chunk_size=1000000):
+
+        """
+        Read selected columns of a CSV file into typed numpy arrays. The file is parsed in chunks
+        of rows so that only the selected columns of the file are ever held in memory.
+
+        Args:
+            filename (str): Path to the CSV file.
+            dtypes (dict): Type to parse for each column position to read.
+            header_rows (int, optional): Number of header rows to skip. Default is 0.
+            chunk_size (int, optional): Number of rows parsed at once. Default is 1000000.
+
+        Returns:
+            dict: Array of values for each column position.
+        """
+
+        if not dtypes:
+            return {}
+
+        chunks = {column: [] for column in dtypes}
+        reader = pd.read_csv(filename, header=None, skiprows=header_rows, usecols=list(dtypes),
+                             dtype=dtypes, skipinitialspace=True, chunksize=chunk_size)
+        with reader:
+            for chunk in reader:
+                for column, dtype in dtypes.items():
+                    values = chunk[column]
+                    if dtype is str:
+                        values = values.str.strip()
+                    chunks[column].append(values.to_numpy(dtype=dtype))
+
+        return {column: np.concatenate(chunks[column]) if chunks[column] else
+                np.array([], dtype=dtypes[column]) for column in dtypes}
+
+    # ----------------------------------------------------------------------------------------------
+
     def generate_default_config(self, filenames, collection_name):
 
         """
@@ -129,7 +194,7 @@ class CsvSpace(EvaDatasetBase):
         may be in a single field of file_data or in 4 fields (y,m,d,h).
 
         Args:
-            file_data (list): List of data
+            file_data (dict): Array of values for each column position
             date_config (dict): date configuration information
 
         Returns:
@@ -140,14 +205,10 @@ class CsvSpace(EvaDatasetBase):
         date_keys = {'year', 'month', 'day', 'hour'}
 
         if datetime_key in date_config:
-            date_str_list = [row[date_config.get('datetime')] for row in file_data]
+            dates = pd.to_datetime(file_data[date_config.get('datetime')], format='%Y%m%d%H')
 
         elif all(k in (date_keys) for k in date_config):
-            yr = [row[date_config.get('year')] for row in file_data]
-            mon = [row[date_config.get('month')] for row in file_data]
-            day = [row[date_config.get('day')] for row in file_data]
-            hr = [row[date_config.get('hour')] for row in file_data]
-            date_str_list = [y + m + d + h for y, m, d, h in zip(yr, mon, day, hr)]
+            dates = pd.to_datetime({key: file_data[date_config.get(key)] for key in date_keys})
 
         else:
             self.logger.abort("The date configuration in yaml file does not contain required " +
@@ -156,6 +217,4 @@ class CsvSpace(EvaDatasetBase):
                               " \'year\': int, \'month\': int, \'day\': int, and \'hour\': int. " +
                               f" Date information found was {date_config}")
 
-        return np.array([np.datetime64(datetime.strptime(ds,
-                                       '%Y%m%d%H').strftime('%Y-%m-%dT%H:%M:%S.%f000000'),
-                                       'ns') for ds in date_str_list])
+        return np.asarray(dates, dtype='datetime64[ns]')
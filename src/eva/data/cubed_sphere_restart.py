@@ -14,24 +14,77 @@ import xarray as xr
 from netCDF4 import Dataset
 from eva.data.eva_dataset_base import EvaDatasetBase
 from eva.utilities.config import get
+from eva.utilities.parallel import get_number_of_workers, parallel_imap
+from eva.utilities.utils import get_level_indices, parse_channel_list
 
 
 # --------------------------------------------------------------------------------------------------
 
 
-def read_fms_tiles(files, variable, logger):
+def read_fms_tile(file, variables, level_indices=None):
 
     """
-    Given a list of FMS netCDF files and a variable name,
-    stitches the files together into an N+1 dimension variable.
+    Read a list of variables from a single FMS netCDF tile file, opening the file once.
+
+    Longitudes are transformed in place to be -180 to 180. Defined at module level so that it can
+    run in a worker process.
+
+    Args:
+        file (str): Path to the netCDF tile file.
+        variables (list): Names of the variables to read.
+        level_indices (list, optional): Indices of the levels to read from the (Time, level, y, x)
+                                        variables. Default is None, all the levels are read.
+
+    Returns:
+        tuple: Dictionary of the variable arrays read and list of the variables not in the file.
+    """
+
+    tile_vars = {}
+    missing_vars = []
+
+    with Dataset(file, mode='r') as f:
+        f.set_auto_mask(False)
+        for variable in variables:
+            if variable not in f.variables:
+                missing_vars.append(variable)
+                continue
+
+            if level_indices is not None and f.variables[variable].ndim == 4:
+                # hyperslab read of the requested levels, keeping the level dimension
+                var = np.squeeze(f.variables[variable][:, level_indices], axis=0)
+            else:
+                var = np.squeeze(f.variables[variable][:])
+
+            if variable in ['lon', 'geolon']:
+                # transform longitudes to be -180 to 180
+                np.subtract(var, 360, out=var, where=var > 180)
+
+            tile_vars[variable] = var
+
+    return tile_vars, missing_vars
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_fms_tiles(files, variables, logger, number_of_workers=1, levels=None):
+
+    """
+    Given a list of FMS netCDF files and a list of variable names,
+    stitches the files together into an N+1 dimension array for each variable.
+
+    Each file is opened once to read all the variables and the files are read concurrently.
 
     Args:
         files (list): List of netCDF file paths.
-        variable (str): Name of the variable to extract.
+        variables (list): Names of the variables to extract.
         logger (Logger): Logger object for logging messages.
+        number_of_workers (int, optional): Number of processes reading the files. Default is 1.
+        levels (list, optional): Model levels, numbered from 1, to read from the 3D variables.
+                                 Default is None, all the levels are read.
 
     Returns:
-        np.ndarray: Combined variable array from input files.
+        dict: Combined variable array from input files for each variable.
     """
 
     # Check there are no duplicates in files
@@ -39,26 +92,35 @@ def read_fms_tiles(files, variable, logger):
         logger.abort('Duplicate files were found in input file ' +
                      f'list: {files}. \nExiting ...')
 
-    # Loop through nc files and store variable data in outvar
-    for i, file in enumerate(files):
+    outvars = {}
+    if not variables:
+        return outvars
 
-        with Dataset(file, mode='r') as f:
-            try:
-                var = np.squeeze(f.variables[variable][:])
-            except KeyError:
-                logger.abort(f"{variable} is not a valid variable. \nExiting ...")
+    # Check the requested levels against the first file
+    level_indices = None
+    if levels is not None:
+        with Dataset(files[0], mode='r') as f:
+            vars_3d = [f.variables[var] for var in variables
+                       if var in f.variables and f.variables[var].ndim == 4]
+            if vars_3d:
+                level_indices = get_level_indices(levels, vars_3d[0].shape[1], logger)
 
-            if variable in ['lon', 'geolon']:
-                # transform longitudes to be -180 to 180
-                var[np.where(var > 180)] = var[np.where(var > 180)] - 360
+    # Read the files concurrently and store variable data in outvars as each file is read
+    tiles = parallel_imap(read_fms_tile, [(file, variables, level_indices) for file in files],
+                          number_of_workers, use_processes=True)
+    for i, (tile_vars, missing_vars) in enumerate(tiles):
+
+        if missing_vars:
+            logger.abort(f"{missing_vars[0]} is not a valid variable. \nExiting ...")
 
+        for variable, var in tile_vars.items():
             if i == 0:
                 # need to create outvar on the first file
-                outvar = np.empty(var.shape+(len(files),), dtype=var.dtype)
+                outvars[variable] = np.empty(var.shape+(len(files),), dtype=var.dtype)
             # add values to the correct part of the array
-            outvar[..., i] = var
+            outvars[variable][..., i] = var
 
-    return outvar
+    return outvars
 
 
 # --------------------------------------------------------------------------------------------------
@@ -100,34 +162,51 @@ class CubedSphereRestart(EvaDatasetBase):
         vars_2d = get(dataset_config, self.logger, '2d variables', default=[])
         vars_3d = get(dataset_config, self.logger, '3d variables', default=[])
 
+        # Get the model levels of the 3d variables to be read, numbered from 1
+        # -------------------------
+        levels = get(dataset_config, self.logger, 'levels', None, False)
+        if levels is not None:
+            levels = sorted(set(parse_channel_list(levels, self.logger)))
+
+        # Number of processes reading the tile files
+        # -------------------------
+        number_of_workers = get_number_of_workers(dataset_config, self.logger,
+                                                  max(len(orog_filenames), len(restart_filenames)))
+
         # Read orographic fields first
         # -------------------------
         var_dict = {}
         group_name = 'FV3Orog'
+        tiles = read_fms_tiles(orog_filenames, orog_vars, self.logger, number_of_workers)
         for var in orog_vars:
-            var_dict[group_name + '::' + var] = (["lon", "lat", "tile"],
-                                                 read_fms_tiles(orog_filenames, var, self.logger))
+            var_dict[group_name + '::' + var] = (["lon", "lat", "tile"], tiles[var])
+
+        # 2D and 3D variables, the restart files are read once for both
+        # -------------------------
+        tiles = read_fms_tiles(restart_filenames, list(dict.fromkeys(vars_2d + vars_3d)),
+                               self.logger, number_of_workers, levels)
 
         # 2D variables
         # -------------------------
         group_name = 'FV3Vars2D'
         for var in vars_2d:
-            var_dict[group_name + '::' + var] = (["lon", "lat", "tile"],
-                                                 read_fms_tiles(restart_filenames,
-                                                                var, self.logger))
+            var_dict[group_name + '::' + var] = (["lon", "lat", "tile"], tiles[var])
 
         # 3D variables
         # -------------------------
         group_name = 'FV3Vars3D'
         for var in vars_3d:
-            var_dict[group_name + '::' + var] = (["lev", "lon", "lat", "tile"],
-                                                 read_fms_tiles(restart_filenames,
-                                                                var, self.logger))
+            var_dict[group_name + '::' + var] = (["lev", "lon", "lat", "tile"], tiles[var])
 
         # Create dataset_config from data dictionary
         # -------------------------
         ds = xr.Dataset(var_dict)
 
+        # Keep the model level numbers as a coordinate when a subset of levels is read
+        # -------------------------
+        if levels is not None and 'lev' in ds.dims:
+            ds = ds.assign_coords(lev=levels)
+
         # Assert that the collection contains at least one variable
         # -------------------------
         if not ds.keys():
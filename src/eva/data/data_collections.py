@@ -10,6 +10,8 @@
 # --------------------------------------------------------------------------------------------------
 
 
+from collections import OrderedDict
+
 import numpy as np
 from xarray import Dataset, concat, DataArray
 
@@ -24,6 +26,9 @@ from eva.utilities.utils import fontColors as fcol, string_does_not_contain
 # Math chars not allowed in order to allow evaluation of the variables in the transforms
 disallowed_chars = '-+*/()'
 
+# Number of boolean masks of conditions kept for reuse, the least recently used are dropped first
+max_cached_masks = 16
+
 
 # --------------------------------------------------------------------------------------------------
 
@@ -45,6 +50,15 @@ class DataCollections:
         # If this is a time series, store it
         self.time_series = False if not time_series else True
 
+        # Boolean masks of the conditions already evaluated, with the names of the variables each
+        # mask depends on. A mask is dropped when one of its variables changes or when it is the
+        # least recently used of more than max_cached_masks masks.
+        self._masks = OrderedDict()
+
+        # Boolean selections of the variables stored as filtered views, for each collection. The
+        # values of a view outside its selection are missing.
+        self._selections = {}
+
     # ----------------------------------------------------------------------------------------------
 
     def create_or_add_to_collection(self, collection_name, collection, concat_dimension=None):
@@ -100,9 +114,13 @@ class DataCollections:
                                   concat_dimension + '\' that is requested as the dimension ' +
                                   'along which to concatenate. Valid dimensions are ' +
                                   f'{dims}')
+            self.materialize_selections(collection_name)
             self._collections[collection_name] = concat([self._collections[collection_name],
                                                         collection], dim=concat_dimension)
 
+        # Masks of the conditions on this collection are no longer valid
+        self.forget_masks(collection_name)
+
         # Check that nothing violates the naming conventions
         self.validate_names()
 
@@ -119,10 +137,12 @@ class DataCollections:
 
         for collection in self._collections.keys():
             if channel_dimension_name in list(self._collections[collection].dims):
+                self.materialize_selections(collection)
                 self._collections[collection] = \
                     self._collections[collection].rename_dims({channel_dimension_name: 'Channel'})
                 self._collections[collection] = \
                     self._collections[collection].set_index({'Channel': channel_dimension_name})
+                self.forget_masks(collection)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -137,8 +157,10 @@ class DataCollections:
 
         for collection in self._collections.keys():
             if location_dimension_name in list(self._collections[collection].dims):
+                self.materialize_selections(collection)
                 self._collections[collection] = \
                     self._collections[collection].rename_dims({location_dimension_name: 'Location'})
+                self.forget_masks(collection)
 
     # ----------------------------------------------------------------------------------------------
 
@@ -176,19 +198,217 @@ class DataCollections:
 
         # Add the variable to the collection
         self._collections[collection_name][group_variable_name] = variable
+        self.forget_masks(collection_name, [group_variable_name])
+        self._selections.get(collection_name, {}).pop(group_variable_name, None)
+
+        # Check that nothing violates the naming conventions
+        self.validate_names()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def add_variables_to_collection(self, collection_name, variables, selection=None):
+
+        """
+        Add several new variables to a collection at once.
+
+        With a selection the variables are stored as filtered views: their data is kept as it is,
+        usually shared with the variables they were filtered from, alongside the boolean mask of
+        the values to keep. The mask is shared by all the variables and the values outside it are
+        returned as missing (NaN) by get_variable_data_array and get_variable_data.
+
+        Args:
+            collection_name (str): Name of the collection to add the variables to.
+            variables (dict): The xarray DataArray of each group::variable name to add.
+            selection (DataArray): Boolean mask of the values of the variables to keep
+                                   (optional). Its dimensions must be dimensions of the variables.
+        """
+
+        # If time_series collection name must also be time_series
+        if self.time_series and 'time_series' not in collection_name:
+            self.logger.abort('In get_variable_data: time_series collection must ' +
+                              'have name containing \'time_series\'')
+
+        # Assert that new variables are xarray Dataarrays
+        if not all(isinstance(variable, DataArray) for variable in variables.values()):
+            self.logger.abort('In add_variables_to_collection: variables must be ' +
+                              'xarray.DataArray')
+
+        # Check that there is not an existing collection that is empty
+        if collection_name not in self._collections:
+            # Create a new collection to hold the variables
+            self._collections[collection_name] = Dataset()
+
+        # Add the variables to the collection
+        self._collections[collection_name].update(variables)
+        self.forget_masks(collection_name, list(variables))
+
+        # Keep the selection of the filtered views
+        selections = self._selections.setdefault(collection_name, {})
+        for group_variable_name in variables:
+            if selection is None:
+                selections.pop(group_variable_name, None)
+            else:
+                selections[group_variable_name] = selection
 
         # Check that nothing violates the naming conventions
         self.validate_names()
 
     # ----------------------------------------------------------------------------------------------
 
+    def materialize_selections(self, collection_name, group_variable_names=None):
+
+        """
+        Replace filtered views of a collection by copies with the values outside the selection
+        set to NaN.
+
+        Args:
+            collection_name (str): Name of the collection.
+            group_variable_names (list): The group::variable names of the views to replace
+                                         (optional). By default all the views of the collection.
+        """
+
+        selections = self._selections.get(collection_name, {})
+        if group_variable_names is None:
+            group_variable_names = list(selections)
+
+        dataset = self._collections[collection_name]
+        for group_variable_name in group_variable_names:
+            selection = selections.pop(group_variable_name, None)
+            if selection is not None:
+                dataset[group_variable_name] = dataset[group_variable_name].where(selection)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get_variable_selection(self, collection_name, group_name, variable_name,
+                               channels=None, levels=None, datatypes=None):
+
+        """
+        Retrieve the boolean selection of a variable stored as a filtered view.
+
+        The selection has the shape of the data returned by get_variable_data with
+        apply_selection=False, so that plots and statistics can use only the selected values
+        without a NaN-filled copy of the variable.
+
+        Args:
+            collection_name (str): Name of the collection.
+            group_name (str): Name of the group where the variable belongs.
+            variable_name (str): Name of the variable.
+            channels (int or list[int]): Indices of channels to select (optional).
+            levels (int or list[int]): Indices of levels to select (optional).
+            datatypes (str or list[str]): Indices of data types to select (optional).
+
+        Returns:
+            ndarray: The boolean selection, None if the variable is not a filtered view.
+        """
+
+        group_variable_name = group_name + '::' + variable_name
+        selection = self._selections.get(collection_name, {}).get(group_variable_name)
+        if selection is None:
+            return None
+
+        # Selection with the dimensions of the variable, broadcasting does not copy
+        data_array = self._collections[collection_name][group_variable_name]
+        selection = selection.broadcast_like(data_array).transpose(*data_array.dims)
+        selection = self.select_dimensions(collection_name, selection, channels, levels,
+                                           datatypes)
+
+        return np.squeeze(selection.data)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get_mask(self, condition):
+
+        """
+        Retrieve the boolean mask of a condition evaluated earlier.
+
+        Args:
+            condition (str): The condition, e.g. 'experiment::EffectiveQC::t == 0'.
+
+        Returns:
+            DataArray: The mask of the condition, None if it has not been evaluated or one of the
+                       variables it depends on has changed since.
+        """
+
+        mask = self._masks.get(condition)
+        if mask is None:
+            return None
+
+        self._masks.move_to_end(condition)
+        return mask[1]
+
+    # ----------------------------------------------------------------------------------------------
+
+    def add_mask(self, condition, names, mask):
+
+        """
+        Keep the boolean mask of a condition so that it can be reused by later transforms.
+
+        At most max_cached_masks masks are kept, the least recently used mask is dropped to make
+        room for a new one.
+
+        Args:
+            condition (str): The condition, e.g. 'experiment::EffectiveQC::t == 0'.
+            names (list): The collection::group::variable names the condition depends on.
+            mask (DataArray): The mask of the condition.
+        """
+
+        self._masks[condition] = (names, mask)
+        self._masks.move_to_end(condition)
+        while len(self._masks) > max_cached_masks:
+            self._masks.popitem(last=False)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def forget_masks(self, collection_name, group_variable_names=None):
+
+        """
+        Drop the masks of the conditions depending on variables of a collection.
+
+        Args:
+            collection_name (str): Name of the collection.
+            group_variable_names (list): The group::variable names that changed (optional). By
+                                         default all the variables of the collection changed.
+        """
+
+        if group_variable_names is None:
+            def changed(name):
+                return name.split('::')[0] == collection_name
+        else:
+            changed_names = {collection_name + '::' + gv for gv in group_variable_names}
+
+            def changed(name):
+                return name in changed_names
+
+        for condition, (names, _) in list(self._masks.items()):
+            if any(changed(name) for name in names):
+                del self._masks[condition]
+
+    # ----------------------------------------------------------------------------------------------
+
     def get_data_collection(self, collection_name):
-        return self._collections[collection_name]
+
+        """
+        Retrieve a collection.
+
+        Args:
+            collection_name (str): Name of the collection.
+
+        Returns:
+            Dataset: The collection. If it holds filtered views, a new Dataset where the values of
+                     the views outside their selection are NaN.
+        """
+
+        dataset = self._collections[collection_name]
+        selections = self._selections.get(collection_name)
+        if selections:
+            dataset = dataset.assign({name: dataset[name].where(selection)
+                                      for name, selection in selections.items()})
+        return dataset
 
     # ----------------------------------------------------------------------------------------------
 
     def get_variable_data_array(self, collection_name, group_name, variable_name,
-                                channels=None, levels=None, datatypes=None):
+                                channels=None, levels=None, datatypes=None, apply_selection=True):
 
         """
         Retrieve a specific variable (as a DataArray) from a collection.
@@ -200,6 +420,8 @@ class DataCollections:
             channels (int or list[int]): Indices of channels to select (optional).
             levels (int or list[int]): Indices of levels to select (optional).
             datatypes (str or list[str]): Indices of data types to select (optional).
+            apply_selection (bool): For a filtered view, whether the values outside its selection
+                                    are set to NaN (optional). Default is True.
 
         Returns:
             DataArray: The selected variable as an xarray DataArray.
@@ -218,6 +440,32 @@ class DataCollections:
         group_variable_name = group_name + '::' + variable_name
         data_array = self._collections[collection_name][group_variable_name]
 
+        # Filtered views are returned with NaN outside their selection
+        selection = self._selections.get(collection_name, {}).get(group_variable_name)
+        if selection is not None and apply_selection:
+            data_array = data_array.where(selection)
+
+        return self.select_dimensions(collection_name, data_array, channels, levels, datatypes)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def select_dimensions(self, collection_name, data_array, channels=None, levels=None,
+                          datatypes=None):
+
+        """
+        Select channels, levels or data types of a DataArray of a collection.
+
+        Args:
+            collection_name (str): Name of the collection.
+            data_array (DataArray): The DataArray to select from.
+            channels (int or list[int]): Indices of channels to select (optional).
+            levels (int or list[int]): Indices of levels to select (optional).
+            datatypes (str or list[str]): Indices of data types to select (optional).
+
+        Returns:
+            DataArray: The selected DataArray.
+        """
+
         if channels is None and levels is None and datatypes is None:
             return data_array
 
@@ -275,7 +523,7 @@ class DataCollections:
     # ----------------------------------------------------------------------------------------------
 
     def get_variable_data(self, collection_name, group_name, variable_name,
-                          channels=None, levels=None, datatypes=None):
+                          channels=None, levels=None, datatypes=None, apply_selection=True):
 
         """
         Retrieve the data of a specific variable from a collection.
@@ -287,6 +535,8 @@ class DataCollections:
             channels (int or list[int]): Indices of channels to select (optional).
             levels (int or list[int]): Indices of levels to select (optional).
             datatypes (str or list[str]): Indices of data types to select (optional).
+            apply_selection (bool): For a filtered view, whether the values outside its selection
+                                    are set to NaN (optional). Default is True.
 
         Returns:
             ndarray: The selected variable data as a NumPy array.
@@ -298,7 +548,8 @@ class DataCollections:
                               'have name containing \'time_series\'')
 
         variable_array = self.get_variable_data_array(collection_name, group_name, variable_name,
-                                                      channels, levels, datatypes)
+                                                      channels, levels, datatypes,
+                                                      apply_selection)
 
         # Extract the actual data array
         variable_data = variable_array.data
@@ -367,6 +618,9 @@ class DataCollections:
             collections = [cgv[0]]
             groups_variables = [cgv[1]+'::'+cgv[2]]
 
+            # A filtered view is copied so that the data it shares is not screened
+            self.materialize_selections(cgv[0], groups_variables)
+
         # Loop over the collections
         # ------------------------------
         for collection in collections:
@@ -383,13 +637,16 @@ class DataCollections:
                 # Split name into group and variable
                 [group, variable] = group_variable.split('::')
 
-                # Get the data
-                data_var_value = self.get_variable_data(collection, group, variable)
+                # Get the data, filtered views share the data they were filtered from
+                data_var_value = self.get_variable_data(collection, group, variable,
+                                                        apply_selection=False)
 
                 # For float data sceen outside threshold
                 if 'float' in str(data_var_value.dtype):
                     data_var_value[np.abs(data_var_value) > threshold] = np.nan
 
+            self.forget_masks(collection, groups_variables)
+
     # ----------------------------------------------------------------------------------------------
 
     def display_collections(self):
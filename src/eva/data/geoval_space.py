@@ -11,10 +11,11 @@
 import os
 import netCDF4 as nc
 import numpy as np
-from xarray import Dataset, open_dataset
 from eva.utilities.config import get
 from eva.data.eva_dataset_base import EvaDatasetBase
-from eva.utilities.utils import parse_channel_list
+from eva.utilities.dataset_files import get_dataset_files, read_netcdf_files
+from eva.utilities.parallel import get_number_of_workers
+from eva.utilities.utils import get_level_indices, parse_channel_list
 
 
 class GeovalSpace(EvaDatasetBase):
@@ -42,44 +43,69 @@ class GeovalSpace(EvaDatasetBase):
         # ---------------------------
         threshold = float(get(dataset_config, self.logger, 'missing_value_threshold', 1.0e30))
 
-        # Get levels to plot profiles
+        # Get levels to plot profiles, numbered from 1
         # --------------------------_
         levels_str_or_list = get(dataset_config, self.logger, 'levels', [])
 
         # Convert levels to list
         levels = []
-        if levels_str_or_list is not []:
-            levels = parse_channel_list(levels_str_or_list, self.logger)
+        if levels_str_or_list != []:
+            levels = sorted(set(parse_channel_list(levels_str_or_list, self.logger)))
 
-        # Filename to be used for reads
+        # Files to be used for reads: a file, a list of files, glob patterns or date templates
         # ---------------------------------------
-        data_filename = get(dataset_config, self.logger, 'data_file')
+        data_filenames, dates = get_dataset_files(dataset_config, self.logger, 'data_file')
+
+        # Dimension along which the files are concatenated, by default the location dimension
+        # of the files, or a new dimension such as Time
+        # ---------------------------------------
+        concat_dimension = get(dataset_config, self.logger, 'concat_dimension', 'Location')
 
         # Get instrument name
         instr_name = get(dataset_config, self.logger, 'instrument_name')
 
-        # Open instrument files xarray dataset
-        instr_ds = open_dataset(data_filename)
-
         # Enforce that a variable exists, do not default to all variables
         variables = get(dataset_config, self.logger, 'variables')
         if not variables:
             self.logger.abort('A variables list needs to be defined in the config file.')
-        vars_to_remove = list(set(list(instr_ds.keys())) - set(variables))
-        instr_ds = instr_ds.drop_vars(vars_to_remove)
+
+        # The location dimension of the files is the first dimension of the variables
+        with nc.Dataset(data_filenames[0], mode='r') as f:
+            if concat_dimension == 'Location':
+                concat_dimension = f.variables[variables[0]].dimensions[0]
+            stack_dimension = None if concat_dimension in f.dimensions else concat_dimension
+
+            # Indices of the requested levels along the level dimensions, so that only the
+            # requested levels are read
+            level_indices = None
+            if levels:
+                level_dims = {f.variables[v].dimensions[1] for v in variables
+                              if f.variables[v].ndim > 1}
+                level_indices = {dim: get_level_indices(levels, f.dimensions[dim].size,
+                                                        self.logger) for dim in level_dims}
+
+        # Read the requested variables of the files concurrently and concatenate them
+        number_of_workers = get_number_of_workers(dataset_config, self.logger,
+                                                  len(data_filenames))
+        instr_ds = read_netcdf_files(data_filenames, variables, number_of_workers,
+                                     concat_dimension, dates, level_indices)
 
         # Rename variables and nval dimension
         rename_dict = {}
         rename_dims_dict = {}
         for v in variables:
-            # Retrieve dimension names
-            dims = instr_ds[v].dims
+            # Retrieve dimension names of the files
+            dims = [dim for dim in instr_ds[v].dims if dim != stack_dimension]
             if np.size(dims) > 1:
                 rename_dims_dict[dims[1]] = f'Level'
             rename_dict[v] = f'{instr_name}::{v}'
         instr_ds = instr_ds.rename(rename_dict)
         instr_ds = instr_ds.rename_dims(rename_dims_dict)
 
+        # Keep the model level numbers as a coordinate
+        if levels and 'Level' in instr_ds.dims:
+            instr_ds = instr_ds.assign_coords(Level=levels)
+
         # Add the dataset_config to the collections
         data_collections.create_or_add_to_collection(collection_name, instr_ds)
 
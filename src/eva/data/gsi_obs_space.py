@@ -10,35 +10,16 @@
 
 import os
 import numpy as np
-from itertools import groupby
-from xarray import Dataset, open_dataset
+from xarray import Dataset, concat, open_dataset
 
 from eva.data.eva_dataset_base import EvaDatasetBase
 from eva.utilities.config import get
+from eva.utilities.parallel import get_number_of_workers, parallel_map
 from eva.utilities.utils import parse_channel_list
 
 # --------------------------------------------------------------------------------------------------
 
 
-def all_equal(iterable):
-
-    """
-    Check if all elements in an iterable are equal.
-
-    Args:
-        iterable: An iterable object to check.
-
-    Returns:
-        bool: True if all elements are equal, False otherwise.
-    """
-
-    g = groupby(iterable)
-    return next(g, True) and not next(g, False)
-
-
-# --------------------------------------------------------------------------------------------------
-
-
 def uv(group_vars):
 
     """
@@ -117,6 +98,10 @@ def satellite_dataset(ds):
     """
     Build a new dataset to reshape satellite data.
 
+    Variables along nobs are classified together by data type. Variables that repeat over the
+    channels of the first observation are kept along nobs only, others become (nobs, nchans). In
+    both cases the data is a view of the variable rather than a copy.
+
     Args:
         ds (Dataset): The input xarray Dataset.
 
@@ -124,8 +109,8 @@ def satellite_dataset(ds):
         Dataset: Reshaped xarray Dataset.
     """
 
-    nchans = ds.dims['nchans']
-    iters = int(ds.dims['nobs']/nchans)
+    nchans = ds.sizes['nchans']
+    iters = int(ds.sizes['nobs']/nchans)
 
     coords = {
         'nchans': (('nchans'), ds['sensor_chan'].data),
@@ -134,6 +119,7 @@ def satellite_dataset(ds):
     }
 
     data_vars = {}
+    nobs_vars = {}
     # Loop through each variable
     for var in ds.variables:
 
@@ -142,29 +128,38 @@ def satellite_dataset(ds):
                    'atmosphere_absorber_01', 'atmosphere_absorber_02', 'atmosphere_absorber_03']:
             continue
 
-        # If variable has len of nchans, pass along data
-        if len(ds[var]) == nchans:
+        # If variable is along nchans, pass along data
+        if ds[var].dims == ('nchans',):
             data_vars[var] = (('nchans'), ds[var].data)
 
         # If variable is BC_angord, reshape data
         elif var == 'BC_angord':
             data = np.reshape(ds['BC_angord'].data,
-                              (iters, nchans, ds.dims['BC_angord_arr_dim']))
+                              (iters, nchans, ds.sizes['BC_angord_arr_dim']))
             data_vars[var] = (('nobs', 'nchans', 'BC_angord_arr_dim'), data)
 
-        # Deals with how to handle nobs data
-        else:
-            # Check if values repeat over nchans
-            condition = all_equal(ds[var].data[0:nchans])
+        # Collect nobs data by type
+        elif ds[var].dims == ('nobs',):
+            nobs_vars.setdefault(ds[var].dtype, []).append(var)
+
+    # Deals with how to handle nobs data
+    for variables in nobs_vars.values():
+
+        # Check, for all variables of this type at once, if values repeat over nchans
+        first_obs = np.stack([ds[var].data[0:nchans] for var in variables])
+        repeating = (first_obs == first_obs[:, :1]).all(axis=1)
+
+        for ind, var in enumerate(variables):
+
+            # View the data as (nobs, nchans)
+            data = np.reshape(ds[var].data, (iters, nchans))
 
             # If values are repeating over nchan iterations, keep as nobs
-            if condition:
-                data = ds[var].data[0::nchans]
-                data_vars[var] = (('nobs'), data)
+            if repeating[ind]:
+                data_vars[var] = (('nobs'), data[:, 0])
 
-            # Else, reshape to be a 2d array
+            # Else, keep as a 2d array
             else:
-                data = np.reshape(ds[var].data, (iters, nchans))
                 data_vars[var] = (('nobs', 'nchans'), data)
 
     # create dataset_config
@@ -178,6 +173,91 @@ def satellite_dataset(ds):
 # --------------------------------------------------------------------------------------------------
 
 
+def read_gsi_file(filename, collection_name, groups, channels, logger, variable=None):
+
+    """
+    Read the requested groups from a single GSI ncdiag file. Defined at module level so that it
+    can run in a worker process.
+
+    Args:
+        filename (str): Path to the GSI ncdiag file.
+        collection_name (str): Name of the collection the file is read into.
+        groups (list): List of group configurations (name and variables).
+        channels (list): List of channels to keep for radiance diags.
+        logger (Logger): Logger instance for logging messages.
+        variable (str, optional): Conventional variable type (e.g. 't', 'uv'). Default is None.
+
+    Returns:
+        Dataset: The requested variables of the file, renamed with their group.
+    """
+
+    # Open the file once for all groups
+    ds_file = open_dataset(filename, mask_and_scale=False, decode_times=False)
+
+    # Reshape variables if satellite diag
+    if 'nchans' in ds_file.dims:
+        ds_file = satellite_dataset(ds_file)
+        ds_file = subset_channels(ds_file, channels, logger)
+
+    ds_groups = Dataset(attrs=ds_file.attrs)
+
+    # Loop over groups
+    for group in groups:
+
+        # Group name and variables
+        group_name = get(group, logger, 'name')
+        group_vars = get(group, logger, 'variables', 'all')
+
+        # If user specifies all variables set to group list
+        if group_vars == 'all':
+            group_vars = list(ds_file.data_vars)
+
+        # Adjust variable names if uv
+        if variable == 'uv':
+            group_vars = uv(list(group_vars))
+
+        # Check that all user variables are in the dataset_config
+        if not all(v in list(ds_file.data_vars) for v in group_vars):
+            logger.abort('For collection \'' + collection_name
+                         + '\', group \'' + group_name + '\' in file ' + filename +
+                         f' . Variables {group_vars} not all present in ' +
+                         f'the data set variables: {list(ds_file.keys())}')
+
+        # Drop data variables not in user requested variables
+        vars_to_remove = list(set(list(ds_file.keys())) - set(group_vars))
+        ds = ds_file.drop_vars(vars_to_remove)
+
+        # Explicitly add the channels to the collection (we do not want to include this
+        # in the 'variables' list in the YAML to avoid transforms being applied to them)
+        if 'nchans' in ds.dims:
+            channels_used = ds['nchans']
+            ds[group_name + '::channelNumber'] = channels_used
+
+        # Rename variables with group
+        rename_dict = {}
+        for group_var in group_vars:
+            rename_dict[group_var] = group_name + '::' + group_var
+        ds = ds.rename(rename_dict)
+
+        # Assert that the collection contains at least one variable
+        if not ds.keys():
+            logger.abort('Collection \'' + collection_name + '\', group \'' +
+                         group_name + '\' in file ' + filename +
+                         ' does not have any variables.')
+
+        # Merge with other groups
+        ds_groups = ds_groups.merge(ds)
+
+    # Load the data before closing the file
+    ds_groups = ds_groups.load()
+    ds_file.close()
+
+    return ds_groups
+
+
+# --------------------------------------------------------------------------------------------------
+
+
 class GsiObsSpace(EvaDatasetBase):
 
     """
@@ -186,7 +266,7 @@ class GsiObsSpace(EvaDatasetBase):
 
     # ----------------------------------------------------------------------------------------------
 
-    def execute(self, dataset_config, data_collections, timeing):
+    def execute(self, dataset_config, data_collections, timing):
 
         """
         Execute the GSI observation space data processing.
@@ -211,6 +291,7 @@ class GsiObsSpace(EvaDatasetBase):
         filenames = get(dataset_config, self.logger, 'filenames')
 
         # File variable type
+        variable = None
         if 'satellite' in dataset_config:
             satellite = get(dataset_config, self.logger, 'satellite')
             sensor = get(dataset_config, self.logger, 'sensor')
@@ -225,68 +306,27 @@ class GsiObsSpace(EvaDatasetBase):
         # -------------------------
         groups = get(dataset_config, self.logger, 'groups')
 
-        # Loop over filenames
-        # -------------------
-        for filename in filenames:
-
-            # Loop over groups
-            for group in groups:
-
-                # Group name and variables
-                group_name = get(group, self.logger, 'name')
-                group_vars = get(group, self.logger, 'variables', 'all')
-
-                # Set the collection name
-                collection_name = dataset_config['name']
-
-                ds = open_dataset(filename, mask_and_scale=False,
-                                  decode_times=False)
-
-                # If user specifies all variables set to group list
-                if group_vars == 'all':
-                    group_vars = list(ds.data_vars)
-
-                # Reshape variables if satellite diag
-                if 'nchans' in ds.dims:
-                    ds = satellite_dataset(ds)
-                    ds = subset_channels(ds, channels, self.logger)
-
-                # Adjust variable names if uv
-                if 'variable' in locals():
-                    if variable == 'uv':
-                        group_vars = uv(group_vars)
-
-                # Check that all user variables are in the dataset_config
-                if not all(v in list(ds.data_vars) for v in group_vars):
-                    self.logger.abort('For collection \'' + dataset_config['name']
-                                      + '\', group \'' + group_name + '\' in file ' + filename +
-                                      f' . Variables {group_vars} not all present in ' +
-                                      f'the data set variables: {list(ds.keys())}')
-
-                # Drop data variables not in user requested variables
-                vars_to_remove = list(set(list(ds.keys())) - set(group_vars))
-                ds = ds.drop_vars(vars_to_remove)
-
-                # Explicitly add the channels to the collection (we do not want to include this
-                # in the 'variables' list in the YAML to avoid transforms being applied to them)
-                if 'nchans' in ds.dims:
-                    channels_used = ds['nchans']
-                    ds[group_name + '::channelNumber'] = channels_used
-
-                # Rename variables with group
-                rename_dict = {}
-                for group_var in group_vars:
-                    rename_dict[group_var] = group_name + '::' + group_var
-                ds = ds.rename(rename_dict)
-
-                # Assert that the collection contains at least one variable
-                if not ds.keys():
-                    self.logger.abort('Collection \'' + dataset_config['name'] + '\', group \'' +
-                                      group_name + '\' in file ' + filename +
-                                      ' does not have any variables.')
-
-            # Add the dataset_config to the collections
-            data_collections.create_or_add_to_collection(collection_name, ds, 'nobs')
+        # Set the collection name
+        collection_name = dataset_config['name']
+
+        # Read the files concurrently
+        # ---------------------------
+        number_of_workers = get_number_of_workers(dataset_config, self.logger, len(filenames))
+        timing.start('GsiObsSpace: read files')
+        file_datasets = parallel_map(read_gsi_file,
+                                     [(filename, collection_name, groups, channels, self.logger,
+                                       variable) for filename in filenames],
+                                     number_of_workers, use_processes=True)
+        timing.stop('GsiObsSpace: read files')
+
+        # Concatenate all the files along nobs at once
+        if len(file_datasets) > 1:
+            ds = concat(file_datasets, dim='nobs')
+        else:
+            ds = file_datasets[0]
+
+        # Add the dataset_config to the collections
+        data_collections.create_or_add_to_collection(collection_name, ds, 'nobs')
 
         # Nan out unphysical values
         data_collections.nan_float_values_outside_threshold(threshold)
@@ -10,11 +10,16 @@
 # --------------------------------------------------------------------------------------------------
 
 
+import copy
+import hashlib
 import os
+import pickle
+import re
 import numpy as np
 import xarray as xr
 
 from eva.data.eva_dataset_base import EvaDatasetBase
+from eva.utilities.utils import get_cache_directory
 
 
 # --------------------------------------------------------------------------------------------------
@@ -23,28 +28,287 @@ from eva.data.eva_dataset_base import EvaDatasetBase
 # Parameters
 space = ' '
 
+# Number of bytes at the start of a followed log used to recognise it
+follow_head_bytes = 1024
+
+# Convergence terms searched for in each chunk of the log. Each entry holds the variable name,
+# the search term, the separator and position of the value after splitting, and the data type.
+# The inner iteration search term is completed with the name of the minimizer algorithm.
+minimizer_terms = [
+    ('inner_iteration', ' Starting Iteration', 'Iteration', 1, 'int32'),
+    ('gradient_reduction', 'Gradient reduction (', '=', 1, 'float32'),
+    ('residual_norm', 'Residual norm (', '=', 1, 'float32'),
+    ('norm_reduction', 'Norm reduction (', '=', 1, 'float32'),
+]
+j_terms = [
+    ('j', 'Quadratic cost function: J ', '=', 1, 'float32'),
+    ('jb', 'Quadratic cost function: Jb', '=', 1, 'float32'),
+    ('jojc', 'Quadratic cost function: JoJc', '=', 1, 'float32'),
+]
+
 
 # --------------------------------------------------------------------------------------------------
 
 
-def get_data_from_line(jedi_log_line, search_term, separator, position):
+def decode_log_text(log_bytes):
 
     """
-    Extracts data from a line in a Jedi log based on the specified search term,
-    separator, and position.
+    Decode bytes read from a Jedi log, translating newlines as when reading in text mode.
 
     Args:
-        jedi_log_line (str): Line from the Jedi log.
-        search_term (str): Search term to look for in the line.
-        separator (str): Separator used to split the line.
-        position (int): Position of the desired data after splitting.
+        log_bytes (bytes): Bytes read from the log.
 
     Returns:
-        str: Extracted data value or None if not found.
+        str: Decoded text with Unix newlines.
     """
 
-    if search_term in jedi_log_line:
-        return jedi_log_line.split(separator)[position]
+    return log_bytes.decode(errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class JediLogParser:
+
+    """
+    A single pass parser for Jedi logs.
+
+    The log is streamed in blocks of whole lines. Lines between two empty lines form a chunk,
+    and each chunk is reduced to the first value of every convergence term it contains as soon
+    as it is complete. Empty lines and lines containing the terms of interest are located with
+    compiled regular expressions over the whole block, so only those lines are looked at in
+    Python. The parser holds no reference to the log, so it can be fed further lines later on.
+    """
+
+    # Any line that can contribute to the convergence data contains one of these terms
+    term_patterns = [re.compile(re.escape(term)) for term in
+                     ['Minimizer algorithm', 'Starting Iteration', 'end of iteration',
+                      'reduction (', 'Residual norm (', 'Quadratic cost function: J']]
+
+    # Empty lines (or just spaces) and ctest header lines, matched with the newline before them
+    empty_line_pattern = re.compile(r'\n[^\S\n]*(?=\n)')
+    test_line_pattern = re.compile(r'\ntest[^\n]*\n')
+
+    # Number of characters read from the log at once
+    block_size = 2**24
+
+    def __init__(self):
+
+        """
+        Initialize an empty parser state.
+        """
+
+        # Prepend string of ctest logs and name of the minimizer
+        self.test_string = ''
+        self.minimizer_algorithm = None
+
+        # Terms searched for in each line
+        self.search_terms = self.get_search_terms()
+
+        # Values and matched search terms of the chunk being read
+        self.chunk = {}
+        self.chunk_flags = set()
+
+        # Values of the completed minimizer (Norm reduction etc) and J, Jb, JoJc chunks
+        self.minimizer_chunks = []
+        self.j_chunks = []
+
+    # ----------------------------------------------------------------------------------------------
+
+    def parse_file(self, log_file):
+
+        """
+        Parse all the lines of an open log file.
+
+        Args:
+            log_file (file): Log file opened for reading in text mode.
+        """
+
+        remainder = ''
+        while True:
+            text = log_file.read(self.block_size)
+            if not text:
+                break
+            text = remainder + text
+            end_of_lines = text.rfind('\n') + 1
+            self.parse_text(text[:end_of_lines])
+            remainder = text[end_of_lines:]
+
+        # The text after the final newline is the last (possibly empty) line of the log
+        self.parse_line(remainder)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def parse_text(self, text):
+
+        """
+        Parse text made of whole lines, each ending with a newline.
+
+        Args:
+            text (str): Lines from the Jedi log.
+        """
+
+        # ctest header lines change the test prepend string for the lines that follow them
+        position = 0
+        for match in self.test_line_pattern.finditer('\n' + text):
+            self.parse_block(text[position:match.start()])
+            self.parse_line(match.group().strip('\n'))
+            position = match.end() - 1
+        self.parse_block(text[position:])
+
+    # ----------------------------------------------------------------------------------------------
+
+    def parse_block(self, block):
+
+        """
+        Parse whole lines, each ending with a newline, that contain no ctest header line.
+
+        Args:
+            block (str): Lines from the Jedi log.
+        """
+
+        # Start of each empty line, once the test number is removed, matched with the newline
+        # before it
+        empty_line_pattern = self.empty_line_pattern
+        if self.test_string:
+            empty_line_pattern = re.compile(r'\n(?:' + re.escape(self.test_string) +
+                                            r')?[^\S\n]*(?=\n)')
+        events = {match.start(): True for match in empty_line_pattern.finditer('\n' + block)}
+
+        # Start of each line containing a term, the minimizer is only searched for until found
+        term_patterns = self.term_patterns[self.minimizer_algorithm is not None:]
+        for term_pattern in term_patterns:
+            for match in term_pattern.finditer(block):
+                events.setdefault(block.rfind('\n', 0, match.start()) + 1, False)
+
+        for line_start in sorted(events):
+            if events[line_start]:
+                self.end_chunk()
+            else:
+                line = block[line_start:block.find('\n', line_start)]
+                self.parse_content(line.replace(self.test_string, '') if self.test_string
+                                   else line)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def parse_line(self, line):
+
+        """
+        Parse a single line of the log (without its newline).
+
+        Args:
+            line (str): Line from the Jedi log.
+        """
+
+        # Check if this was a ctest and if so determine test prepend string
+        if line[0:4] == 'test':
+            self.test_string = line.split(' ')[1] + ': '
+
+        # Remove the test number
+        if self.test_string:
+            line = line.replace(self.test_string, '')
+
+        # An empty line (or just spaces) completes the chunk
+        if not line or line.isspace():
+            self.end_chunk()
+        else:
+            self.parse_content(line)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def parse_content(self, line):
+
+        """
+        Record the convergence terms found in a line matching the pattern.
+
+        Args:
+            line (str): Line from the Jedi log, with the test number removed.
+        """
+
+        # Get the name of the minimizer and complete the search terms that depend on it
+        if self.minimizer_algorithm is None and 'Minimizer algorithm' in line:
+            self.minimizer_algorithm = line.split('=')[1]
+            self.search_terms = self.get_search_terms(self.minimizer_algorithm)
+
+        # Note the terms found in the chunk and keep the first value of each
+        for name, search_term, separator, position in self.search_terms:
+            if search_term in line:
+                self.chunk_flags.add(name)
+                if separator is not None and name not in self.chunk:
+                    data_val = line.split(separator)[position]
+                    if data_val:
+                        self.chunk[name] = data_val
+
+    # ----------------------------------------------------------------------------------------------
+
+    def get_search_terms(self, minimizer_algorithm=None):
+
+        """
+        Build the list of terms searched for in each line of a chunk.
+
+        Args:
+            minimizer_algorithm (str): Name of the minimizer, None until it is found in the log.
+
+        Returns:
+            list: List of (name, search term, separator, position) for each term. Terms that only
+            flag the chunk have no separator.
+        """
+
+        search_terms = []
+        for name, search_term, separator, position, _ in minimizer_terms + j_terms:
+            if name == 'inner_iteration':
+                if minimizer_algorithm is None:
+                    continue
+                search_term = f'{minimizer_algorithm}{search_term}'
+            search_terms.append((name, search_term, separator, position))
+
+        if minimizer_algorithm is not None:
+            search_terms.append(('end', f'{minimizer_algorithm} end of iteration', None, None))
+
+        return search_terms
+
+    # ----------------------------------------------------------------------------------------------
+
+    def end_chunk(self):
+
+        """
+        Complete the current chunk, keeping its values if it is a minimizer or J chunk.
+        """
+
+        if {'inner_iteration', 'end'} <= self.chunk_flags:
+            self.minimizer_chunks.append(self.chunk)
+        if {'j', 'jb'} <= self.chunk_flags:
+            self.j_chunks.append(self.chunk)
+
+        self.chunk = {}
+        self.chunk_flags = set()
+
+    # ----------------------------------------------------------------------------------------------
+
+    def convergence_values(self):
+
+        """
+        Collect the values of each convergence term over the completed chunks.
+
+        Returns:
+            int: Total number of inner iterations.
+            list: List of (variable name, data type, list of values) for each term.
+        """
+
+        terms = []
+        if self.minimizer_chunks:
+            terms += minimizer_terms
+        if self.j_chunks:
+            terms += j_terms
+
+        # Minimizer chunks are searched before the J chunks
+        chunks = self.minimizer_chunks + self.j_chunks
+
+        values = []
+        for name, _, _, _, dtype in terms:
+            values.append((name, dtype, [chunk[name] for chunk in chunks if name in chunk]))
+
+        return len(self.minimizer_chunks), values
 
 
 # --------------------------------------------------------------------------------------------------
@@ -73,42 +337,16 @@ class JediLog(EvaDatasetBase):
         # Collection name to use
         collection_name = dataset_config.get('collection_name')
 
-        # Read log file into a string
-        with open(jedi_log_to_parse) as jedi_log_to_parse_open:
-            jedi_log_text = jedi_log_to_parse_open.read()
-
-        # Split log into list of lines
-        jedi_log_lines = jedi_log_text.split('\n')
-
-        # Check if this was a ctest and if so determine test prepend string
-        test_string = ''
-        for jedi_log_line in jedi_log_lines:
-            if jedi_log_line[0:4] == 'test':
-                test_string = jedi_log_line.split(' ')[1] + ': '
-
-        # Clean up lines
-        self.jedi_log_lines = []
-        for jedi_log_line in jedi_log_lines:
-            # Replace test number
-            new_line = jedi_log_line.replace(test_string, '')
-            # If new line is just spaces then set to empty string
-            if new_line.isspace():
-                new_line = ''
-            # Assemble new list of strings
-            self.jedi_log_lines.append(new_line)
-
-        # Split log into list of strings. Each element is all lines between two empty lines in the
-        # in the log file.
-        chunk_start_points = [-1]
-        for jedi_log_line_ind, jedi_log_line in enumerate(self.jedi_log_lines):
-            if jedi_log_line == '':
-                chunk_start_points.append(jedi_log_line_ind)
-        chunk_start_points.append(len(self.jedi_log_lines)+1)
-
-        self.log_chunks = []
-        for i in range(len(chunk_start_points)-2):
-            chunk = self.jedi_log_lines[chunk_start_points[i]+1:chunk_start_points[i+1]]
-            self.log_chunks.append('\n'.join(chunk))
+        # Parse the log in a single pass. When following a log that is still being written only
+        # the lines appended since the previous invocation are parsed, unless the on-disk caches
+        # that hold the parser state are disabled.
+        follow_state_dir = get_cache_directory(dataset_config, 'jedi_log_follow')
+        if dataset_config.get('follow', False) and follow_state_dir:
+            self.parser = self.follow_log(jedi_log_to_parse, follow_state_dir)
+        else:
+            self.parser = JediLogParser()
+            with open(jedi_log_to_parse) as jedi_log_to_parse_open:
+                self.parser.parse_file(jedi_log_to_parse_open)
 
         # Get list of things to parse from the dictionary
         data_to_parse = dataset_config.get('data_to_parse')
@@ -122,63 +360,78 @@ class JediLog(EvaDatasetBase):
 
     # ----------------------------------------------------------------------------------------------
 
-    def get_from_log(self, search_term, separator, position, custom_log=None):
+    def follow_log(self, jedi_log_to_parse, follow_state_dir):
 
         """
-        Searches the Jedi log for a specified term and extracts the corresponding data.
+        Parse the lines appended to a log since the previous invocation.
 
-        Args:
-            search_term (str): Search term to look for in the Jedi log.
-            separator (str): Separator used to split the log line.
-            position (int): Position of the desired data after splitting.
-            custom_log: Custom log to search in (optional).
-
-        Returns:
-            str: Extracted data value or None if not found.
-        """
-
-        if custom_log is None:
-            log = self.jedi_log_lines
-        else:
-            log = custom_log
-
-        # Loop over elements of string
-        for jedi_log_line in log:
-            data_val = get_data_from_line(jedi_log_line, search_term, separator, position)
-            if data_val is not None:
-                return data_val
-        return None
-
-    # ----------------------------------------------------------------------------------------------
-
-    def get_matching_chunks(self, search_terms):
-
-        """
-        Finds log chunks that match a list of search terms.
+        The parser state and the byte offset of the first line not yet parsed are saved in
+        follow_state_dir between invocations. The state is discarded, and the log parsed from the
+        start, if the log was replaced or truncated since it was saved.
 
         Args:
-            search_terms (list): List of search terms to match in log chunks.
+            jedi_log_to_parse (str): Path to the Jedi log.
+            follow_state_dir (str): Directory holding the saved parser states.
 
         Returns:
-            list: List of matching log chunks.
+            JediLogParser: Parser holding the whole log, including its unterminated last line.
         """
 
-        # Create array to hold chunks that match
-        matching_chunks = []
-
-        # Loop over elements of string
-        for log_chunk in self.log_chunks:
-
-            # Build an array to check each match
-            search_terms_match = []
-            for search_term in search_terms:
-                search_terms_match.append(search_term in log_chunk)
-
-            # Append if all search terms are in the chunk
-            if all(search_terms_match):
-                matching_chunks.append(log_chunk)
-
-        return matching_chunks
+        log_path = os.path.abspath(jedi_log_to_parse)
+        state_name = hashlib.sha1(log_path.encode()).hexdigest() + '.pkl'
+        state_file = os.path.join(follow_state_dir, state_name)
+
+        with open(log_path, 'rb') as log_file:
+
+            # Identify the log by its inode and first bytes
+            log_head = log_file.read(follow_head_bytes)
+            log_inode = os.fstat(log_file.fileno()).st_ino
+            log_size = os.fstat(log_file.fileno()).st_size
+
+            # Resume from the saved state if it is for this log
+            state = None
+            try:
+                with open(state_file, 'rb') as fh:
+                    state = pickle.load(fh)
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+                pass
+
+            if (isinstance(state, dict) and state.get('inode') == log_inode and
+                    state.get('offset', log_size + 1) <= log_size and
+                    log_head.startswith(state.get('head', b'-'))):
+                parser = state['parser']
+                offset = state['offset']
+                self.logger.info(f'Following {jedi_log_to_parse} from byte {offset}')
+            else:
+                parser = JediLogParser()
+                offset = 0
+
+            # Parse the complete lines that were appended
+            log_file.seek(offset)
+            appended = log_file.read()
+
+        end_of_lines = appended.rfind(b'\n') + 1
+        parser.parse_text(decode_log_text(appended[:end_of_lines]))
+        offset += end_of_lines
+
+        # Save the state for the next invocation
+        state = {'inode': log_inode, 'offset': offset, 'head': log_head[:offset],
+                 'parser': parser}
+        try:
+            os.makedirs(follow_state_dir, exist_ok=True)
+            tmp_file = f'{state_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'wb') as fh:
+                pickle.dump(state, fh)
+            os.replace(tmp_file, state_file)
+        except OSError:
+            self.logger.info(f'Warning: unable to save the state of {jedi_log_to_parse} to ' +
+                             f'{state_file}')
+
+        # The unterminated last line is parsed by a copy, as it may still be being written
+        parser = copy.deepcopy(parser)
+        parser.parse_line(decode_log_text(appended[end_of_lines:]))
+
+        return parser
 
     # ----------------------------------------------------------------------------------------------
 
@@ -191,138 +444,50 @@ class JediLog(EvaDatasetBase):
             xr.Dataset: Dataset containing the parsed convergence data.
         """
 
-        # Get the name of the minimizer
-        minimizer_algorithm = self.get_from_log('Minimizer algorithm', '=', 1)
-
-        # Get the chunks for the minimizer part (Norm reduction etc)
-        minimizer_chunks_strings = [f'{minimizer_algorithm} Starting Iteration',
-                                    f'{minimizer_algorithm} end of iteration']
-        minimizer_chunks = self.get_matching_chunks(minimizer_chunks_strings)
-
-        # Get the chunks for the J, Jb, JoJc part
-        j_chunks_strings = [f'Quadratic cost function: J ',
-                            f'Quadratic cost function: Jb']
-        j_chunks = self.get_matching_chunks(j_chunks_strings)
-
-        # Total number of inner iterations
-        total_iter = len(minimizer_chunks)
+        # Total number of inner iterations and values of each variable
+        total_iter, var_values = self.parser.convergence_values()
 
         # Check that some minimizer chunks were found
         if total_iter == 0:
             self.logger.abort('The number of iterations found in the log is zero. Check the ' +
                               'parsing of the log is correct.')
 
-        # Create list of variables that need to be built
-        var_names = []
-        var_search_criteria = []
-        var_split = []
-        var_position = []
-        var_dtype = []
-        if minimizer_chunks:
-
-            # Inner iteration number
-            var_names.append('inner_iteration')
-            var_search_criteria.append(f'{minimizer_algorithm} Starting Iteration')
-            var_split.append('Iteration')
-            var_position.append(1)
-            var_dtype.append('int32')
-
-            # Gradient reduction
-            var_names.append('gradient_reduction')
-            var_search_criteria.append('Gradient reduction (')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
-            # Residual norm
-            var_names.append('residual_norm')
-            var_search_criteria.append('Residual norm (')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
-            # Norm reduction
-            var_names.append('norm_reduction')
-            var_search_criteria.append('Norm reduction (')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
-        if j_chunks:
-
-            # Inner iteration number
-            var_names.append('j')
-            var_search_criteria.append('Quadratic cost function: J ')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
-            # Gradient reduction
-            var_names.append('jb')
-            var_search_criteria.append('Quadratic cost function: Jb')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
-            # Norm reduction
-            var_names.append('jojc')
-            var_search_criteria.append('Quadratic cost function: JoJc')
-            var_split.append('=')
-            var_position.append(1)
-            var_dtype.append('float32')
-
         # Create a dataset to hold the convergence data
         convergence_ds = xr.Dataset()
 
         # Add array for all iterations
         gn = f'convergence::total_iteration'
-        convergence_ds[gn] = xr.DataArray(np.zeros(total_iter, dtype='int32'))
-        convergence_ds[gn].data[:] = range(1, total_iter+1)
-
-        # Concatenate chunks to simplify search algorithm
-        min_and_j_chunks = minimizer_chunks + j_chunks
-
-        ds_vars = []
-        for var_ind, var in enumerate(var_names):
-            var_array = []
-            for min_and_j_chunk in min_and_j_chunks:
-                min_and_j_chunk_split = min_and_j_chunk.split('\n')
-                var_found = self.get_from_log(var_search_criteria[var_ind], var_split[var_ind],
-                                              var_position[var_ind], min_and_j_chunk_split)
-                if var_found:
-                    var_array.append(var_found)
+        convergence_ds[gn] = xr.DataArray(np.arange(1, total_iter+1, dtype='int32'))
+
+        ds_vars = {}
+        for var, dtype, var_array in var_values:
 
             # Add to the dataset if there is something to add
             if var_array:
-                gn = f'convergence::{var_names[var_ind]}'  # group::variable name
-                convergence_ds[gn] = xr.DataArray(np.zeros(total_iter, dtype=var_dtype[var_ind]))
 
                 # If var is greater than total_iter, clip var array
                 if len(var_array) > total_iter:
                     var_array = var_array[0:total_iter]
-                convergence_ds[gn].data[:] = var_array
-                ds_vars.append(var)
+                if len(var_array) < total_iter:
+                    self.logger.abort(f'Found {len(var_array)} values of {var} in the log ' +
+                                      f'but {total_iter} iterations.')
+
+                gn = f'convergence::{var}'  # group::variable name
+                convergence_ds[gn] = xr.DataArray(np.array(var_array, dtype=dtype))
+                ds_vars[var] = dtype
 
         # Create special case variables
 
         # Outer iteration
         # ---------------
-        outer_iteration = 0
-        outer_iterations = []
         if 'convergence::inner_iteration' in convergence_ds:
             inner_iterations = convergence_ds['convergence::inner_iteration'].data[:]
 
-            # Set outer iteration number
-            for inner_iteration in inner_iterations:
-                if inner_iteration == 1:
-                    outer_iteration = outer_iteration + 1
-
-                # Append vector of outer iterations
-                outer_iterations.append(outer_iteration)
+            # The outer iteration number increases each time the inner iteration restarts
+            outer_iterations = np.cumsum(inner_iterations == 1, dtype='int32')
 
             gn = f'convergence::outer_iteration'
-            convergence_ds[gn] = xr.DataArray(np.zeros(total_iter, dtype='int32'))
-            convergence_ds[gn].data[:] = outer_iterations
+            convergence_ds[gn] = xr.DataArray(outer_iterations)
 
         # Normalized versions of data
         # ---------------------------
@@ -330,20 +495,17 @@ class JediLog(EvaDatasetBase):
                                'norm_reduction', 'j', 'jb', 'jojc']
 
         for normalize_var_name in normalize_var_names:
-            if (normalize_var_name in var_names) and (normalize_var_name in ds_vars):
-
-                # Index in lists for the variable being normalized
-                var_ind = var_names.index(normalize_var_name)
+            if normalize_var_name in ds_vars:
 
                 # Extract existing data
-                gn = f'convergence::{var_names[var_ind]}'
+                gn = f'convergence::{normalize_var_name}'
                 var_array = convergence_ds[gn].data[:]
 
                 # Normalize and add back to the data
-                gn_nz = f'convergence::{var_names[var_ind]}_normalized'
+                gn_nz = f'convergence::{normalize_var_name}_normalized'
                 var_array_nz = var_array / np.max(var_array)
-                convergence_ds[gn_nz] = xr.DataArray(np.zeros(total_iter, dtype=var_dtype[var_ind]))
-                convergence_ds[gn_nz].data[:] = var_array_nz
+                dtype = ds_vars[normalize_var_name]
+                convergence_ds[gn_nz] = xr.DataArray(var_array_nz.astype(dtype))
 
         return convergence_ds
 
@@ -0,0 +1,173 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import glob
+import os
+import numpy as np
+import xarray as xr
+
+from eva.data.jedi_log import JediLog, JediLogParser
+from eva.utilities.config import get
+from eva.utilities.parallel import get_number_of_workers, parallel_map
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parse_jedi_log(jedi_log_to_parse):
+
+    """
+    Parse a Jedi log in a single pass. Defined at module level so that it can run in a worker
+    process.
+
+    Args:
+        jedi_log_to_parse (str): Path to the Jedi log.
+
+    Returns:
+        JediLogParser: Parser holding the convergence values of the log.
+    """
+
+    parser = JediLogParser()
+    with open(jedi_log_to_parse) as jedi_log_to_parse_open:
+        parser.parse_file(jedi_log_to_parse_open)
+    return parser
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class JediLogSet(JediLog):
+
+    """
+    A class for handling a set of Jedi logs, for example from several experiments or cycles, that
+    are compared in a single collection.
+    """
+
+    def execute(self, dataset_config, data_collections, timing):
+
+        """
+        Parses a set of Jedi logs and stacks their convergence data along a new dimension.
+
+        Args:
+            dataset_config (dict): Configuration dictionary for the dataset.
+            data_collections (DataCollections): Object for managing data collections.
+            timing (Timing): Timing object for tracking execution time.
+        """
+
+        # Get the logs to parse, either a list of files or a glob pattern
+        jedi_logs_to_parse = get(dataset_config, self.logger, 'jedi_logs_to_parse')
+        if isinstance(jedi_logs_to_parse, str):
+            jedi_logs_to_parse = sorted(glob.glob(jedi_logs_to_parse))
+
+        if not jedi_logs_to_parse:
+            self.logger.abort('JediLogSet: no logs found to parse.')
+
+        # Collection name to use
+        collection_name = get(dataset_config, self.logger, 'collection_name')
+
+        # Dimension along which the logs are stacked and the label of each log
+        set_dimension = get(dataset_config, self.logger, 'set_dimension', 'Experiment')
+        labels = get(dataset_config, self.logger, 'labels',
+                     [os.path.basename(log) for log in jedi_logs_to_parse])
+
+        self.logger.assert_abort(len(labels) == len(jedi_logs_to_parse), 'JediLogSet: the ' +
+                                 f'number of labels ({len(labels)}) does not match the number ' +
+                                 f'of logs ({len(jedi_logs_to_parse)}).')
+
+        # Parse the logs in worker processes, the parsing is pure Python
+        number_of_workers = get_number_of_workers(dataset_config, self.logger,
+                                                  len(jedi_logs_to_parse))
+        timing.start('JediLogSet: parse logs')
+        parsers = parallel_map(parse_jedi_log, [(log,) for log in jedi_logs_to_parse],
+                               number_of_workers, use_processes=True)
+        timing.stop('JediLogSet: parse logs')
+
+        # Get list of things to parse from the dictionary
+        data_to_parse = get(dataset_config, self.logger, 'data_to_parse')
+
+        # Loop and add to dataset
+        for metric in data_to_parse:
+            if metric == 'convergence' and data_to_parse[metric]:
+
+                convergence_datasets = []
+                for log, parser in zip(jedi_logs_to_parse, parsers):
+                    self.logger.info(f'JediLogSet: building convergence data of {log}')
+                    self.parser = parser
+                    convergence_datasets.append(self.parse_convergence())
+
+                convergence_ds = self.stack_datasets(convergence_datasets, set_dimension, labels)
+
+                # Add to the Eva dataset
+                data_collections.create_or_add_to_collection(collection_name, convergence_ds)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def stack_datasets(self, datasets, set_dimension, labels):
+
+        """
+        Stack one dimensional convergence datasets along a new dimension.
+
+        Variables are padded with NaN where a log has fewer iterations than the longest log, or
+        does not have the variable at all. Padded variables are converted to floating point.
+
+        Args:
+            datasets (list): List of convergence datasets, one per log.
+            set_dimension (str): Name of the new dimension, e.g. Experiment or Cycle.
+            labels (list): Label of each log, used as the coordinate of the new dimension.
+
+        Returns:
+            xr.Dataset: Dataset with (set_dimension, Iteration) variables.
+        """
+
+        # Longest log and all the variables found in any of the logs
+        max_iter = max(ds.sizes['dim_0'] for ds in datasets)
+        variables = list(dict.fromkeys(var for ds in datasets for var in ds.data_vars))
+
+        data_vars = {}
+        for var in variables:
+            arrays = [ds[var].data if var in ds else None for ds in datasets]
+
+            if all(array is not None and array.size == max_iter for array in arrays):
+                stacked = np.stack(arrays)
+            else:
+                stacked = np.full((len(datasets), max_iter), np.nan)
+                for ind, array in enumerate(arrays):
+                    if array is not None:
+                        stacked[ind, :array.size] = array
+
+            data_vars[var] = ((set_dimension, 'Iteration'), stacked)
+
+        coords = {set_dimension: labels, 'Iteration': np.arange(1, max_iter+1, dtype='int32')}
+
+        return xr.Dataset(data_vars, coords=coords)
+
+    # ----------------------------------------------------------------------------------------------
+
+    def generate_default_config(self, filenames, collection_name):
+
+        """
+        Generates a default configuration for Jedi log set data ingest.
+
+        Args:
+            filenames (list): List of file names.
+            collection_name (str): Name of the data collection.
+
+        Returns:
+            dict: Default configuration dictionary.
+        """
+
+        eva_dict = {'jedi_logs_to_parse': filenames,
+                    'collection_name': collection_name,
+                    'data_to_parse': {'convergence': 'true'}}
+        return eva_dict
+
+    # ----------------------------------------------------------------------------------------------
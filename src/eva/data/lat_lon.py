@@ -1,6 +1,7 @@
 from eva.data.eva_dataset_base import EvaDatasetBase
 from eva.utilities.config import get
-import xarray as xr
+from eva.utilities.dataset_files import get_dataset_files, read_netcdf_files
+from eva.utilities.parallel import get_number_of_workers
 
 
 valid_groups = ['state', 'increment']
@@ -23,8 +24,11 @@ class LatLon(EvaDatasetBase):
             timing (Timing): Timing object for tracking execution time.
         """
 
-        # Filename to be read into this collection
-        filename = get(dataset_config, self.logger, 'filename')
+        # Files to be read into this collection: a file, a list of files, glob patterns or date
+        # templates
+        filenames, dates = get_dataset_files(dataset_config, self.logger, 'filename')
+        # Dimension along which several files are stacked
+        concat_dimension = get(dataset_config, self.logger, 'concat_dimension', 'Time')
         # get list of variables
         variables = get(dataset_config, self.logger, 'variables')
         # Set the collection name
@@ -37,12 +41,9 @@ class LatLon(EvaDatasetBase):
                               f' group \'{group}\' is not a valid group type for LatLon.' +
                               f' The valid types are {valid_groups}')
 
-        # open the input netCDF file
-        ds = xr.open_dataset(filename)
-
-        # Drop data variables not in user requested variables
-        vars_to_remove = list(set(list(ds.keys())) - set(variables))
-        ds = ds.drop_vars(vars_to_remove)
+        # Read the user requested variables of the files concurrently and concatenate them
+        number_of_workers = get_number_of_workers(dataset_config, self.logger, len(filenames))
+        ds = read_netcdf_files(filenames, variables, number_of_workers, concat_dimension, dates)
 
         # rename variables in dataset_config
         rename_dict = {}
@@ -53,8 +54,7 @@ class LatLon(EvaDatasetBase):
         # Assert that the collection contains at least one variable
         if not ds.keys():
             self.logger.abort('Collection \'' + dataset_config['name'] + '\', group \'' +
-                              group + '\' in file ' + filename +
-                              ' does not have any variables.')
+                              group + f'\' in files {filenames} does not have any variables.')
 
         # add the dataset_config to the collections
         data_collections.create_or_add_to_collection(collection_name, ds)
@@ -9,17 +9,48 @@
 
 # --------------------------------------------------------------------------------------------------
 
+import copy
+import hashlib
 import os
+import pickle
 import numpy as np
-import array
 
 from xarray import Dataset, concat, merge, align
-from scipy.io import FortranFile
 from datetime import datetime
+from typing import NamedTuple, Optional
 
 from eva.data.eva_dataset_base import EvaDatasetBase
 from eva.utilities.config import get
-from eva.utilities.utils import parse_channel_list, is_number
+from eva.utilities.parallel import get_number_of_workers, parallel_map
+from eva.utilities.utils import get_cache_directory, parse_channel_list, is_number
+
+# --------------------------------------------------------------------------------------------------
+
+# Version of the cached control file contents, increment when ControlFile changes
+control_file_cache_version = 1
+
+# Control files already parsed by this process, keyed by path, mtime and size
+control_file_memo = {}
+
+# --------------------------------------------------------------------------------------------------
+
+
+class ControlFile(NamedTuple):
+
+    """
+    Parsed contents of a GrADS control file.
+    """
+
+    is_stn: bool
+    coords: dict
+    dims: dict
+    attribs: dict
+    vars: list
+    scanpo: Optional[list]
+    levs_dict: Optional[dict]
+    chans_dict: Optional[dict]
+    datatype_dict: Optional[dict]
+
 
 # --------------------------------------------------------------------------------------------------
 
@@ -68,16 +99,17 @@ class MonDataSpace(EvaDatasetBase):
                              ' to plot')
             exit(1)
 
-        dims_arr = []
-        if self.is_stn_data(control_file[0]):
-            coords, dims, attribs, vars, scanpo, levs_dict, chans_dict, datatype_dict = (
-                                                        self.get_stn_ctl_dict(control_file[0]))
+        cache_dir = get_cache_directory(dataset_config, 'control_files')
+        ctl = self.read_control_file(control_file[0], cache_dir)
+        coords, dims, attribs, vars = ctl.coords, ctl.dims, ctl.attribs, ctl.vars
+        scanpo, levs_dict, chans_dict = ctl.scanpo, ctl.levs_dict, ctl.chans_dict
+        datatype_dict = ctl.datatype_dict
+
+        if ctl.is_stn:
             ndims_used = 2
             dims_arr = ['xdef', 'ydef', 'zdef']
             stn_data = True
         else:
-            coords, dims, attribs, vars, scanpo, levs_dict, chans_dict, datatype_dict = (
-                                                          self.get_ctl_dict(control_file[0]))
             ndims_used, dims_arr = self.get_ndims_used(dims)
 
         # Get the groups to be read
@@ -110,59 +142,18 @@ class MonDataSpace(EvaDatasetBase):
         # ---------------------------
         threshold = float(get(dataset_config, self.logger, 'missing_value_threshold', 1.0e30))
 
-        ds_list = []
-        for filename in filenames:
-
-            lat = []
-            lon = []
-            if stn_data:
-
-                # Read station data file.  Note that the variable dimensions
-                # will NOT be the same for different station data files.
-                # y_range is set here because it's the number of obs which is not in the control
-                # file and is only known once the ieee file is read.
-                darr, cycle_tm, dims, lat, lon = self.read_stn_ieee(filename, coords, dims,
-                                                                    ndims_used, dims_arr, vars)
-                y_range = np.arange(1, dims['ydef']+1)
+        # Read the cycle files concurrently
+        # ---------------------------------
+        number_of_workers = get_number_of_workers(dataset_config, self.logger, len(filenames))
 
-            else:
-                # read data file
-                darr, cycle_tm = self.read_ieee(filename, coords, dims, ndims_used,
-                                                dims_arr, vars, gsistat=attribs['gsistat'])
-
-            # add cycle as a variable to data array
-            cyc_darr = self.var_to_np_array(dims, ndims_used, dims_arr, cycle_tm)
-
-            # create dataset from file contents
-            timestep_ds = None
-            timestep_ds = self.load_dset(vars, coords, darr, dims, ndims_used,
-                                         dims_arr, x_range, y_range, z_range, cyc_darr)
-
-            if attribs['sat']:
-                timestep_ds.attrs['satellite'] = attribs['sat']
-            if attribs['sensor']:
-                timestep_ds.attrs['sensor'] = attribs['sensor']
-
-            # Add lat and lon variables.  This is done separately because they are
-            # only single dimension arrays unlike the obs which are 2d (level, nobs).
-            if stn_data and len(lat):
-                timestep_ds['lat'] = (['Nobs'], (lat))
-            if stn_data and len(lon):
-                timestep_ds['lon'] = (['Nobs'], (lon))
-
-            # add cycle_tm dim for concat
-            timestep_ds['Time'] = cycle_tm.strftime("%Y%m%d%H")
-
-            # Add this dataset to the list of ds_list
-            ds_list.append(timestep_ds)
-
-        # Align all datasets.  This syncs the dimensions and variables
-        # of all datasets in ds_list using NaN for all missing data.
+        timing.start('MonDataSpace: read cycles')
         if stn_data:
-            ds_list = align(*ds_list, join='outer', exclude=[])
-
-        # Concatenate datasets from ds_list into a single dataset
-        ds = concat(ds_list, dim='Time')
+            ds = self.load_stn_cycles(filenames, coords, dims, ndims_used, dims_arr, vars,
+                                      attribs, x_range, z_range, number_of_workers)
+        else:
+            ds = self.load_cycles(filenames, coords, dims, ndims_used, dims_arr, vars,
+                                  attribs, x_range, y_range, z_range, number_of_workers)
+        timing.stop('MonDataSpace: read cycles')
 
         # Group name and variables
         # ------------------------
@@ -193,7 +184,7 @@ class MonDataSpace(EvaDatasetBase):
             # Assert that the collection contains at least one variable
             if not ds.keys():
                 self.logger.abort('Collection \'' + dataset_config['name'] + '\', group \'' +
-                                  group_name + '\' in file ' + filename +
+                                  group_name + '\' in files ' + str(filenames) +
                                   ' does not have any variables.')
 
         # Add the dataset to the collections
@@ -204,6 +195,136 @@ class MonDataSpace(EvaDatasetBase):
 
     # ----------------------------------------------------------------------------------------------
 
+    def load_cycles(self, filenames, coords, dims, ndims_used, dims_arr, vars, attribs,
+                    x_range, y_range, z_range, number_of_workers=1):
+
+        """
+        Read gridded cycle files into a single (Time, var, ...) block and build the dataset.
+
+        Args:
+            filenames (list): List of IEEE files, one per cycle.
+            coords (dict): Dictionary of coordinates.
+            dims (dict): Dictionary of dimension sizes.
+            ndims_used (int): Number of dimensions used.
+            dims_arr (list): List of dimension names used.
+            vars (list): List of variable names.
+            attribs (dict): Dictionary containing sensor and satellite attributes.
+            x_range (numpy.ndarray or None): Valid x coordinate range.
+            y_range (numpy.ndarray or None): Valid y coordinate range.
+            z_range (numpy.ndarray or None): Valid z coordinate range.
+            number_of_workers (int, optional): Number of files read concurrently. Default is 1.
+
+        Returns:
+            xarray.Dataset: Dataset with a Time dimension holding all the cycles.
+        """
+
+        # Preallocate the block and let each file fill its own slice
+        shape = [dims[dims_arr[x]] for x in range(ndims_used)]
+        block = np.zeros([len(filenames), len(vars)] + shape, dtype=float)
+
+        results = parallel_map(self.read_ieee,
+                               [(filename, coords, dims, ndims_used, dims_arr, vars, None,
+                                 attribs['gsistat'], block[x])
+                                for x, filename in enumerate(filenames)], number_of_workers)
+        cycle_tms = [cycle_tm for _, cycle_tm in results]
+
+        # Construct the dataset once from views of the block
+        var_dims = ['Time'] + [coords[dims_arr[x]] for x in range(ndims_used)]
+        data_vars = {}
+        for x, var in enumerate(vars):
+            data_vars[var] = (var_dims, block[:, x])
+
+            # MinMon plots require both the 'allgnorm' data and log('allgnorm').
+            if ndims_used == 1 and var == 'allgnorm':
+                data_vars['log_gnorm'] = (var_dims, np.log(block[:, x]))
+
+        # Tack on 'cycle' as a variable
+        cycles = np.array(cycle_tms, dtype='datetime64[us]').reshape([-1] + [1] * ndims_used)
+        data_vars['cycle'] = (var_dims, np.broadcast_to(cycles, [len(filenames)] + shape).copy())
+
+        ranges = [x_range, y_range, z_range]
+        new_coords = {coords[dims_arr[x]]: ranges[x] for x in range(ndims_used)}
+        new_coords['Time'] = [cycle_tm.strftime("%Y%m%d%H") for cycle_tm in cycle_tms]
+
+        ds = Dataset(data_vars, coords=new_coords)
+
+        if attribs['sat']:
+            ds.attrs['satellite'] = attribs['sat']
+        if attribs['sensor']:
+            ds.attrs['sensor'] = attribs['sensor']
+
+        return ds
+
+    # ----------------------------------------------------------------------------------------------
+
+    def load_stn_cycles(self, filenames, coords, dims, ndims_used, dims_arr, vars, attribs,
+                        x_range, z_range, number_of_workers=1):
+
+        """
+        Read station cycle files and combine them along a Time dimension.
+
+        Args:
+            filenames (list): List of IEEE station files, one per cycle.
+            coords (dict): Dictionary of coordinates.
+            dims (dict): Dictionary of dimension sizes.
+            ndims_used (int): Number of dimensions used.
+            dims_arr (list): List of dimension names used.
+            vars (list): List of variable names.
+            attribs (dict): Dictionary containing sensor and satellite attributes.
+            x_range (numpy.ndarray or None): Valid x coordinate range.
+            z_range (numpy.ndarray or None): Valid z coordinate range.
+            number_of_workers (int, optional): Number of files read concurrently. Default is 1.
+
+        Returns:
+            xarray.Dataset: Dataset with a Time dimension holding all the cycles.
+        """
+
+        # Read station data files.  Note that the variable dimensions will NOT be the same
+        # for different station data files, so each file gets its own copy of dims.
+        results = parallel_map(self.read_stn_ieee,
+                               [(filename, coords, dict(dims), ndims_used, dims_arr, vars)
+                                for filename in filenames], number_of_workers)
+
+        ds_list = []
+        for darr, cycle_tm, file_dims, lat, lon in results:
+
+            # y_range is the number of obs which is not in the control file and is only
+            # known once the ieee file is read.
+            y_range = np.arange(1, file_dims['ydef']+1)
+
+            # add cycle as a variable to data array
+            cyc_darr = self.var_to_np_array(file_dims, ndims_used, dims_arr, cycle_tm)
+
+            # create dataset from file contents
+            timestep_ds = self.load_dset(vars, coords, darr, file_dims, ndims_used,
+                                         dims_arr, x_range, y_range, z_range, cyc_darr)
+
+            if attribs['sat']:
+                timestep_ds.attrs['satellite'] = attribs['sat']
+            if attribs['sensor']:
+                timestep_ds.attrs['sensor'] = attribs['sensor']
+
+            # Add lat and lon variables.  This is done separately because they are
+            # only single dimension arrays unlike the obs which are 2d (level, nobs).
+            if len(lat):
+                timestep_ds['lat'] = (['Nobs'], (lat))
+            if len(lon):
+                timestep_ds['lon'] = (['Nobs'], (lon))
+
+            # add cycle_tm dim for concat
+            timestep_ds['Time'] = cycle_tm.strftime("%Y%m%d%H")
+
+            ds_list.append(timestep_ds)
+
+        # Align all datasets.  This syncs the dimensions and variables
+        # of all datasets in ds_list using NaN for all missing data.
+        ds_list = align(*ds_list, join='outer', exclude=[])
+
+        # Concatenate datasets from ds_list into a single dataset
+        return concat(ds_list, dim='Time')
+
+    # ----------------------------------------------------------------------------------------------
+
     def generate_default_config(self, filenames, collection_name, control_file):
 
         """
@@ -317,6 +438,66 @@ class MonDataSpace(EvaDatasetBase):
 
     # ----------------------------------------------------------------------------------------------
 
+    def read_control_file(self, control_file, cache_dir=None):
+
+        """
+        Parse a control file, reusing an earlier parse of the same file when possible.
+
+        Parsed control files are memoized for the life of the process and, if cache_dir is
+        set, pickled to disk. Both are keyed by the path, modification time and size of the
+        control file so an edited file is parsed again.
+
+        Args:
+            control_file (str): Path to the control file.
+            cache_dir (str, optional): Directory of the on-disk cache. Defaults to None, which
+                                       disables the on-disk cache.
+
+        Returns:
+            ControlFile: Parsed control file. This is a copy the caller is free to modify.
+        """
+
+        stat = os.stat(control_file)
+        key = (os.path.abspath(control_file), stat.st_mtime_ns, stat.st_size,
+               control_file_cache_version)
+
+        ctl = control_file_memo.get(key)
+
+        # Look in the on-disk cache
+        cache_file = None
+        if ctl is None and cache_dir:
+            cache_name = hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl'
+            cache_file = os.path.join(cache_dir, cache_name)
+            try:
+                with open(cache_file, 'rb') as fh:
+                    ctl = pickle.load(fh)
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+                ctl = None
+            if not isinstance(ctl, ControlFile):
+                ctl = None
+
+        # Parse the control file
+        if ctl is None:
+            if self.is_stn_data(control_file):
+                ctl = ControlFile(True, *self.get_stn_ctl_dict(control_file))
+            else:
+                ctl = ControlFile(False, *self.get_ctl_dict(control_file))
+
+            if cache_file is not None:
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+                    with open(tmp_file, 'wb') as fh:
+                        pickle.dump(ctl, fh)
+                    os.replace(tmp_file, cache_file)
+                except OSError:
+                    self.logger.info(f'Warning: unable to write control file cache {cache_file}')
+
+        control_file_memo[key] = ctl
+
+        return copy.deepcopy(ctl)
+
+    # ----------------------------------------------------------------------------------------------
+
     def get_ctl_dict(self, control_file):
 
         """
@@ -629,7 +810,7 @@ class MonDataSpace(EvaDatasetBase):
     # ----------------------------------------------------------------------------------------------
 
     def read_ieee(self, file_name, coords, dims, ndims_used, dims_arr, vars,
-                  file_path=None, gsistat=False):
+                  file_path=None, gsistat=False, rtn_array=None):
 
         """
         Read data from an IEEE file and arrange it into a numpy array.
@@ -642,6 +823,9 @@ class MonDataSpace(EvaDatasetBase):
             dims_arr (list): List of dimension names used.
             vars (list): List of variable names.
             file_path (str, optional): Path to the directory containing the file. Defaults to None.
+            gsistat (bool, optional): File is a raw gsistat file. Defaults to False.
+            rtn_array (numpy.ndarray, optional): Preallocated (nvars, ...) array to fill. Defaults
+                                                 to None, in which case a new array is created.
 
         Returns:
             numpy.ndarray: Numpy array containing the read data.
@@ -659,78 +843,84 @@ class MonDataSpace(EvaDatasetBase):
 
         filename = os.path.join(file_path, file_name) if file_path else file_name
 
-        load_data = True
-        if os.path.isfile(filename):
-            f = FortranFile(filename, 'r', '>u4')
-        else:
+        # Preallocate the (nvars, ...) return array, missing files are returned as zeros
+        if rtn_array is None:
+            rtn_array = np.zeros([len(vars)] + [dims[dims_arr[x]] for x in range(ndims_used)],
+                                 dtype=float)
+
+        if not os.path.isfile(filename):
             self.logger.info(f"WARNING:  file {filename} is missing")
-            load_data = False
+            return rtn_array, cycle_tm
+
+        # gsistat files are raw (not Fortran sequential) native floats
+        if ndims_used == 1 and gsistat:
+            rtn_array[:] = np.fromfile(filename, dtype=np.float32)
+            return rtn_array, cycle_tm
+
+        # Every record in the file holds one 2D (or 1D) field of the same size. 3D variables
+        # are written as one record per zdef, except satang which is a single record.
+        nx = dims[dims_arr[0]]
+        ny = dims[dims_arr[1]] if ndims_used > 1 else 1
+        nz = dims[dims_arr[2]] if ndims_used > 2 else 1
+        record_counts = [1 if ndims_used < 3 or var == 'satang' else nz for var in vars]
+        first_records = np.cumsum([0] + record_counts[:-1])
+
+        # Map the records, each is a 4 byte marker, the big-endian floats and a 4 byte marker
+        records = self.map_fortran_records(filename, sum(record_counts), nx * ny)
 
         if ndims_used == 1:		# MinMon, regional RadMon time,bcoef,bcor
-            rtn_array = np.empty((0, dims[dims_arr[0]]), dtype=float)
-            if not load_data:
-                zarray = np.zeros((dims[dims_arr[0]]), float)
-            dimensions = [dims[dims_arr[0]]]
-
-        if ndims_used == 2:		# RadMon time, bcoef, bcor, OznMon time
-            rtn_array = np.empty((0, dims[dims_arr[0]], dims[dims_arr[1]]), float)
-            if not load_data:
-                zarray = np.zeros((dims[dims_arr[0]], dims[dims_arr[1]]), float)
-            dimensions = [dims[dims_arr[1]], dims[dims_arr[0]]]
-
-        if ndims_used == 3:		# RadMon angle, ConMon time/vert
-            rtn_array = np.empty((0, dims[dims_arr[0]], dims[dims_arr[1]],
-                                  dims[dims_arr[2]]), float)
-            zarray = np.zeros((dims[dims_arr[0]], dims[dims_arr[1]],
-                               dims[dims_arr[2]]), float)
-
-            dimensions = [dims[dims_arr[0]], dims[dims_arr[1]]]
-
-            for x in range(len(vars)):
-
-                if load_data:
-                    # satang variable is not used and a non-standard size
-                    if vars[x] == 'satang':
-                        skip = f.read_reals(dtype=np.dtype('>f4')).reshape(dims['xdef'],
-                                                                           dims['ydef'])
-                        tarr = zarray
-                    else:
-                        mylist = []
-                        for z in range(dims['zdef']):
-                            arr = f.read_reals(dtype=np.dtype('>f4')).reshape(dims['ydef'],
-                                                                              dims['xdef'])
-                            mylist.append(np.transpose(arr))
-                        tarr = np.dstack(mylist)
-
-                else:
-                    tarr = zarray
-
-                rtn_array = np.append(rtn_array, [tarr], axis=0)
-
-        else:		# ndims_used == 1|2
-            for x in range(len(vars)):
-                if load_data:
-                    if ndims_used == 1:
-                        if gsistat:
-                            with open(filename, 'rb') as infile:
-                                binary_data = infile.read()
-                            arr = array.array('f')
-                            arr.frombytes(binary_data)
-                        else:
-                            arr = f.read_reals(dtype=np.dtype('>f4'))
+            rtn_array[:] = records
 
-                    else:
-                        arr = np.transpose(f.read_reals(dtype=np.dtype('>f4')).reshape(dimensions))
-                else:
-                    arr = zarray
+        elif ndims_used == 2:		# RadMon time, bcoef, bcor, OznMon time
+            rtn_array[:] = records.reshape(len(vars), ny, nx).transpose(0, 2, 1)
+
+        else:		# RadMon angle, ConMon time/vert
+            for x, var in enumerate(vars):
+                # satang variable is not used and is left as zeros
+                if var != 'satang':
+                    var_records = records[first_records[x]:first_records[x] + nz]
+                    rtn_array[x] = var_records.reshape(nz, ny, nx).transpose(2, 1, 0)
 
-                rtn_array = np.append(rtn_array, [arr], axis=0)
-        if load_data:
-            f.close()
+        del records
         return rtn_array, cycle_tm
 
     # ----------------------------------------------------------------------------------------------
 
+    def map_fortran_records(self, filename, number_of_records, record_length):
+
+        """
+        Memory-map the leading records of a big-endian Fortran sequential file of equal size
+        float32 records.
+
+        Args:
+            filename (str): Path to the IEEE file.
+            number_of_records (int): Number of records to map.
+            record_length (int): Number of float32 values in each record.
+
+        Returns:
+            numpy.ndarray: Read-only (number_of_records, record_length) view of the record data.
+        """
+
+        # Each record is framed by two 4 byte markers holding the record size in bytes
+        record_bytes = 4 * (record_length + 2)
+        file_bytes = os.path.getsize(filename)
+        if file_bytes < number_of_records * record_bytes:
+            self.logger.abort(f'File {filename} has {file_bytes} bytes but the control file ' +
+                              f'describes {number_of_records} records of {record_length} values.')
+
+        file_map = np.memmap(filename, dtype='>f4', mode='r',
+                             shape=(number_of_records, record_length + 2))
+
+        # Check the markers against the record size described by the control file
+        markers = file_map[:, [0, -1]].view('>u4')
+        if not np.all(markers == 4 * record_length):
+            self.logger.abort(f'Record markers in {filename} do not match the record size of ' +
+                              f'{record_length} values described by the control file.')
+
+        return file_map[:, 1:-1]
+
+    # ----------------------------------------------------------------------------------------------
+
     def read_stn_ieee(self, file_name, coords, dims, ndims_used, dims_arr,
                       vars, file_path=None):
 
@@ -767,46 +957,52 @@ class MonDataSpace(EvaDatasetBase):
 
         filename = os.path.join(file_path, file_name) if file_path else file_name
 
-        load_data = True
-        if os.path.isfile(filename):
-            f = FortranFile(filename, 'r', '>u4')
-        else:
+        if not os.path.isfile(filename):
             self.logger.info(f"WARNING:  file {filename} is missing")
-            load_data = False
-
-        mylist = []
-        lat = []
-        lon = []
-        numobs = 0
-
-        if load_data:
-            nlev = 1
-            while (nlev):
-
-                # Header components are stn id, lat, lon, time, nlev, flag.
-                # Data follows header if nlev > 0, else it's EOF.
-                record = f.read_record('>i8', '>f4', '>f4', '>f4', '>i4', '>i4')
-                nlev = record[4]
-                if nlev:
-                    lat.append(record[1])
-                    lon.append(record[2])
-                    data = f.read_record('>f4').reshape([len(vars), dims[dims_arr[0]]])
-                    numobs += 1
-                    mylist.append(data)
-
-            # dimensions are nvar, nlev, numobs
-            rtn_array = np.dstack(mylist)
-            dims['ydef'] = numobs
-            f.close()
-
-        else:
             rtn_array = np.zeros((len(vars), dims[dims_arr[0]], 1), float)
-            lat.append(0)
-            lon.append(0)
             dims['ydef'] = 1
-
-        rtn_lat = np.asarray(lat).reshape(-1)
-        rtn_lon = np.asarray(lon).reshape(-1)
+            return rtn_array, cycle_tm, dims, np.zeros(1), np.zeros(1)
+
+        # Each obs is a header record (stn id, lat, lon, time, nlev, flag) followed by a data
+        # record of nvar x nlev values. A header with nlev == 0 marks the end of the data.
+        nvalues = len(vars) * dims[dims_arr[0]]
+        header = [('id', '>i8'), ('lat', '>f4'), ('lon', '>f4'), ('time', '>f4'),
+                  ('nlev', '>i4'), ('flag', '>i4')]
+        obs_dtype = np.dtype([('header_start', '>u4')] + header + [('header_end', '>u4'),
+                             ('data_start', '>u4'), ('data', '>f4', (nvalues,)),
+                             ('data_end', '>u4')])
+        header_bytes = np.dtype(header).itemsize
+
+        # Read the whole file once and view the complete obs as structured records
+        buffer = np.fromfile(filename, dtype=np.uint8)
+        obs = buffer[:buffer.size - buffer.size % obs_dtype.itemsize].view(obs_dtype)
+
+        # Locate the end of data header, it may be in a trailing partial record
+        end_of_data = np.flatnonzero(obs['nlev'] == 0)
+        numobs = end_of_data[0] if end_of_data.size else obs.size
+        obs = obs[:numobs]
+
+        if not end_of_data.size:
+            last = buffer[numobs * obs_dtype.itemsize:][:header_bytes + 8]
+            if last.size < header_bytes + 8 or last[4:-4].view(header)['nlev'][0] != 0:
+                self.logger.abort(f'Station file {filename} does not end with an end of ' +
+                                  'data header record.')
+
+        # Check the markers against the record sizes described by the control file
+        if not (np.all(obs['header_start'] == header_bytes) and
+                np.all(obs['header_end'] == header_bytes) and
+                np.all(obs['data_start'] == 4 * nvalues) and
+                np.all(obs['data_end'] == 4 * nvalues)):
+            self.logger.abort(f'Record markers in {filename} do not match the {len(vars)} ' +
+                              f'variables and {dims[dims_arr[0]]} levels of the control file.')
+
+        # dimensions are nvar, nlev, numobs
+        rtn_array = obs['data'].reshape(numobs, len(vars), dims[dims_arr[0]]).transpose(1, 2, 0)
+        rtn_array = np.ascontiguousarray(rtn_array, dtype=np.float32)
+        dims['ydef'] = numobs
+
+        rtn_lat = obs['lat'].astype(np.float32)
+        rtn_lon = obs['lon'].astype(np.float32)
 
         return rtn_array, cycle_tm, dims, rtn_lat, rtn_lon
 
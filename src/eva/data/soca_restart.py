@@ -13,6 +13,7 @@ import xarray as xr
 from netCDF4 import Dataset
 from eva.utilities.config import get
 from eva.data.eva_dataset_base import EvaDatasetBase
+from eva.utilities.utils import get_level_indices, parse_channel_list
 
 # --------------------------------------------------------------------------------------------------
 
@@ -75,6 +76,12 @@ class SocaRestart(EvaDatasetBase):
         soca_vars = get(dataset_config, self.logger, 'variables', default=[])
         coord_vars = get(dataset_config, self.logger, 'coordinate variables', default=None)
 
+        # Get the model levels of the 3D variables to be read, numbered from 1
+        # -------------------------
+        levels = get(dataset_config, self.logger, 'levels', None, False)
+        if levels is not None:
+            levels = sorted(set(parse_channel_list(levels, self.logger)))
+
         # Read orographic fields first
         # -------------------------
         var_dict = {}
@@ -87,13 +94,18 @@ class SocaRestart(EvaDatasetBase):
         # -------------------------
         group_name = 'SOCAVars'
         for var in soca_vars:
-            dims, data = read_soca(soca_filenames, var, self.logger)
+            dims, data = read_soca(soca_filenames, var, self.logger, levels)
             var_dict[group_name + '::' + var] = (dims, data)
 
         # Create dataset_config from data dictionary
         # -------------------------
         ds = xr.Dataset(var_dict)
 
+        # Keep the model level numbers as a coordinate when a subset of levels is read
+        # -------------------------
+        if levels is not None and 'lev' in ds.dims:
+            ds = ds.assign_coords(lev=levels)
+
         # Assert that the collection contains at least one variable
         # -------------------------
         if not ds.keys():
@@ -132,7 +144,7 @@ class SocaRestart(EvaDatasetBase):
 # --------------------------------------------------------------------------------------------------
 
 
-def read_soca(file, variable, logger):
+def read_soca(file, variable, logger, levels=None):
 
     """
     Read SOCA data from the specified file for the given variable.
@@ -141,6 +153,8 @@ def read_soca(file, variable, logger):
         file (str): Path to the SOCA data file.
         variable (str): Name of the variable to read.
         logger (Logger): Logger for logging messages.
+        levels (list, optional): Model levels, numbered from 1, to read from 3D variables. Default
+                                 is None, all the levels are read.
 
     Returns:
         tuple: A tuple containing dimensions (list) and data (numpy.ndarray) for the specified
@@ -152,7 +166,13 @@ def read_soca(file, variable, logger):
             dims = ["lon", "lat"]
             if len(f.variables[variable].dimensions) > 3:
                 dims = ["lev", "lon", "lat"]
-            var = np.squeeze(f.variables[variable][:])
+            if levels is not None and dims[0] == 'lev':
+                # hyperslab read of the requested levels, keeping the level dimension
+                ncvar = f.variables[variable]
+                level_indices = get_level_indices(levels, ncvar.shape[1], logger)
+                var = np.squeeze(ncvar[:, level_indices], axis=0)
+            else:
+                var = np.squeeze(f.variables[variable][:])
         except KeyError:
             logger.abort(f"{variable} is not a valid variable. \nExiting ...")
 
@@ -18,7 +18,8 @@ from eva.utilities.config import get
 from eva.utilities.logger import Logger
 from eva.utilities.timing import Timing
 from eva.data.data_driver import data_driver
-from eva.time_series.time_series import collapse_collection_to_time_series
+from eva.time_series.time_series import collapse_collection_to_time_series, time_series_dates
+from eva.time_series.time_series import dataset_is_templated, expand_dataset_template
 from eva.transforms.transform_driver import transform_driver
 from eva.plotting.batch.base.plot_tools.figure_driver import figure_driver
 from eva.data.data_collections import DataCollections
@@ -129,18 +130,8 @@ def read_transform_time_series(logger, timing, eva_dict, data_collections):
         # Convert interval ISO string to timedelta object
         interval = iso_duration_to_timedelta(logger, interval)
 
-        # Make list of dates from begin to end with interval
-        dates = []
-        date = begin_date
-        count = 0
-        while date <= final_date:
-            dates.append(date)
-            date += interval
-            count += 1
-            # Abort if count hits one million
-            logger.assert_abort(count < 1e6, 'You are planning to read more than one million ' +
-                                'time steps. This is likely an error. Please check your ' +
-                                'configuration.')
+        # Generator for the dates from begin to end with interval
+        dates = time_series_dates(logger, begin_date, final_date, interval)
 
         # Get all datasets configuration
         all_datasets = get(eva_dict, logger, 'datasets')
@@ -160,13 +151,26 @@ def read_transform_time_series(logger, timing, eva_dict, data_collections):
                 if name == time_series_config['collection']:
                     transform_dict['transforms'].append(transform)
 
-        # Assert that datasets_config is the same length as dates
-        logger.assert_abort(len(datasets_config) == len(dates), 'When running in time ' +
-                            'series mode the number of datasets must be the same as the ' +
-                            'number of dates.')
+        # A single dataset containing date tokens (e.g. ${cycle}) is expanded lazily for each date.
+        # Otherwise there must be one dataset for each date.
+        missing_cycles = []
+        if len(datasets_config) == 1 and dataset_is_templated(datasets_config[0]):
+            logger.info('Expanding templated dataset for each date of the time series.')
+            dated_datasets_config = expand_dataset_template(logger, datasets_config[0], dates,
+                                                            missing_cycles)
+        else:
+            dates = list(dates)
+
+            # Assert that datasets_config is the same length as dates
+            logger.assert_abort(len(datasets_config) == len(dates), 'When running in time ' +
+                                'series mode the number of datasets must be the same as the ' +
+                                'number of dates, or a single dataset templated with the date ' +
+                                'must be provided.')
+            dated_datasets_config = zip(dates, datasets_config)
 
         # Loop over datasets reading each one in turn, internally appending the data_collections
-        for ind, dataset_config in enumerate(datasets_config):
+        ind = 0
+        for date, dataset_config in dated_datasets_config:
 
             # Create a temporary collection for this time step
             data_collections_tmp = DataCollections()
@@ -185,9 +189,21 @@ def read_transform_time_series(logger, timing, eva_dict, data_collections):
                 timing.stop('TransformDriverExecute')
 
             # Collapse data into time series
-            date = dates[ind]
             collapse_collection_to_time_series(logger, ind, date, time_series_config,
                                                data_collections, data_collections_tmp)
+            ind += 1
+
+        # Abort if no data was found for any of the dates
+        logger.assert_abort(ind > 0, 'No data was found for any date of the time series for ' +
+                            f'collection \'{time_series_config["collection"]}\'.')
+
+        # Keep a record of any cycles that were skipped
+        if missing_cycles:
+            logger.info(f'Warning: {len(missing_cycles)} cycles were missing from the time ' +
+                        f'series and were skipped: {missing_cycles}')
+            time_series_name = f'{time_series_config["collection"]}_time_series'
+            time_series_ds = data_collections.get_data_collection(time_series_name)
+            time_series_ds.attrs['missing_cycles'] = missing_cycles
 
         if not suppress_collection_display:
             logger.info('Computing of Eva time series complete: status of collection:')
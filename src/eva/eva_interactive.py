@@ -93,7 +93,7 @@ class EvaInteractive():
         self.dc_dict[collection_name] = data_collection
         self.fn_dict[collection_name] = filenames[0]
 
-        no_ch_dataspaces = ['JediLog', 'MonDataSpace']
+        no_ch_dataspaces = ['JediLog', 'JediLogSet', 'MonDataSpace']
         # Open up file to find channel requirements
         if eva_class_name not in no_ch_dataspaces:
             ds = nc.Dataset(filenames[0])
@@ -67,7 +67,10 @@ class Density(ABC):
         if 'channel' in self.config['data']:
             channel = self.config['data'].get('channel')
 
-        data = self.dataobj.get_variable_data(var_cgv[0], var_cgv[1], var_cgv[2], channel)
+        data = self.dataobj.get_variable_data(var_cgv[0], var_cgv[1], var_cgv[2], channel,
+                                              apply_selection=False)
+        selection = self.dataobj.get_variable_selection(var_cgv[0], var_cgv[1], var_cgv[2],
+                                                        channel)
 
         # See if we need to slice data
         data = slice_var_from_str(self.config['data'], data, self.logger)
@@ -75,8 +78,10 @@ class Density(ABC):
         # Density data should be flattened
         data = data.flatten()
 
-        # Missing data should also be removed
+        # Missing data, and data outside the selection of a filtered view, should also be removed
         mask = ~np.isnan(data)
+        if selection is not None:
+            mask &= slice_var_from_str(self.config['data'], selection, self.logger).flatten()
         self.data = data[mask]
 
 # --------------------------------------------------------------------------------------------------
@@ -87,9 +87,13 @@ class LinePlot(ABC):
             self.label = self.config.get('label')
 
         xdata = self.dataobj.get_variable_data(var0_cgv[0], var0_cgv[1], var0_cgv[2],
-                                               channel, level, datatype)
+                                               channel, level, datatype, apply_selection=False)
         ydata = self.dataobj.get_variable_data(var1_cgv[0], var1_cgv[1], var1_cgv[2],
-                                               channel, level, datatype)
+                                               channel, level, datatype, apply_selection=False)
+        xselection = self.dataobj.get_variable_selection(var0_cgv[0], var0_cgv[1], var0_cgv[2],
+                                                         channel, level, datatype)
+        yselection = self.dataobj.get_variable_selection(var1_cgv[0], var1_cgv[1], var1_cgv[2],
+                                                         channel, level, datatype)
 
         # see if we need to slice data
         xdata = slice_var_from_str(self.config['x'], xdata, self.logger)
@@ -99,13 +103,14 @@ class LinePlot(ABC):
         xdata = xdata.flatten()
         ydata = ydata.flatten()
 
-        # Remove NaN values to enable regression
+        # Remove NaN values, and values outside the selection of filtered views, to enable
+        # regression
         # --------------------------------------
-        mask = ~np.isnan(xdata)
-        xdata = xdata[mask]
-        ydata = ydata[mask]
-
-        mask = ~np.isnan(ydata)
+        mask = ~np.isnan(xdata) & ~np.isnan(ydata)
+        if xselection is not None:
+            mask &= slice_var_from_str(self.config['x'], xselection, self.logger).flatten()
+        if yselection is not None:
+            mask &= slice_var_from_str(self.config['y'], yselection, self.logger).flatten()
         self.xdata = xdata[mask]
         self.ydata = ydata[mask]
 
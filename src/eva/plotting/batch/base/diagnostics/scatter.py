@@ -70,9 +70,14 @@ class Scatter(ABC):
         if 'channel' in self.config:
             channel = self.config.get('channel')
 
-        xdata = self.dataobj.get_variable_data(var0_cgv[0], var0_cgv[1], var0_cgv[2], channel)
-        xdata1 = self.dataobj.get_variable_data(var0_cgv[0], var0_cgv[1], var0_cgv[2])
-        ydata = self.dataobj.get_variable_data(var1_cgv[0], var1_cgv[1], var1_cgv[2], channel)
+        xdata = self.dataobj.get_variable_data(var0_cgv[0], var0_cgv[1], var0_cgv[2], channel,
+                                               apply_selection=False)
+        ydata = self.dataobj.get_variable_data(var1_cgv[0], var1_cgv[1], var1_cgv[2], channel,
+                                               apply_selection=False)
+        xselection = self.dataobj.get_variable_selection(var0_cgv[0], var0_cgv[1], var0_cgv[2],
+                                                         channel)
+        yselection = self.dataobj.get_variable_selection(var1_cgv[0], var1_cgv[1], var1_cgv[2],
+                                                         channel)
 
         # see if we need to slice data
         xdata = slice_var_from_str(self.config['x'], xdata, self.logger)
@@ -82,13 +87,14 @@ class Scatter(ABC):
         xdata = xdata.flatten()
         ydata = ydata.flatten()
 
-        # Remove NaN values to enable regression
+        # Remove NaN values, and values outside the selection of filtered views, to enable
+        # regression
         # --------------------------------------
-        mask = ~np.isnan(xdata)
-        xdata = xdata[mask]
-        ydata = ydata[mask]
-
-        mask = ~np.isnan(ydata)
+        mask = ~np.isnan(xdata) & ~np.isnan(ydata)
+        if xselection is not None:
+            mask &= slice_var_from_str(self.config['x'], xselection, self.logger).flatten()
+        if yselection is not None:
+            mask &= slice_var_from_str(self.config['y'], yselection, self.logger).flatten()
         self.xdata = xdata[mask]
         self.ydata = ydata[mask]
 
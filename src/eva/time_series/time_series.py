@@ -10,8 +10,12 @@
 # --------------------------------------------------------------------------------------------------
 
 
+import os
 import numpy as np
 import xarray as xr
+import yaml
+
+from eva.utilities.utils import replace_vars_dict, replace_vars_str
 
 
 # --------------------------------------------------------------------------------------------------
@@ -23,6 +27,159 @@ xr_aggregation_methods = {
 }
 
 
+# Date tokens that can be used to template a dataset configuration in time series mode, e.g.
+# filenames: [/path/to/time.hirs4_metop-a.${cycle}.ieee_d]
+date_template_formats = {
+    'cycle': '%Y%m%d%H',
+    'year': '%Y',
+    'month': '%m',
+    'day': '%d',
+    'hour': '%H',
+    'minute': '%M',
+    'second': '%S',
+}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def time_series_dates(logger, begin_date, final_date, interval):
+
+    """
+    Generate the dates of a time series, from begin date to final date (inclusive).
+
+    Args:
+        logger (Logger): An instance of the logger for logging messages.
+        begin_date (datetime): First date of the time series.
+        final_date (datetime): Last date of the time series.
+        interval (timedelta): Interval between the dates.
+
+    Yields:
+        datetime: The next date in the time series.
+    """
+
+    date = begin_date
+    count = 0
+    while date <= final_date:
+        yield date
+        date += interval
+        count += 1
+        # Abort if count hits one million
+        logger.assert_abort(count < 1e6, 'You are planning to read more than one million ' +
+                            'time steps. This is likely an error. Please check your ' +
+                            'configuration.')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def date_template_dict(date):
+
+    """
+    Create the dictionary of date tokens used to resolve a templated dataset configuration.
+
+    Args:
+        date (datetime): The date of this step in the time series.
+
+    Returns:
+        dict: Dictionary mapping each date token to its value for the date.
+    """
+
+    return {token: date.strftime(fmt) for token, fmt in date_template_formats.items()}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def dataset_is_templated(dataset_config):
+
+    """
+    Check whether a dataset configuration contains any of the date tokens.
+
+    Args:
+        dataset_config (dict): The dataset configuration.
+
+    Returns:
+        bool: True if the configuration contains at least one date token.
+    """
+
+    dataset_config_str = yaml.dump(dataset_config)
+    return any('${' + token + '}' in dataset_config_str for token in date_template_formats)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def templated_file_paths(config, key=''):
+
+    """
+    Find the file paths in a dataset configuration that contain date tokens.
+
+    A value is taken to be a file path when the key it is stored under contains 'file' or 'log'
+    (e.g. filenames, data_file, control_file, jedi_log_to_parse).
+
+    Args:
+        config (dict, list or str): The (part of the) dataset configuration to search.
+        key (str): The key under which config is stored in the parent dictionary.
+
+    Returns:
+        list: The templated file paths.
+    """
+
+    paths = []
+    if isinstance(config, dict):
+        for sub_key, value in config.items():
+            paths += templated_file_paths(value, str(sub_key))
+    elif isinstance(config, list):
+        for value in config:
+            paths += templated_file_paths(value, key)
+    elif isinstance(config, str) and ('file' in key or 'log' in key):
+        if any('${' + token + '}' in config for token in date_template_formats):
+            paths.append(config)
+
+    return paths
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def expand_dataset_template(logger, dataset_template, dates, missing_cycles):
+
+    """
+    Lazily expand a templated dataset configuration for each date of a time series.
+
+    Dates for which any of the templated files does not exist are skipped and appended to
+    missing_cycles rather than aborting the time series.
+
+    Args:
+        logger (Logger): An instance of the logger for logging messages.
+        dataset_template (dict): Dataset configuration containing date tokens.
+        dates (iterable): Dates of the time series.
+        missing_cycles (list): List to which dates with missing files are appended.
+
+    Yields:
+        tuple: The date and the dataset configuration resolved for that date.
+    """
+
+    template_paths = templated_file_paths(dataset_template)
+
+    for date in dates:
+
+        date_dict = date_template_dict(date)
+
+        # Check that the files for this cycle exist
+        missing_files = [path for path in
+                         [replace_vars_str(tp, **date_dict) for tp in template_paths]
+                         if not os.path.exists(path)]
+        if missing_files:
+            logger.info(f'Warning: skipping time series cycle {date.isoformat()} since the ' +
+                        f'following files are missing: {missing_files}')
+            missing_cycles.append(date.isoformat())
+            continue
+
+        yield date, replace_vars_dict(dataset_template, **date_dict)
+
+
 # --------------------------------------------------------------------------------------------------
 
 
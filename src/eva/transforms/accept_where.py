@@ -10,6 +10,8 @@
 # --------------------------------------------------------------------------------------------------
 
 
+from eva.transforms.compiled_expression import compile_expression
+from eva.transforms.compiled_expression import evaluate_expression_data_arrays
 from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
 from eva.transforms.transform_utils import replace_cgv
 from eva.utilities.config import get
@@ -31,13 +33,16 @@ def accept_where(config, data_collections):
     Returns:
         None
 
-    Raises:
-        ValueError: If the 'where' expression format is incorrect.
-
     This function applies a filtering transformation to data variables within the provided
     data collections. It iterates over the specified collections, groups, and variables, and
-    applies filtering conditions as defined in the 'where' expressions within the configuration.
-    The resulting filtered variables are added to the data collections.
+    keeps the values where all the conditions of the 'where' list hold, the other values are set
+    to NaN. Conditions can compare variables and values with == != < <= > >=, be combined with
+    and, or, not and test membership of a list of values with 'in'. The conditions are compiled
+    once into a single boolean mask, which is kept by the data collections and reused by later
+    transforms with the same conditions, and applied in one pass to each variable. The resulting
+    filtered variables are added to the data collections. With 'view: true' the filtered
+    variables share the data of the starting fields and keep the mask as their selection, which
+    costs one boolean per value instead of a full copy of each variable.
 
     Example:
         ::
@@ -48,7 +53,9 @@ def accept_where(config, data_collections):
                     'variables': [...],
                     'new name': 'filtered_variable',
                     'starting field': 'original_variable',
-                    'where': ['${collection}::${group}::${variable} >= 0.0']
+                    'where': ['${collection}::${group}::${variable} >= 0.0',
+                              '${collection}::QC::${variable} in [0, 2] or ' +
+                              '${collection}::ObsError::${variable} < 1.0']
                 }
                 accept_where(config, data_collections)
     """
@@ -63,47 +70,96 @@ def accept_where(config, data_collections):
     new_name_template = get(config, logger, 'new name')
     starting_field_template = get(config, logger, 'starting field')
 
-    # Get the where dictionary
+    # Get the where list, all the conditions must hold
     wheres = get(config, logger, 'where')
+    if isinstance(wheres, str):
+        wheres = [wheres]
+    condition_template = ' and '.join(f'({where})' for where in wheres)
+
+    # Optionally keep the filtered variables as views of the starting fields, with the mask of the
+    # conditions as their selection, rather than as copies with NaN where the conditions fail
+    view = get(config, logger, 'view', False)
 
-    # Loop over the templates
+    # Replace collection, group, variable in the templates for each combination
+    combinations = []
     for collection in collections:
         for group in groups:
             for variable in variables:
+                combinations.append(replace_cgv(logger, collection, group, variable,
+                                                new_name_template, starting_field_template,
+                                                condition_template))
+
+    # The filtered variables are added to the collections together, unless a combination uses a
+    # variable created by this transform
+    new_names = {new_name for new_name, _, _ in combinations}
+    add_together = not any(starting_field in new_names or
+                           any(new_name in condition for new_name in new_names)
+                           for _, starting_field, condition in combinations)
+    collection_batches = {}
+
+    for new_name, starting_field, condition in combinations:
+
+        # Get the variable to be adjusted
+        cgv = split_collectiongroupvariable(logger, starting_field)
+        var_to_filter = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+        # Get the mask of the conditions, evaluating it the first time it is needed
+        mask = data_collections.get_mask(condition)
+        if mask is None:
+            compiled = compile_expression(condition, logger, condition=True)
+            if not compiled.names:
+                logger.abort(f'The condition \'{condition}\' does not contain any variable.')
+
+            where_vars = []
+            for name in compiled.names:
+                cgv = split_collectiongroupvariable(logger, name)
+                where_vars.append(data_collections.get_variable_data_array(cgv[0], cgv[1],
+                                                                           cgv[2]))
+
+            mask = evaluate_expression_data_arrays(compiled, where_vars)
+            data_collections.add_mask(condition, compiled.names, mask)
+
+        # Set the values where the conditions do not hold to NaN, or share the data of the
+        # starting field and select it with the mask
+        if view and is_selection_of(mask, var_to_filter):
+            filtered_var, selection = var_to_filter.copy(deep=False), mask
+        else:
+            filtered_var, selection = var_to_filter.where(mask), None
+
+        # Add the variable to collection, variables sharing a selection are added together
+        cgv = split_collectiongroupvariable(logger, new_name)
+        filtered_vars = {cgv[1] + '::' + cgv[2]: filtered_var}
+        if add_together:
+            batch = collection_batches.setdefault((cgv[0], id(selection)), (selection, {}))
+            batch[1].update(filtered_vars)
+        else:
+            data_collections.add_variables_to_collection(cgv[0], filtered_vars, selection)
+
+    for (collection_name, _), (selection, filtered_vars) in collection_batches.items():
+        data_collections.add_variables_to_collection(collection_name, filtered_vars, selection)
 
-                # Replace collection, group, variable in template
-                [new_name, starting_field] = replace_cgv(logger, collection, group, variable,
-                                                         new_name_template, starting_field_template)
 
-                # Get the variable to be adjusted
-                cgv = split_collectiongroupvariable(logger, starting_field)
-                var_to_filter = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
-
-                # Loop over wheres and create new variable with NaN where filtered
-                for where_expression in wheres:
+# --------------------------------------------------------------------------------------------------
 
-                    # Split where into variable, condition and value
-                    try:
-                        [where_var, where_con, where_val] = where_expression.split(' ')
-                    except Exception:
-                        self.logger.abort(f'Failed to split \'{where_expression}\'. Check that ' +
-                                          'it has the correct format, e.g. ' +
-                                          '\'${collection}::${group}::${variable} >= 0.0\'.')
 
-                    # Replace templated aspects in where statement
-                    [where_var] = replace_cgv(logger, collection, group, variable, where_var)
+def is_selection_of(mask, data_array):
+    """
+    Check whether a boolean mask can be used as the selection of a DataArray.
 
-                    # Extract Dataarray for that variable
-                    cgv = split_collectiongroupvariable(logger, where_var)
-                    where_var_dat = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+    Args:
+        mask (DataArray): The boolean mask.
+        data_array (DataArray): The DataArray to be selected.
 
-                    # Perform evaluation to filter the variable
-                    where_string = 'where_var_dat ' + where_con + ' ' + where_val
-                    var_to_filter = eval('var_to_filter.where(' + where_string + ')')
+    Returns:
+        bool: True if the dimensions of the mask are dimensions of the DataArray, with the same
+        sizes and indexes, so that the mask selects values without alignment.
+    """
 
-                # Add the variable to collection
-                cgv = split_collectiongroupvariable(logger, new_name)
-                data_collections.add_variable_to_collection(cgv[0], cgv[1], cgv[2], var_to_filter)
+    return mask.dtype == bool and \
+        all(dim in data_array.dims and mask.sizes[dim] == data_array.sizes[dim] for dim in
+            mask.dims) and \
+        all(dim in data_array.indexes and mask.indexes[dim].equals(data_array.indexes[dim])
+            for dim in mask.indexes)
 
 
 # --------------------------------------------------------------------------------------------------
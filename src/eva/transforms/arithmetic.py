@@ -10,46 +10,14 @@
 # --------------------------------------------------------------------------------------------------
 
 
-from math import sqrt
-from numpy import log
 import re
-from statistics import mean
 
 from eva.utilities.config import get
 from eva.utilities.logger import Logger
+from eva.transforms.compiled_expression import compile_expression
+from eva.transforms.compiled_expression import evaluate_expression_batch
 from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
 from eva.transforms.transform_utils import replace_cgv
-from eva.utilities.utils import remove_list_duplicates
-from eva.utilities.utils import remove_empty_from_list_of_strings
-
-
-# --------------------------------------------------------------------------------------------------
-
-
-def isfloat(a_string):
-    """
-    Checks if a string can be converted to a floating-point number.
-
-    Args:
-        a_string (str): The string to be checked.
-
-    Returns:
-        bool: True if the string can be converted to a float, False otherwise.
-
-    This function determines whether a given string can be successfully converted to a
-    floating-point number.
-
-    Example:
-        ::
-
-                result = isfloat("3.14")
-    """
-
-    try:
-        float(a_string)
-        return True
-    except ValueError:
-        return False
 
 
 # --------------------------------------------------------------------------------------------------
@@ -70,7 +38,10 @@ def arithmetic(config, data_collections):
     This function applies arithmetic transformations to data variables within the provided data
     collections. It iterates over the specified collections, groups, and variables, and applies
     arithmetic expressions as defined in the 'equals' expressions within the configuration. The
-    resulting variables are added to the data collections.
+    expression is parsed once into a syntax tree and evaluated on the numpy arrays, reusing the
+    intermediate arrays in place. When the variables of the for loop have the same shape they are
+    stacked and the expression is evaluated once for all of them. The resulting variables are
+    added to the data collections.
 
     Example:
         ::
@@ -96,7 +67,9 @@ def arithmetic(config, data_collections):
     new_name_template = get(config, logger, 'new name')
     expression_template = get(config, logger, 'equals')
 
-    # Loop over the templates
+    # Parse the expression of each combination of the templates, the syntax tree is shared by
+    # all the combinations
+    combinations = []
     for collection in collections:
         for group in groups:
             for variable in variables:
@@ -105,37 +78,45 @@ def arithmetic(config, data_collections):
                 [new_name, expression] = replace_cgv(logger, collection, group, variable,
                                                      new_name_template, expression_template)
 
-                # Remove white space
-                expression = ''.join(expression.split())
-
-                # Split math equation
-                expression_elements = re.split(r'\(|\)|-|\*|\+|\/|log', expression)
-
-                # Remove empty elements and duplicates from expression elements
-                expression_elements = remove_empty_from_list_of_strings(expression_elements)
-                expression_variables = remove_list_duplicates(expression_elements)
-
-                # Build the expression
-                vars = []
-                var_counter = 0
-                for n in range(len(expression_variables)):
-                    if not isfloat(expression_variables[n]):
-                        # Extract the data from the collections
-                        cgv = split_collectiongroupvariable(logger, expression_variables[n])
-                        exp_var_data = data_collections.get_variable_data_array(cgv[0], cgv[1],
-                                                                                cgv[2])
-                        vars.append(exp_var_data)
-                        # Replace the name in the expression
-                        expression = expression.replace(expression_variables[n],
-                                                        'vars['+str(var_counter)+']')
-                        var_counter = var_counter + 1
-
-                # Evaluate the expression
-                new_variable = eval(str(expression))
-
-                # Add the new field to the data collections
-                cgv = split_collectiongroupvariable(logger, new_name)
-                data_collections.add_variable_to_collection(cgv[0], cgv[1], cgv[2], new_variable)
+                compiled = compile_expression(expression, logger)
+                if not compiled.names:
+                    logger.abort(f'The expression \'{expression}\' does not contain any variable.')
+
+                combinations.append((new_name, compiled))
+
+    # Combinations sharing the syntax tree are evaluated together. Expressions using a variable
+    # created by this transform are evaluated one at a time, in order.
+    new_names = {new_name for new_name, _ in combinations}
+    if any(name in new_names for _, compiled in combinations for name in compiled.names):
+        batches = [[combination] for combination in combinations]
+    else:
+        batches = {}
+        for combination in combinations:
+            batches.setdefault(id(combination[1].tree), []).append(combination)
+        batches = batches.values()
+
+    for batch in batches:
+
+        # Extract the data from the collections
+        exp_vars_list = []
+        for _, compiled in batch:
+            exp_vars = []
+            for name in compiled.names:
+                cgv = split_collectiongroupvariable(logger, name)
+                exp_vars.append(data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2]))
+            exp_vars_list.append(exp_vars)
+
+        # Evaluate the expression once for all the combinations with the same shape
+        new_variables = evaluate_expression_batch(batch[0][1], exp_vars_list)
+
+        # Add the new fields to the data collections
+        collection_variables = {}
+        for (new_name, _), new_variable in zip(batch, new_variables):
+            cgv = split_collectiongroupvariable(logger, new_name)
+            collection_variables.setdefault(cgv[0], {})[cgv[1] + '::' + cgv[2]] = new_variable
+
+        for collection_name, variables_to_add in collection_variables.items():
+            data_collections.add_variables_to_collection(collection_name, variables_to_add)
 
 
 # --------------------------------------------------------------------------------------------------
@@ -0,0 +1,412 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+from xarray import DataArray
+
+from eva.transforms.regrid import regrid_dims
+from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
+from eva.transforms.transform_utils import replace_cgv
+from eva.utilities.config import get
+from eva.utilities.logger import Logger
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Statistics of the values in each grid cell
+bin_statistics = ['Count', 'Sum', 'Mean', 'RMS', 'Std']
+
+# Name of the vertical dimension of the grid
+vertical_dim = 'GridLevel'
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_bin_edges(config, logger, key):
+
+    """
+    Get edges of bins from the configuration, checking that they are ordered.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        logger (Logger): An instance of the logger for logging messages.
+        key (str): The key of the edges in the configuration.
+
+    Returns:
+        np.ndarray: The increasing or decreasing edges.
+    """
+
+    edges = np.asarray(get(config, logger, key), dtype=np.float64)
+    edge_steps = np.diff(edges)
+    logger.assert_abort(edges.size > 1 and (np.all(edge_steps > 0) or np.all(edge_steps < 0)),
+                        f'The {key} must be at least two increasing or decreasing values.')
+
+    return edges
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_edge_index(values, edges):
+
+    """
+    Compute the index of the bin of each value, whichever way the edges are ordered.
+
+    Bins include their edge closest to the first edge, e.g. [0, 10) and [10, 20) for edges
+    [0, 10, 20] and (20, 10] and (10, 0] for edges [20, 10, 0].
+
+    Args:
+        values (np.ndarray): The values.
+        edges (np.ndarray): Increasing or decreasing edges of the bins.
+
+    Returns:
+        tuple: Index of the bin of each value and a boolean array of the values inside the bins.
+    """
+
+    number_of_bins = edges.size - 1
+    values = np.ravel(values).astype(np.float64, copy=False)
+    if edges[0] > edges[-1]:
+        index = number_of_bins - np.searchsorted(edges[::-1], values, side='left')
+    else:
+        index = np.searchsorted(edges, values, side='right') - 1
+    inside = (index >= 0) & (index < number_of_bins) & ~np.isnan(values)
+
+    return index, inside
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_bin_index(lon, lat, resolution, domain, vertical=None, vertical_edges=None):
+
+    """
+    Compute the index of the grid cell of each location.
+
+    Longitudes are wrapped into the domain, so locations given in [0, 360) are binned on a
+    [-180, 180) grid and vice versa. Latitudes on the northern edge of the domain are put in the
+    last row of cells.
+
+    Args:
+        lon (np.ndarray): Longitudes of the locations in degrees.
+        lat (np.ndarray): Latitudes of the locations in degrees.
+        resolution (float): Size of the grid cells in degrees.
+        domain (list): Longitude minimum and maximum and latitude minimum and maximum.
+        vertical (np.ndarray): Vertical coordinate of the locations, None for a 2D grid.
+        vertical_edges (np.ndarray): Increasing or decreasing edges of the vertical bins.
+
+    Returns:
+        tuple: Flat index of the cell of each location, equal to the number of cells for locations
+               outside the grid, and the shape of the grid.
+    """
+
+    lon_min, lon_max, lat_min, lat_max = [float(bound) for bound in domain]
+    n_lon = np.arange(lon_min + resolution / 2, lon_max, resolution).size
+    n_lat = np.arange(lat_min + resolution / 2, lat_max, resolution).size
+
+    # Positions in units of cells, with the longitudes wrapped into [0, 360) degrees
+    lon_cell = np.ravel(lon).astype(np.float64)
+    lon_cell -= lon_min
+    lon_cell /= resolution
+    period = 360.0 / resolution
+    lon_cell -= period * np.floor(lon_cell / period)
+    lat_cell = np.ravel(lat).astype(np.float64)
+    lat_cell -= lat_min
+    lat_cell /= resolution
+
+    with np.errstate(invalid='ignore'):
+        inside = (lon_cell < (lon_max - lon_min) / resolution) & (lat_cell >= 0) & \
+            (lat_cell <= (lat_max - lat_min) / resolution)
+
+    np.floor(lon_cell, out=lon_cell)
+    np.floor(lat_cell, out=lat_cell)
+    np.minimum(lon_cell, n_lon - 1, out=lon_cell)
+    np.minimum(lat_cell, n_lat - 1, out=lat_cell)
+    lat_cell *= n_lon
+    lat_cell += lon_cell
+    index = np.where(inside, lat_cell, 0).astype(np.int64)
+    shape = (n_lat, n_lon)
+
+    if vertical is not None:
+        # Bins of the vertical coordinate
+        n_level = vertical_edges.size - 1
+        level_index, level_inside = compute_edge_index(vertical, vertical_edges)
+        inside &= level_inside
+        index += np.where(inside, level_index, 0) * (n_lat * n_lon)
+        shape = (n_level,) + shape
+
+    # Locations outside the grid go to an extra cell that is dropped
+    index[~inside] = np.prod(shape)
+
+    return index, shape
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def bin_values(values, index, number_of_cells, statistics, membership=None):
+
+    """
+    Accumulate statistics of values in the grid cells with a bincount per row and moment.
+
+    Args:
+        values (np.ndarray): (number of rows, number of locations) values, the statistics of each
+                             row are computed separately.
+        index (np.ndarray): Flat index of the cell of each location, number_of_cells for locations
+                            outside the grid.
+        number_of_cells (int): Number of cells of the grid.
+        statistics (list): The statistics to compute, from Count, Sum, Mean, RMS and Std.
+        membership (np.ndarray): Optional (number of cells, number of groups) array, 1 where a
+                                 cell belongs to a group. The statistics are then those of the
+                                 groups of cells, which can overlap.
+
+    Returns:
+        dict: (number of rows, number of cells or groups) array of each statistic. Statistics of
+              empty cells are missing except for the count and sum, which are zero.
+    """
+
+    n_rows = values.shape[0]
+    moments = any(statistic in ['Sum', 'Mean', 'RMS', 'Std'] for statistic in statistics)
+    squares = 'RMS' in statistics or 'Std' in statistics
+
+    count = np.zeros((n_rows, number_of_cells))
+    total = np.zeros((n_rows, number_of_cells))
+    total_square = np.zeros((n_rows, number_of_cells))
+
+    # One bincount per row and moment, missing values go to the dropped cell
+    for row in range(n_rows):
+        row_values = values[row].astype(np.float64)
+        valid = ~np.isnan(row_values)
+        if valid.all():
+            cells = index
+        else:
+            cells = np.where(valid, index, number_of_cells)
+            row_values[~valid] = 0.0
+
+        count[row] = np.bincount(cells, minlength=number_of_cells + 1)[:number_of_cells]
+        if moments:
+            total[row] = np.bincount(cells, weights=row_values,
+                                     minlength=number_of_cells + 1)[:number_of_cells]
+        if squares:
+            row_values *= row_values
+            total_square[row] = np.bincount(cells, weights=row_values,
+                                            minlength=number_of_cells + 1)[:number_of_cells]
+
+    # Sums over the groups of cells
+    if membership is not None:
+        count = count @ membership
+        total = total @ membership
+        total_square = total_square @ membership
+
+    results = {'Count': count.astype(np.int64), 'Sum': total}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        results['Mean'] = mean
+        if squares:
+            mean_square = total_square / count
+            results['RMS'] = np.sqrt(mean_square)
+            results['Std'] = np.sqrt(np.maximum(mean_square - mean * mean, 0))
+
+    return {statistic: results[statistic] for statistic in statistics}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def bin_data_array(data_array, location_dims, index, bin_shape, bin_dims, statistics,
+                   membership=None):
+
+    """
+    Compute statistics of a DataArray in bins of its locations.
+
+    Args:
+        data_array (DataArray): The data, with the location dimensions and possibly others (e.g.
+                                Channel) that are kept.
+        location_dims (tuple): The location dimensions.
+        index (np.ndarray): Flat index of the bin of each location, the number of bins for
+                            locations outside the bins.
+        bin_shape (tuple): Shape of the bins.
+        bin_dims (tuple): Dimensions of the bins.
+        statistics (list): The statistics to compute, from Count, Sum, Mean, RMS and Std.
+        membership (np.ndarray): Optional (number of bins, number of groups) array, 1 where a bin
+                                 belongs to a group. The bin shape and dimensions are then those
+                                 of the groups.
+
+    Returns:
+        dict: DataArray of each statistic, with the other dimensions followed by the bin
+              dimensions.
+    """
+
+    # Move the location dimensions last and flatten them
+    other_dims = [dim for dim in data_array.dims if dim not in location_dims]
+    data_array = data_array.transpose(*other_dims, *location_dims)
+    other_shape = data_array.shape[:len(other_dims)]
+    values = data_array.values.reshape(-1, index.size)
+
+    number_of_bins = int(np.prod(bin_shape)) if membership is None else membership.shape[0]
+    results = bin_values(values, index, number_of_bins, statistics, membership)
+
+    # Coordinates of the other dimensions, e.g. the channel numbers, are kept
+    coords = {name: coord for name, coord in data_array.coords.items()
+              if not set(location_dims).intersection(coord.dims)}
+
+    return {statistic: DataArray(results[statistic].reshape(other_shape + bin_shape),
+                                 dims=(*other_dims, *bin_dims), coords=coords,
+                                 attrs=data_array.attrs)
+            for statistic in statistics}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def bin_to_grid(config, data_collections):
+
+    """
+    Bins observation space variables onto a regular latitude/longitude grid.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        data_collections (DataCollections): An instance of the DataCollections class containing
+        input data.
+
+    Returns:
+        None
+
+    This function computes statistics of the values of variables in the cells of a regular grid,
+    optionally with pressure or another vertical coordinate binned into levels. The cell of each
+    location is computed once and the statistics of each variable are accumulated with a bincount
+    of the values, so the result is a small array that can be plotted with MapGridded. Each
+    statistic is added to a group named after the new group and the statistic, for example
+    ObsValueMinusHofxMean, along with the longitude and latitude of the cell centers. Dimensions
+    of the variables other than the location dimensions are kept.
+
+    Example:
+        ::
+
+                config = {
+                    'longitude': 'experiment::MetaData::longitude',
+                    'latitude': 'experiment::MetaData::latitude',
+                    'resolution': 1.0,
+                    'domain': [-180, 180, -90, 90],
+                    'vertical coordinate': 'experiment::MetaData::pressure',
+                    'vertical bin edges': [110000, 70000, 40000, 10000],
+                    'statistic list': ['Count', 'Mean', 'RMS'],
+                    'new name': 'binned::ObsValueMinusHofx::${variable}',
+                    'starting field': 'experiment::ObsValueMinusHofx::${variable}',
+                    'for': {'variable': ['airTemperature']}
+                }
+                bin_to_grid(config, data_collections)
+    """
+
+    # Create a logger
+    logger = Logger('BinToGridTransform')
+
+    # Parse the for dictionary
+    [collections, groups, variables] = parse_for_dict(config, logger)
+
+    # Parse config for the new collection/group/variable naming
+    new_name_template = get(config, logger, 'new name')
+    starting_field_template = get(config, logger, 'starting field')
+
+    statistics = get(config, logger, 'statistic list', bin_statistics)
+    for statistic in statistics:
+        logger.assert_abort(statistic in bin_statistics, f'The statistic \'{statistic}\' is ' +
+                            f'not supported. Supported statistics are {bin_statistics}.')
+
+    # Locations
+    cgv = split_collectiongroupvariable(logger, get(config, logger, 'longitude'))
+    lon = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+    cgv = split_collectiongroupvariable(logger, get(config, logger, 'latitude'))
+    lat = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+    if lon.dims != lat.dims:
+        logger.abort(f'The longitude {lon.dims} and latitude {lat.dims} must have the same ' +
+                     'dimensions.')
+    location_dims = lon.dims
+
+    # Optional vertical coordinate and the edges of its bins
+    vertical = None
+    vertical_edges = None
+    vertical_name = get(config, logger, 'vertical coordinate', None, False)
+    if vertical_name is not None:
+        cgv = split_collectiongroupvariable(logger, vertical_name)
+        vertical = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+        logger.assert_abort(vertical.dims == location_dims, f'The vertical coordinate ' +
+                            f'{vertical.dims} must have the dimensions of the longitude ' +
+                            f'{location_dims}.')
+        vertical = vertical.values
+        vertical_edges = get_bin_edges(config, logger, 'vertical bin edges')
+
+    # Regular grid, the cell centers are those of the regrid transform
+    resolution = float(get(config, logger, 'resolution', 1.0))
+    domain = get(config, logger, 'domain', [-180.0, 180.0, -90.0, 90.0])
+    lon_min, lon_max, lat_min, lat_max = domain
+    grid_lon, grid_lat = np.meshgrid(np.arange(lon_min + resolution / 2, lon_max, resolution),
+                                     np.arange(lat_min + resolution / 2, lat_max, resolution))
+
+    # Cell of each location, shared by all the variables
+    index, grid_shape = compute_bin_index(lon.values, lat.values, resolution, domain, vertical,
+                                          vertical_edges)
+    number_of_cells = int(np.prod(grid_shape))
+    grid_dims = regrid_dims if vertical is None else (vertical_dim,) + regrid_dims
+    logger.info(f'Binning {np.count_nonzero(index < number_of_cells)} of {index.size} ' +
+                f'locations on a grid of shape {grid_shape}.')
+
+    # Longitude and latitude of the grid are added to each new group once
+    grids_added = set()
+
+    # Loop over the templates
+    for collection in collections:
+        for group in groups:
+            for variable in variables:
+
+                if variable is not None:
+                    # Replace collection, group, variable in template
+                    [new_name, starting_field] = replace_cgv(logger, collection, group, variable,
+                                                             new_name_template,
+                                                             starting_field_template)
+                else:
+                    new_name = new_name_template
+                    starting_field = starting_field_template
+
+                # Get the variable to bin
+                cgv = split_collectiongroupvariable(logger, starting_field)
+                var_array = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+                if not set(location_dims).issubset(var_array.dims):
+                    logger.abort(f'Variable {starting_field} with dimensions {var_array.dims} ' +
+                                 f'does not have the location dimensions {location_dims}.')
+
+                results = bin_data_array(var_array, location_dims, index, grid_shape, grid_dims,
+                                         statistics)
+
+                # Add a group for each statistic with the longitude and latitude of the grid
+                cgv_new = split_collectiongroupvariable(logger, new_name)
+                variables_to_add = {}
+                for statistic in statistics:
+                    new_group = cgv_new[1] + statistic
+                    variables_to_add[new_group + '::' + cgv_new[2]] = results[statistic]
+
+                    if (cgv_new[0], new_group) not in grids_added:
+                        grids_added.add((cgv_new[0], new_group))
+                        for name, coordinate in [('longitude', grid_lon), ('latitude', grid_lat)]:
+                            variables_to_add[new_group + '::' + name] = \
+                                DataArray(coordinate, dims=regrid_dims)
+                        if vertical is not None:
+                            centers = (vertical_edges[:-1] + vertical_edges[1:]) / 2
+                            variables_to_add[new_group + '::level'] = \
+                                DataArray(centers, dims=(vertical_dim,))
+
+                data_collections.add_variables_to_collection(cgv_new[0], variables_to_add)
+
+
+# --------------------------------------------------------------------------------------------------
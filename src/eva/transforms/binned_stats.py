@@ -0,0 +1,136 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+from xarray import DataArray
+
+from eva.transforms.bin_to_grid import bin_data_array, bin_statistics, compute_edge_index
+from eva.transforms.bin_to_grid import get_bin_edges
+from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
+from eva.transforms.transform_utils import replace_cgv
+from eva.utilities.config import get
+from eva.utilities.logger import Logger
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def binned_stats(config, data_collections):
+
+    """
+    Computes statistics of variables in bins of another variable.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        data_collections (DataCollections): An instance of the DataCollections class containing
+        input data.
+
+    Returns:
+        None
+
+    This function computes statistics of the values of variables in bins of a bin variable, e.g.
+    the omb by pressure layer, the bias by scan position or the RMS by latitude band. The bin of
+    each location is computed once and the statistics of each variable are accumulated with a
+    bincount of the values for all its channels at once. Each statistic is added to a group named
+    after the new group and the statistic, for example ObsValueMinusHofxMean, with the bin
+    dimension last. Statistics with different bins added to the same collection need different
+    bin dimensions. The centers of the bins are added to the group named after the new group and
+    BinCenter with the same dimensions, so that a statistic and the centers can be drawn against
+    each other with LinePlot, for a channel or not.
+
+    Example:
+        ::
+
+                config = {
+                    'bin variable': 'experiment::MetaData::pressure',
+                    'bin edges': [100000, 85000, 70000, 50000, 30000, 10000],
+                    'statistic list': ['Count', 'Mean', 'Std', 'RMS'],
+                    'bin dimension': 'PressureBin',
+                    'new name': 'binned::ObsValueMinusHofx::${variable}',
+                    'starting field': 'experiment::ObsValueMinusHofx::${variable}',
+                    'for': {'variable': ['airTemperature']}
+                }
+                binned_stats(config, data_collections)
+    """
+
+    # Create a logger
+    logger = Logger('BinnedStatsTransform')
+
+    # Parse the for dictionary
+    [collections, groups, variables] = parse_for_dict(config, logger)
+
+    # Parse config for the new collection/group/variable naming
+    new_name_template = get(config, logger, 'new name')
+    starting_field_template = get(config, logger, 'starting field')
+
+    statistics = get(config, logger, 'statistic list', ['Count', 'Mean', 'Std', 'RMS'])
+    for statistic in statistics:
+        logger.assert_abort(statistic in bin_statistics, f'The statistic \'{statistic}\' is ' +
+                            f'not supported. Supported statistics are {bin_statistics}.')
+
+    # Variable to bin by and the edges of its bins
+    cgv = split_collectiongroupvariable(logger, get(config, logger, 'bin variable'))
+    bin_variable = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+    location_dims = bin_variable.dims
+    bin_edges = get_bin_edges(config, logger, 'bin edges')
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    bin_shape = bin_centers.shape
+    bin_dim = get(config, logger, 'bin dimension', 'Bin')
+
+    # Bin of each location, shared by all the variables
+    index, inside = compute_edge_index(bin_variable.values, bin_edges)
+    index[~inside] = bin_centers.size
+    logger.info(f'Binning {np.count_nonzero(inside)} of {index.size} locations in ' +
+                f'{bin_centers.size} bins.')
+
+    # Loop over the templates
+    for collection in collections:
+        for group in groups:
+            for variable in variables:
+
+                if variable is not None:
+                    # Replace collection, group, variable in template
+                    [new_name, starting_field] = replace_cgv(logger, collection, group, variable,
+                                                             new_name_template,
+                                                             starting_field_template)
+                else:
+                    new_name = new_name_template
+                    starting_field = starting_field_template
+
+                # Get the variable to bin
+                cgv = split_collectiongroupvariable(logger, starting_field)
+                var_array = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+                if not set(location_dims).issubset(var_array.dims):
+                    logger.abort(f'Variable {starting_field} with dimensions {var_array.dims} ' +
+                                 f'does not have the dimensions of the bin variable ' +
+                                 f'{location_dims}.')
+
+                results = bin_data_array(var_array, location_dims, index, bin_shape, (bin_dim,),
+                                         statistics)
+
+                # Add a group for each statistic and the centers of the bins
+                cgv_new = split_collectiongroupvariable(logger, new_name)
+                variables_to_add = {}
+                for statistic in statistics:
+                    variables_to_add[cgv_new[1] + statistic + '::' + cgv_new[2]] = \
+                        results[statistic]
+
+                result = results[statistics[0]]
+                centers = DataArray(bin_centers, dims=(bin_dim,)).broadcast_like(result)
+                variables_to_add[cgv_new[1] + 'BinCenter::' + cgv_new[2]] = \
+                    centers.transpose(*result.dims).copy()
+
+                data_collections.add_variables_to_collection(cgv_new[0], variables_to_add)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -10,16 +10,224 @@
 # --------------------------------------------------------------------------------------------------
 
 
-from math import sqrt
 import re
-from statistics import mean
+
+import numpy as np
+import xarray as xr
 
 from eva.utilities.config import get
 from eva.utilities.logger import Logger
 from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
 from eva.transforms.transform_utils import replace_cgv
-from eva.utilities.utils import remove_list_duplicates
-from eva.utilities.utils import remove_empty_from_list_of_strings
+from eva.utilities.parallel import get_number_of_workers, parallel_map
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Statistics computed from the count, sums and extrema of a single pass over the data
+moment_statistics = ['Mean', 'Std', 'Var', 'Sum', 'Count', 'Min', 'Max', 'RMS']
+
+# Statistics computed from order statistics, e.g. Percentile95
+order_statistic_pattern = re.compile(r'^(Median|Percentile(\d+(?:\.\d+)?))$')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_statistic_quantile(statistic, logger):
+
+    """
+    Get the quantile of an order statistic.
+
+    Args:
+        statistic (str): The statistic, Median or PercentileN with N between 0 and 100.
+        logger (Logger): An instance of the logger for logging messages.
+
+    Returns:
+        float: The quantile between 0 and 1, None if the statistic is not an order statistic.
+    """
+
+    match = order_statistic_pattern.match(statistic)
+    if match is None:
+        return None
+    if match.group(1) == 'Median':
+        return 0.5
+
+    percentile = float(match.group(2))
+    logger.assert_abort(percentile <= 100, f'The statistic \'{statistic}\' must be a ' +
+                        'percentile between 0 and 100.')
+    return percentile / 100
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def check_statistics(statistics, logger):
+
+    """
+    Check that each statistic can be computed, before any of them is computed.
+
+    Statistics other than the moment and order statistics are computed by the xarray reduction of
+    the same name in lower case, e.g. Prod.
+
+    Args:
+        statistics (list): Names of the statistics.
+        logger (Logger): An instance of the logger for logging messages.
+    """
+
+    for statistic in statistics:
+        if statistic in moment_statistics or get_statistic_quantile(statistic, logger) is not None:
+            continue
+        logger.assert_abort(callable(getattr(xr.DataArray, statistic.lower(), None)),
+                            f'The statistic \'{statistic}\' is not supported. Supported ' +
+                            f'statistics are {", ".join(moment_statistics)}, Median, ' +
+                            'PercentileN and the reductions of xarray DataArrays.')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_order_statistics(values, valid, quantiles):
+
+    """
+    Compute quantiles of each column of an array with a partial sort of the valid values.
+
+    Each column is partitioned around the values needed, rather than sorted, and quantiles are
+    interpolated linearly between the closest values as numpy.percentile does.
+
+    Args:
+        values (ndarray): 2D array, the quantiles are computed along the first axis.
+        valid (ndarray): Boolean array of the values to use, None to use all the values.
+        quantiles (list): The quantiles, between 0 and 1.
+
+    Returns:
+        ndarray: Array of shape (len(quantiles), number of columns).
+    """
+
+    result_dtype = values.dtype if values.dtype.kind == 'f' else np.float64
+    results = np.full((len(quantiles), values.shape[1]), np.nan, dtype=result_dtype)
+
+    # Contiguous columns
+    columns = np.ascontiguousarray(values.T)
+    valid_columns = None if valid is None else np.ascontiguousarray(valid.T)
+
+    for column in range(values.shape[1]):
+        column_values = columns[column] if valid is None else \
+            columns[column][valid_columns[column]]
+        count = column_values.size
+        if count == 0:
+            continue
+
+        positions = [(count - 1) * quantile for quantile in quantiles]
+        lower = [int(np.floor(position)) for position in positions]
+        upper = [int(np.ceil(position)) for position in positions]
+        partitioned = np.partition(column_values, sorted(set(lower + upper)))
+
+        for ind, (position, low, high) in enumerate(zip(positions, lower, upper)):
+            low_value = partitioned[low].astype(result_dtype)
+            high_value = partitioned[high].astype(result_dtype)
+            if quantiles[ind] == 0.5:
+                # Median as the mean of the two middle values
+                results[ind, column] = (low_value + high_value) / 2
+            else:
+                results[ind, column] = low_value + (high_value - low_value) * (position - low)
+
+    return results
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_statistics(data_array, stat_dim, statistics, logger):
+
+    """
+    Compute statistics of a DataArray along a dimension in a fused pass.
+
+    The count, sum, sum of squares, minimum and maximum are each accumulated once and shared by
+    all the moment statistics, and the order statistics (Median, PercentileN) share a single
+    partial sort of each column. Missing (NaN) values are skipped. Other statistics are computed
+    by the xarray reduction of the same name in lower case.
+
+    Args:
+        data_array (DataArray): The data.
+        stat_dim (str): The dimension the statistics are computed along.
+        statistics (list): Names of the statistics, e.g. Mean, Std, Var, Sum, Count, Median, Min,
+                           Max, RMS, Percentile95 or Prod.
+        logger (Logger): An instance of the logger for logging messages.
+
+    Returns:
+        dict: DataArray of each statistic, without the statistic dimension.
+    """
+
+    if stat_dim not in data_array.dims:
+        logger.abort(f'The statistic dimension \'{stat_dim}\' is not a dimension of ' +
+                     f'\'{data_array.name}\', dimensions are {data_array.dims}.')
+
+    # Arrange the data as (stat_dim, everything else)
+    axis = data_array.get_axis_num(stat_dim)
+    values = np.moveaxis(data_array.data, axis, 0)
+    out_shape = values.shape[1:]
+    values = values.reshape(values.shape[0], -1)
+
+    float_data = values.dtype.kind == 'f'
+    result_dtype = values.dtype if float_data else np.float64
+    valid = ~np.isnan(values) if float_data else None
+
+    results = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        count = np.count_nonzero(valid, axis=0) if float_data else \
+            np.full(values.shape[1], values.shape[0], dtype=np.int64)
+        results['Count'] = count
+
+        # Moments from a single accumulation of the sums, in double precision
+        if any(statistic in ['Mean', 'Std', 'Var', 'Sum', 'RMS'] for statistic in statistics):
+            filled = np.zeros(values.shape, dtype=np.float64)
+            np.copyto(filled, values, where=valid if float_data else True)
+            total = np.add.reduce(filled, axis=0)
+            # Sums of integers stay integers, as for the xarray reduction
+            results['Sum'] = total if float_data else np.add.reduce(values, axis=0, dtype=np.int64)
+            mean = total / count
+            results['Mean'] = mean
+
+            if any(statistic in ['Std', 'Var', 'RMS'] for statistic in statistics):
+                # Sum of squares, accumulated without a squared copy of the data
+                mean_square = np.einsum('ij,ij->j', filled, filled) / count
+                results['RMS'] = np.sqrt(mean_square)
+                results['Var'] = np.maximum(mean_square - mean * mean, 0)
+                results['Std'] = np.sqrt(results['Var'])
+
+        if 'Min' in statistics:
+            results['Min'] = np.fmin.reduce(values, axis=0)
+        if 'Max' in statistics:
+            results['Max'] = np.fmax.reduce(values, axis=0)
+
+    # Order statistics from a single partial sort of each column
+    quantiles = {statistic: get_statistic_quantile(statistic, logger) for statistic in statistics}
+    quantiles = {statistic: quantile for statistic, quantile in quantiles.items()
+                 if quantile is not None}
+    if quantiles:
+        order_results = compute_order_statistics(values, valid, list(quantiles.values()))
+        results.update(zip(quantiles, order_results))
+
+    # DataArrays without the statistic dimension
+    dims = [dim for dim in data_array.dims if dim != stat_dim]
+    coords = {name: coord for name, coord in data_array.coords.items()
+              if stat_dim not in coord.dims}
+
+    data_arrays = {}
+    for statistic in statistics:
+        if statistic not in results:
+            # Any other reduction of xarray
+            data_arrays[statistic] = getattr(data_array, statistic.lower())(dim=stat_dim)
+            continue
+        result = results[statistic]
+        if statistic in ['Mean', 'Std', 'Var', 'RMS'] or statistic == 'Sum' and float_data:
+            result = result.astype(result_dtype, copy=False)
+        data_arrays[statistic] = xr.DataArray(result.reshape(out_shape), dims=dims,
+                                              coords=coords, attrs=data_array.attrs)
+
+    return data_arrays
 
 
 # --------------------------------------------------------------------------------------------------
@@ -40,7 +248,9 @@ def channel_stats(config, data_collections):
     This function calculates statistical measures for specified channel data variables within the
     provided data collections. It iterates over the specified collections, groups, and variables,
     and calculates statistical measures as defined in the 'statistic list' expressions within the
-    configuration. The resulting variables are added to the data collections.
+    configuration. All the statistics of a variable are computed in a fused pass over its data,
+    Median and PercentileN (e.g. Percentile95) from a partial sort, and the variables are
+    processed concurrently. The resulting variables are added to the data collections.
 
     Example:
         ::
@@ -50,7 +260,7 @@ def channel_stats(config, data_collections):
                     'groups': [...],
                     'variables': [...],
                     'variable_name': 'data_variable',
-                    'statistic list': ['Mean', 'Std', 'Count'],
+                    'statistic list': ['Mean', 'Std', 'Count', 'RMS', 'Percentile95'],
                     'statistic_dimension': 'Location'
                 }
                 channel_stats(config, data_collections)
@@ -64,6 +274,7 @@ def channel_stats(config, data_collections):
         stat_functions = get(config, logger, 'statistic list')
     else:
         stat_functions = ['Mean', 'Std', 'Count', 'Median', 'Min', 'Max']
+    check_statistics(stat_functions, logger)
 
     # Parse the for dictionary
     [collections, groups, variables] = parse_for_dict(config, logger)
@@ -75,6 +286,7 @@ def channel_stats(config, data_collections):
     stat_dim = get(config, logger, 'statistic_dimension', 'Location')
 
     # Loop over the templates
+    variable_names = []
     for collection in collections:
         for group in groups:
             for variable in variables:
@@ -84,17 +296,42 @@ def channel_stats(config, data_collections):
                 # Replace collection, group, variable in template
                 [variable_name] = replace_cgv(logger, collection, group, variable,
                                               variable_name_template)
+                variable_names.append(variable_name)
+
+    # Variables are processed concurrently, unless one of them is a statistic of another
+    new_names = set()
+    for variable_name in variable_names:
+        cgv = split_collectiongroupvariable(logger, variable_name)
+        new_names.update(f'{cgv[0]}::{cgv[1]}{stat_function}::{cgv[2]}'
+                         for stat_function in stat_functions)
+    if new_names.intersection(variable_names):
+        batches = [[variable_name] for variable_name in variable_names]
+    else:
+        batches = [variable_names]
+
+    number_of_workers = get_number_of_workers(config, logger, len(variable_names))
+
+    for batch in batches:
+
+        # Extract the data from the collections
+        arguments_list = []
+        for variable_name in batch:
+            cgv = split_collectiongroupvariable(logger, variable_name)
+            exp_var_data = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+            arguments_list.append((exp_var_data, stat_dim, stat_functions, logger))
+
+        # Compute the statistics of all the variables
+        batch_results = parallel_map(compute_statistics, arguments_list, number_of_workers)
+
+        # Add the new fields to the data collections
+        collection_variables = {}
+        for variable_name, results in zip(batch, batch_results):
+            cgv = split_collectiongroupvariable(logger, variable_name)
+            for stat_function in stat_functions:
+                collection_variables.setdefault(cgv[0], {})[
+                    cgv[1] + stat_function + '::' + cgv[2]] = results[stat_function]
 
-                # Extract the data from the collections
-                cgv = split_collectiongroupvariable(logger, variable_name)
-                exp_var_data = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
-
-                for stat_function in stat_functions:
-                    function_name = getattr(exp_var_data, stat_function.lower())
-                    result = function_name(dim=stat_dim)
-                    # Add the new field to the data collections
-                    cgv = split_collectiongroupvariable(logger, variable_name)
-                    data_collections.add_variable_to_collection(cgv[0], cgv[1]+stat_function,
-                                                                cgv[2], result)
+        for collection_name, variables_to_add in collection_variables.items():
+            data_collections.add_variables_to_collection(collection_name, variables_to_add)
 
 # --------------------------------------------------------------------------------------------------
@@ -0,0 +1,455 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import ast
+import re
+from typing import NamedTuple
+
+import numpy as np
+import xarray as xr
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Operators and functions allowed in expressions
+binary_operators = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+}
+
+unary_operators = {
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+}
+
+functions = {
+    'log': np.log,
+    'sqrt': np.sqrt,
+}
+
+# Comparisons and logical operators allowed in conditions
+comparison_operators = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.In: np.isin,
+    ast.NotIn: lambda values, test_values: np.isin(values, test_values, invert=True),
+}
+
+boolean_operators = {
+    ast.And: np.logical_and,
+    ast.Or: np.logical_or,
+}
+
+keywords = {'and', 'or', 'not', 'in'}
+
+# Numeric literals, including exponents
+number_pattern = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# Tokens of an expression: quoted strings, numbers or collection::group::variable names, which
+# can start with a digit
+expression_token_pattern = re.compile(r'\'[^\']*\'|"[^"]*"|' +
+                                      number_pattern.pattern + r'(?![\w:])|' +
+                                      r'[^()\[\]\-*+/,<>=!\s]+')
+
+# Expressions already compiled by this process, keyed by the expression with placeholder names
+compiled_expression_memo = {}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+class CompiledExpression(NamedTuple):
+
+    """
+    An expression parsed into a validated syntax tree.
+
+    Attributes:
+        names (list): The collection::group::variable names used, in order of first appearance.
+        tree (ast.Expression): Syntax tree of the expression, the names are replaced by
+                               placeholders v0, v1, ... indexing into names.
+    """
+
+    names: list
+    tree: ast.Expression
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compile_expression(expression, logger, condition=False):
+
+    """
+    Parse an arithmetic expression or a condition once into a validated syntax tree.
+
+    Names are taken to be anything between the operators + - * / ( ) that is not a number, a
+    quoted string, a function or a keyword. Only numbers, names, the + - * / ** operators and the
+    log and sqrt functions are allowed. Conditions can also use the comparisons == != < <= > >=,
+    the and, or, not operators and 'in' or 'not in' a list of values, e.g.
+    'exp::EffectiveQC::t in [0, 1] and exp::ObsValue::t > 200'.
+
+    Args:
+        expression (str): The expression, e.g. 'exp::ObsValue::t - exp::hofx::t'.
+        logger (Logger): An instance of the logger for logging messages.
+        condition (bool, optional): Whether the expression is a condition evaluating to a boolean
+                                    mask. Default is False.
+
+    Returns:
+        CompiledExpression: The names used and the syntax tree of the expression.
+    """
+
+    # Replace the names by placeholders
+    names = []
+
+    def placeholder(match):
+        token = match.group(0)
+        if token in functions or token in keywords or token[0] in '\'"' or \
+                number_pattern.fullmatch(token):
+            return token
+        if token not in names:
+            names.append(token)
+        return f'v{names.index(token)}'
+
+    placeholder_expression = expression_token_pattern.sub(placeholder, expression.strip())
+
+    # Parse and validate the expression once for all the names it can be used with
+    tree = compiled_expression_memo.get((placeholder_expression, condition))
+    if tree is None:
+        try:
+            tree = ast.parse(placeholder_expression, mode='eval')
+        except SyntaxError:
+            logger.abort(f'Unable to parse the expression \'{expression}\'.')
+
+        if condition and not isinstance(tree.body, (ast.Compare, ast.BoolOp)) and \
+                not (isinstance(tree.body, ast.UnaryOp) and isinstance(tree.body.op, ast.Not)):
+            logger.abort(f'The expression \'{expression}\' is not a condition. Conditions ' +
+                         'compare values, e.g. \'exp::EffectiveQC::t == 0\'.')
+
+        # Lists of values are only allowed as the right side of 'in'
+        value_lists = set()
+        if condition:
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Compare):
+                    value_lists.update(id(comparator) for op, comparator in
+                                       zip(node.ops, node.comparators)
+                                       if isinstance(op, (ast.In, ast.NotIn)))
+
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Expression, ast.expr_context, ast.operator, ast.unaryop)):
+                continue
+            elif isinstance(node, ast.BinOp) and type(node.op) in binary_operators:
+                continue
+            elif isinstance(node, ast.UnaryOp) and type(node.op) in unary_operators:
+                continue
+            elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and \
+                    not isinstance(node.value, bool):
+                continue
+            elif isinstance(node, ast.Name) and (node.id in functions or
+                                                 node.id[1:] in map(str, range(len(names)))):
+                continue
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+                    node.func.id in functions and len(node.args) == 1 and not node.keywords:
+                continue
+            elif condition:
+                if isinstance(node, (ast.cmpop, ast.boolop)):
+                    continue
+                elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+                    continue
+                elif isinstance(node, ast.Compare) and \
+                        all(type(op) in comparison_operators for op in node.ops):
+                    continue
+                elif isinstance(node, ast.BoolOp) and type(node.op) in boolean_operators:
+                    continue
+                elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+                    continue
+                elif isinstance(node, (ast.List, ast.Tuple)) and id(node) in value_lists and \
+                        all(isinstance(elt, (ast.Constant, ast.UnaryOp)) for elt in node.elts):
+                    continue
+                logger.abort(f'The condition \'{expression}\' contains ' +
+                             f'\'{ast.unparse(node)}\' which is not supported. Conditions can ' +
+                             'contain arithmetic expressions, the comparisons == != < <= > >=, ' +
+                             'the and, or, not operators and \'in\' a list of values.')
+            logger.abort(f'The expression \'{expression}\' contains \'{ast.unparse(node)}\' ' +
+                         'which is not supported. Expressions can contain numbers, variables, ' +
+                         'the + - * / ** operators and the functions ' +
+                         f'{", ".join(functions)}.')
+
+        compiled_expression_memo[(placeholder_expression, condition)] = tree
+
+    return CompiledExpression(names, tree)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def can_write_result(operator, target, operands):
+
+    """
+    Check whether the result of an operation can be written into one of its operands.
+
+    The type of the result is resolved by the operator itself, on empty operands, so that e.g.
+    the division of integers, whose result is floating, is never written into an integer array.
+
+    Args:
+        operator (np.ufunc): The operator of the operation.
+        target: The operand the result would be written into.
+        operands (list): All the operands of the operation, in order, including target.
+
+    Returns:
+        bool: True if target is an array with the shape and type of the result.
+    """
+
+    if not isinstance(target, np.ndarray) or not target.flags.writeable:
+        return False
+    if np.broadcast_shapes(*[np.shape(operand) for operand in operands]) != target.shape:
+        return False
+
+    # Arrays are replaced by empty arrays of their type, scalars keep their value as it can
+    # take part in the type resolution
+    empty_operands = [np.empty(0, dtype=operand.dtype) if np.ndim(operand) > 0 else operand
+                      for operand in operands]
+    return operator(*empty_operands).dtype == target.dtype
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def evaluate_node(node, arrays):
+
+    """
+    Evaluate a node of a compiled expression.
+
+    Intermediate results are owned by the evaluation, so later operations write into them in
+    place rather than allocating a new array for every operation.
+
+    Args:
+        node (ast.AST): The node to evaluate.
+        arrays (list): The numpy array of each name of the expression.
+
+    Returns:
+        tuple: The value of the node and whether it is an intermediate array that can be reused.
+    """
+
+    if isinstance(node, ast.Constant):
+        return node.value, False
+
+    if isinstance(node, ast.Name):
+        return arrays[int(node.id[1:])], False
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        value, owned = evaluate_node(node.operand, arrays)
+        out = value if owned and value.dtype == bool else None
+        result = np.logical_not(value, out=out)
+        return result, isinstance(result, np.ndarray)
+
+    if isinstance(node, ast.UnaryOp):
+        value, owned = evaluate_node(node.operand, arrays)
+        operator = unary_operators[type(node.op)]
+        out = value if owned and can_write_result(operator, value, [value]) else None
+        result = operator(value, out=out)
+        return result, isinstance(result, np.ndarray)
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return np.array([evaluate_node(elt, arrays)[0] for elt in node.elts]), False
+
+    if isinstance(node, ast.Compare):
+        # Chained comparisons, e.g. 0 < a < 10, hold where each of the comparisons holds
+        left, _ = evaluate_node(node.left, arrays)
+        result = None
+        for op, comparator in zip(node.ops, node.comparators):
+            right, _ = evaluate_node(comparator, arrays)
+            comparison = comparison_operators[type(op)](left, right)
+            result = comparison if result is None else \
+                np.logical_and(result, comparison, out=result if
+                               can_write_result(np.logical_and, result,
+                                                [result, comparison]) else None)
+            left = right
+        return result, isinstance(result, np.ndarray)
+
+    if isinstance(node, ast.BoolOp):
+        operator = boolean_operators[type(node.op)]
+        result, owned = evaluate_node(node.values[0], arrays)
+        for value_node in node.values[1:]:
+            value, value_owned = evaluate_node(value_node, arrays)
+            out = None
+            if owned and can_write_result(operator, result, [result, value]):
+                out = result
+            elif value_owned and can_write_result(operator, value, [result, value]):
+                out = value
+            result = operator(result, value, out=out)
+            owned = isinstance(result, np.ndarray)
+        return result, owned
+
+    if isinstance(node, ast.Call):
+        value, owned = evaluate_node(node.args[0], arrays)
+        function = functions[node.func.id]
+        out = value if owned and can_write_result(function, value, [value]) else None
+        result = function(value, out=out)
+        return result, isinstance(result, np.ndarray)
+
+    left, left_owned = evaluate_node(node.left, arrays)
+    right, right_owned = evaluate_node(node.right, arrays)
+    operator = binary_operators[type(node.op)]
+
+    out = None
+    if left_owned and can_write_result(operator, left, [left, right]):
+        out = left
+    elif right_owned and can_write_result(operator, right, [left, right]):
+        out = right
+
+    result = operator(left, right, out=out)
+    return result, isinstance(result, np.ndarray)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def evaluate_expression(compiled, arrays):
+
+    """
+    Evaluate a compiled expression on numpy arrays with numpy broadcasting.
+
+    Args:
+        compiled (CompiledExpression): The compiled expression.
+        arrays (list): The numpy array of each name of the expression, in the order of names.
+
+    Returns:
+        The value of the expression.
+    """
+
+    return evaluate_node(compiled.tree.body, arrays)[0]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def evaluate_expression_data_arrays(compiled, data_arrays):
+
+    """
+    Evaluate a compiled expression on DataArrays.
+
+    The DataArrays are aligned and broadcast by dimension name as xarray arithmetic would, once,
+    and the expression is then evaluated on the underlying arrays. The result keeps the
+    attributes of the DataArrays that do not conflict between them.
+
+    Args:
+        compiled (CompiledExpression): The compiled expression.
+        data_arrays (list): The DataArray of each name of the expression, in the order of names.
+
+    Returns:
+        DataArray: The value of the expression.
+    """
+
+    template = data_arrays[0]
+    if any(da.dims != template.dims or da.shape != template.shape or
+           any(not da.indexes[dim].equals(template.indexes[dim]) for dim in da.indexes)
+           for da in data_arrays[1:]) or \
+            any(set(da.indexes) != set(template.indexes) for da in data_arrays[1:]):
+        data_arrays = xr.broadcast(*xr.align(*data_arrays, join='inner'))
+        template = data_arrays[0]
+
+    result = evaluate_expression(compiled, [da.data for da in data_arrays])
+    result = np.broadcast_to(result, template.shape) if np.ndim(result) == 0 else result
+
+    return xr.DataArray(result, dims=template.dims, coords=template.coords,
+                        attrs=merge_attrs(data_arrays))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def merge_attrs(data_arrays):
+
+    """
+    Merge the attributes of the operands of an expression, dropping those that conflict.
+
+    Args:
+        data_arrays (list): The DataArrays of the expression.
+
+    Returns:
+        dict: The merged attributes.
+    """
+
+    attrs = {}
+    conflicts = set()
+    for da in data_arrays:
+        for key, value in da.attrs.items():
+            if key in attrs and not np.array_equal(attrs[key], value):
+                conflicts.add(key)
+            attrs.setdefault(key, value)
+
+    return {key: value for key, value in attrs.items() if key not in conflicts}
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def evaluate_expression_batch(compiled, data_arrays_list):
+
+    """
+    Evaluate a compiled expression once for a batch of sets of DataArrays.
+
+    Sets whose DataArrays all have the same dimensions, shape and indexes, and the same type for
+    each name of the expression, are evaluated together. The DataArrays for each name are stacked
+    into one (batch, ...) block, the expression is evaluated once with numpy broadcasting and each
+    result is a view of the block. Other sets are evaluated on their own.
+
+    Args:
+        compiled (CompiledExpression): The compiled expression, all the sets share its tree.
+        data_arrays_list (list): The DataArrays of each set, in the order of names.
+
+    Returns:
+        list: The value of the expression for each set of DataArrays.
+    """
+
+    # Group the sets that can be stacked
+    stacks = {}
+    for ind, data_arrays in enumerate(data_arrays_list):
+        template = data_arrays[0]
+        if all(da.dims == template.dims and da.shape == template.shape and
+               da.indexes.keys() == template.indexes.keys() for da in data_arrays):
+            key = (template.dims, template.shape, tuple(da.dtype for da in data_arrays))
+        else:
+            key = ind
+        stacks.setdefault(key, []).append(ind)
+
+    results = [None] * len(data_arrays_list)
+    for stack in stacks.values():
+
+        template = data_arrays_list[stack[0]][0]
+        stack_sets = [data_arrays_list[ind] for ind in stack]
+        if len(stack) == 1 or not all(da.indexes[dim].equals(template.indexes[dim])
+                                      for data_arrays in stack_sets for da in data_arrays
+                                      for dim in da.indexes):
+            for ind, data_arrays in zip(stack, stack_sets):
+                results[ind] = evaluate_expression_data_arrays(compiled, data_arrays)
+            continue
+
+        blocks = [np.stack([data_arrays[name_ind].data for data_arrays in stack_sets])
+                  for name_ind in range(len(compiled.names))]
+        result = evaluate_expression(compiled, blocks)
+        result = np.broadcast_to(result, blocks[0].shape) if np.ndim(result) == 0 else result
+
+        for block_ind, (ind, data_arrays) in enumerate(zip(stack, stack_sets)):
+            results[ind] = xr.DataArray(result[block_ind], dims=template.dims,
+                                        coords=template.coords, attrs=merge_attrs(data_arrays))
+
+    return results
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,235 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+import pandas as pd
+
+from eva.transforms.transform_utils import split_collectiongroupvariable
+from eva.utilities.config import get
+from eva.utilities.logger import Logger
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Supported types of join
+join_types = ['inner', 'left', 'outer']
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def build_key_index(key_arrays):
+
+    """
+    Build a hash index of the keys of the locations of a collection.
+
+    Args:
+        key_arrays (list): One array of values per key variable, all of the same length.
+
+    Returns:
+        tuple: The pandas index of the keys and a boolean array of the locations whose key has no
+               missing value.
+    """
+
+    valid = np.ones(len(key_arrays[0]), dtype=bool)
+    for key_array in key_arrays:
+        valid &= ~pd.isna(key_array)
+
+    if len(key_arrays) == 1:
+        index = pd.Index(key_arrays[0])
+    else:
+        index = pd.MultiIndex.from_arrays(key_arrays)
+
+    return index, valid
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def join_locations(left_keys, right_keys, how, logger):
+
+    """
+    Join the locations of two collections on their keys.
+
+    The keys of the right collection are hashed once and all the keys of the left collection are
+    looked up in a single vectorized call, so the join is linear in the number of locations.
+    Locations with a missing key value are never matched, and only the first of locations with the
+    same key is matched. Unmatched locations are dropped by an inner join and kept by the others.
+
+    Args:
+        left_keys (list): One array of values per key variable for the left collection.
+        right_keys (list): One array of values per key variable for the right collection.
+        how (str): 'inner' keeps the matched locations, 'left' all the locations of the left
+                   collection and 'outer' also the unmatched locations of the right collection.
+        logger (Logger): An instance of the logger for logging messages.
+
+    Returns:
+        tuple: Index of the left and right location of each joined location, -1 where the
+               location is missing from that collection.
+    """
+
+    left_index, left_valid = build_key_index(left_keys)
+    right_index, right_valid = build_key_index(right_keys)
+
+    # Locations used in the join, the first of each key
+    left_used = left_valid & ~left_index.duplicated(keep='first')
+    right_used = right_valid & ~right_index.duplicated(keep='first')
+    for side, valid, used in [('first', left_valid, left_used),
+                              ('second', right_valid, right_used)]:
+        duplicates = np.count_nonzero(valid & ~used)
+        if duplicates:
+            logger.info(f'Warning: {duplicates} locations of the {side} collection have the ' +
+                        'same key as an earlier location and are not matched.')
+
+    left_locations = np.flatnonzero(left_used)
+    right_locations = np.flatnonzero(right_used)
+
+    # Position of each left key in the right keys
+    matches = right_index[right_locations].get_indexer(left_index[left_locations])
+    matched = matches >= 0
+
+    if how == 'inner':
+        left_take = left_locations[matched]
+        right_take = right_locations[matches[matched]]
+    else:
+        # Every location of the left collection, in order
+        left_take = np.arange(len(left_used))
+        right_take = np.full(len(left_used), -1, dtype=np.int64)
+        right_take[left_locations[matched]] = right_locations[matches[matched]]
+
+        if how == 'outer':
+            # Followed by the locations of the right collection that are not matched
+            right_matched = np.zeros(len(right_used), dtype=bool)
+            right_matched[right_take[right_take >= 0]] = True
+            right_only = np.flatnonzero(~right_matched)
+            left_take = np.concatenate((left_take, np.full(right_only.size, -1, dtype=np.int64)))
+            right_take = np.concatenate((right_take, right_only))
+
+    return left_take, right_take
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def take_locations(dataset, dimension, take):
+
+    """
+    Select locations of a collection, inserting missing values where the index is -1.
+
+    Args:
+        dataset (Dataset): The collection.
+        dimension (str): The location dimension.
+        take (np.ndarray): Index of the location to take for each joined location, -1 for a
+                           missing location.
+
+    Returns:
+        Dataset: The collection along the joined locations. Variables without the location
+                 dimension are unchanged.
+    """
+
+    # Reindexing by position keeps the types when all the locations are present and promotes
+    # them (e.g. integers to floats) to hold missing values otherwise
+    positions = dataset.drop_vars(dimension, errors='ignore')
+    positions = positions.assign_coords({dimension: np.arange(dataset.sizes[dimension])})
+    joined = positions.reindex({dimension: take})
+
+    return joined.drop_vars(dimension)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def join_collections(config, data_collections):
+
+    """
+    Joins two collections on the values of key variables so that their locations are aligned.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        data_collections (DataCollections): An instance of the DataCollections class containing
+        input data.
+
+    Returns:
+        None
+
+    This function matches the locations of two collections (e.g. a control and an experiment
+    whose QC or thinning differ) by the values of key variables, such as the station
+    identification, date and time and rounded latitude and longitude, or a sequence number. Two
+    new collections are added, with all the variables of each input collection along the joined
+    locations, so that variables of the two can be compared location by location. Missing
+    locations of an outer or left join are filled with missing values.
+
+    Example:
+        ::
+
+                config = {
+                    'collections': ['control', 'experiment'],
+                    'keys': ['MetaData::stationIdentification', 'MetaData::dateTime',
+                             'MetaData::latitude', 'MetaData::longitude'],
+                    'key_decimals': {'MetaData::latitude': 2, 'MetaData::longitude': 2},
+                    'how': 'inner',
+                    'new_collection_names': ['control_joined', 'experiment_joined'],
+                    'dimension': 'Location'
+                }
+                join_collections(config, data_collections)
+    """
+
+    # Create a logger
+    logger = Logger('JoinCollectionsTransform')
+
+    # Parse config
+    collections = get(config, logger, 'collections')
+    new_collection_names = get(config, logger, 'new_collection_names')
+    keys = get(config, logger, 'keys')
+    key_decimals = get(config, logger, 'key_decimals', {})
+    how = get(config, logger, 'how', 'inner')
+    dimension = get(config, logger, 'dimension', 'Location')
+
+    logger.assert_abort(len(collections) == 2 and len(new_collection_names) == 2,
+                        'join collections needs two collections and two new collection names, ' +
+                        f'found {collections} and {new_collection_names}.')
+    logger.assert_abort(how in join_types, f'The join \'{how}\' is not supported. Supported ' +
+                        f'joins are {join_types}.')
+    if isinstance(keys, str):
+        keys = [keys]
+
+    # Values of the keys of each collection
+    collection_keys = []
+    for collection in collections:
+        key_arrays = []
+        for key in keys:
+            cgv = split_collectiongroupvariable(logger, f'{collection}::{key}')
+            key_array = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+            logger.assert_abort(key_array.dims == (dimension,), f'The key \'{key}\' of ' +
+                                f'collection \'{collection}\' must have the single dimension ' +
+                                f'\'{dimension}\', found {key_array.dims}.')
+            key_values = key_array.values
+            if key in key_decimals:
+                key_values = np.round(key_values, int(key_decimals[key]))
+            key_arrays.append(key_values)
+        collection_keys.append(key_arrays)
+
+    # Join the locations
+    left_take, right_take = join_locations(collection_keys[0], collection_keys[1], how, logger)
+    logger.info(f'Joined {left_take.size} locations of \'{collections[0]}\' and ' +
+                f'\'{collections[1]}\', {np.count_nonzero((left_take >= 0) & (right_take >= 0))} ' +
+                'are in both.')
+
+    # Add the aligned collections
+    for collection, new_collection_name, take in zip(collections, new_collection_names,
+                                                     [left_take, right_take]):
+        dataset = data_collections.get_data_collection(collection)
+        data_collections.create_or_add_to_collection(new_collection_name,
+                                                     take_locations(dataset, dimension, take))
+
+
+# --------------------------------------------------------------------------------------------------
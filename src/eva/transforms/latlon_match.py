@@ -7,12 +7,77 @@
 # which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
 
 import numpy as np
-from xarray import Dataset, DataArray
+from scipy.spatial import cKDTree
 from eva.utilities.config import get
 from eva.utilities.logger import Logger
+from eva.utilities.parallel import get_number_of_workers
+from eva.transforms.regrid import lonlat_to_xyz
 from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
 
 
+# Mean radius of the Earth in kilometres
+earth_radius_km = 6371.0
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def match_locations(base_lat, base_lon, match_lat, match_lon, max_distance_km=None,
+                    number_of_workers=1):
+
+    """
+    Find the nearest base location of each match location.
+
+    The base locations are indexed once in a KD-tree on the unit sphere, so distances are great
+    circle distances that are unaffected by the dateline or the poles, and all the match locations
+    are queried in a single vectorized call.
+
+    Args:
+        base_lat (np.ndarray): Latitudes of the base locations in degrees.
+        base_lon (np.ndarray): Longitudes of the base locations in degrees.
+        match_lat (np.ndarray): Latitudes of the locations to match in degrees.
+        match_lon (np.ndarray): Longitudes of the locations to match in degrees.
+        max_distance_km (float, optional): Locations with no base location within this distance
+                                           are not matched. Default is None, no limit.
+        number_of_workers (int, optional): Number of threads querying the tree. Default is 1.
+
+    Returns:
+        np.ndarray: Index of the nearest base location of each match location, -1 if it is not
+                    matched.
+    """
+
+    base_xyz = lonlat_to_xyz(base_lon, base_lat)
+    match_xyz = lonlat_to_xyz(match_lon, match_lat)
+
+    # Locations with missing coordinates are never matched
+    base_valid = np.isfinite(base_xyz).all(axis=1)
+    base_index = np.flatnonzero(base_valid)
+    match_valid = np.isfinite(match_xyz).all(axis=1)
+
+    # Maximum distance as a chord through the unit sphere
+    upper_bound = np.inf
+    if max_distance_km is not None:
+        upper_bound = 2.0 * np.sin(min(max_distance_km / (2.0 * earth_radius_km), np.pi / 2))
+
+    matching_index = np.full(match_xyz.shape[0], -1, dtype=np.int64)
+    if base_index.size == 0:
+        return matching_index
+
+    tree = cKDTree(base_xyz[base_valid])
+    _, neighbour = tree.query(match_xyz[match_valid], distance_upper_bound=upper_bound,
+                              workers=number_of_workers)
+
+    # The tree returns its size for locations without a neighbour within the bound
+    found = neighbour < base_index.size
+    matched = np.flatnonzero(match_valid)[found]
+    matching_index[matched] = base_index[neighbour[found]]
+
+    return matching_index
+
+
+# --------------------------------------------------------------------------------------------------
+
+
 def latlon_match(config, data_collections):
 
     """
@@ -27,12 +92,16 @@ def latlon_match(config, data_collections):
         None
 
     This function applies lat/lon matching to variables in the base collection. A new collection
-    with matched variables is added to the data collection.
+    with matched variables is added to the data collection. Each location of the collection to
+    match to takes the values of the nearest base location on the sphere, found with a KD-tree.
 
     base collection: collection to perform the latlon matching on
     base_latlon: the collection with lat/lon coordiates corresponding to base collection
     match_base_latlon_to: the collection with lat/lon coordinates corresponding to what you want to
     match the base latlon to.
+    max_distance_km: optional, locations with no base location within this distance are set to
+    missing (NaN).
+    number_of_workers: optional, number of threads querying the KD-tree.
 
     """
 
@@ -46,6 +115,7 @@ def latlon_match(config, data_collections):
     base_collection = get(config, logger, 'base_collection')
     base_latlon_name = get(config, logger, 'base_latlon')
     match_latlon_name = get(config, logger, 'match_base_latlon_to')
+    max_distance_km = get(config, logger, 'max_distance_km', None, False)
 
     # Extract collection and group
     cgv = split_collectiongroupvariable(logger, base_collection)
@@ -60,25 +130,35 @@ def latlon_match(config, data_collections):
     match_lon = data_collections.get_variable_data_array(match_latlon_name, 'MetaData',
                                                          'longitude').to_numpy()
 
-    # Find matching index (this can be updated using dask)
-    matching_index = []
-    for i in range(len(base_lat)):
-        matching_index.append((abs(base_lat - match_lat[i]) +
-                               abs(base_lon - match_lon[i])).argmin())
+    logger.assert_abort(len(base_lat) == len(match_lat), 'The collections \'' +
+                        f'{base_latlon_name}\' and \'{match_latlon_name}\' must have the same ' +
+                        f'number of locations, found {len(base_lat)} and {len(match_lat)}.')
+
+    # Find matching index
+    number_of_workers = get_number_of_workers(config, logger, len(match_lat))
+    matching_index = match_locations(base_lat, base_lon, match_lat, match_lon,
+                                     None if max_distance_km is None else float(max_distance_km),
+                                     number_of_workers)
+    unmatched = matching_index < 0
+    if unmatched.any():
+        logger.info(f'Warning: {np.count_nonzero(unmatched)} locations of ' +
+                    f'\'{match_latlon_name}\' have no location of \'{base_latlon_name}\' ' +
+                    f'within {max_distance_km} km, their values are set to missing.')
 
-    # Retrieve data collection from data collections
-    match_ds = data_collections.get_data_collection(cgv[0])
+    # Retrieve data collection from data collections, the base collection itself is not modified
+    match_ds = data_collections.get_data_collection(cgv[0]).copy(deep=False)
 
     # Loop through starting_dataset and update all variable arrays
-    update_ds_list = []
     for variable in variables:
         var_array = data_collections.get_variable_data_array(cgv[0], cgv[1], variable)
         var_values = var_array.values
 
         # Index data array with matching_index and then save to new collection
         var_values = var_values[matching_index]
-        var_array.values = var_values
-        match_ds[f'{cgv[1]}::{variable}'] = var_array
+        if unmatched.any():
+            var_values = var_values.astype(np.result_type(var_values.dtype, np.float32))
+            var_values[unmatched] = np.nan
+        match_ds[f'{cgv[1]}::{variable}'] = var_array.copy(data=var_values)
 
     # get new collection name
     new_collection_name = get(config, logger, 'new_collection_name')
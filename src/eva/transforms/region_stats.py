@@ -0,0 +1,354 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import numpy as np
+from xarray import DataArray
+
+from eva.transforms.bin_to_grid import bin_data_array, bin_statistics
+from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
+from eva.transforms.transform_utils import replace_cgv
+from eva.utilities.config import get
+from eva.utilities.logger import Logger
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Regions that can be used by name, boxes are [lon_min, lon_max, lat_min, lat_max] in degrees
+predefined_regions = {
+    'Global': {},
+    'NorthernExtratropics': {'box': [-180, 180, 20, 90]},
+    'Tropics': {'box': [-180, 180, -20, 20]},
+    'SouthernExtratropics': {'box': [-180, 180, -90, -20]},
+    'NorthernPolar': {'box': [-180, 180, 60, 90]},
+    'SouthernPolar': {'box': [-180, 180, -90, -60]},
+    'CONUS': {'box': [-125, -65, 25, 50]},
+}
+
+# Up to this number of regions the membership of a location is indexed by the bits of its index
+max_bit_regions = 16
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def wrap_longitude(lon):
+
+    """
+    Wrap longitudes into [-180, 180) degrees.
+
+    Args:
+        lon (np.ndarray): Longitudes in degrees.
+
+    Returns:
+        np.ndarray: The wrapped longitudes.
+    """
+
+    return np.mod(np.asarray(lon, dtype=np.float64) + 180.0, 360.0) - 180.0
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def points_in_polygon(lon, lat, polygon):
+
+    """
+    Find the points inside a polygon with the even-odd rule, one vectorized test per edge.
+
+    Only the points in the bounding box of the polygon are tested against its edges.
+
+    Args:
+        lon (np.ndarray): Longitudes of the points in [-180, 180) degrees.
+        lat (np.ndarray): Latitudes of the points in degrees.
+        polygon (list): [longitude, latitude] of the vertices in degrees.
+
+    Returns:
+        np.ndarray: Boolean array of the points inside the polygon.
+    """
+
+    vertices = np.asarray(polygon, dtype=np.float64)
+    vertex_lon = vertices[:, 0]
+    vertex_lat = vertices[:, 1]
+
+    inside = np.zeros(lon.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        candidates = np.flatnonzero((lon >= vertex_lon.min()) & (lon <= vertex_lon.max()) &
+                                    (lat >= vertex_lat.min()) & (lat <= vertex_lat.max()))
+    x = lon[candidates]
+    y = lat[candidates]
+
+    crossings = np.zeros(candidates.size, dtype=bool)
+    for x1, y1, x2, y2 in zip(vertex_lon, vertex_lat, np.roll(vertex_lon, -1),
+                              np.roll(vertex_lat, -1)):
+        if y1 == y2:
+            continue
+        # Edges crossing the horizontal line through the point, to the right of the point
+        straddles = (y1 > y) != (y2 > y)
+        crossings ^= straddles & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+
+    inside[candidates] = crossings
+
+    return inside
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_region_definitions(regions, logger):
+
+    """
+    Get the definition of each region of the configuration.
+
+    Args:
+        regions (list): Names of predefined regions or dictionaries with the name of the region and
+                        a box [lon_min, lon_max, lat_min, lat_max] or a polygon, a list of
+                        [longitude, latitude] vertices. A region without a box or polygon contains
+                        every location.
+        logger (Logger): An instance of the logger for logging messages.
+
+    Returns:
+        list: Dictionary with the name and definition of each region.
+    """
+
+    definitions = []
+    for region in regions:
+        if isinstance(region, str):
+            logger.assert_abort(region in predefined_regions, f'The region \'{region}\' is ' +
+                                'not predefined, predefined regions are ' +
+                                f'{list(predefined_regions)}.')
+            definition = dict(predefined_regions[region], name=region)
+        else:
+            definition = dict(region)
+            logger.assert_abort('name' in definition, f'The region {region} has no name.')
+
+        if 'box' in definition:
+            logger.assert_abort(len(definition['box']) == 4, f'The box of region ' +
+                                f'\'{definition["name"]}\' must be [lon_min, lon_max, lat_min, ' +
+                                'lat_max].')
+        if 'polygon' in definition:
+            logger.assert_abort(len(definition['polygon']) >= 3, f'The polygon of region ' +
+                                f'\'{definition["name"]}\' must have at least three vertices.')
+        definitions.append(definition)
+
+    names = [definition['name'] for definition in definitions]
+    logger.assert_abort(len(set(names)) == len(names), f'The regions {names} are not unique.')
+
+    return definitions
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_region_mask(lon, lat, definition):
+
+    """
+    Compute the mask of the locations in a region.
+
+    Boxes include their southern and western edges, and their northern edge at the north pole.
+    A box whose minimum longitude is larger than its maximum crosses the date line.
+
+    Args:
+        lon (np.ndarray): Longitudes of the locations in [-180, 180) degrees.
+        lat (np.ndarray): Latitudes of the locations in degrees.
+        definition (dict): Definition of the region, see get_region_definitions.
+
+    Returns:
+        np.ndarray: Boolean array of the locations in the region.
+    """
+
+    with np.errstate(invalid='ignore'):
+        mask = ~np.isnan(lon) & ~np.isnan(lat)
+
+        if 'box' in definition:
+            lon_min, lon_max, lat_min, lat_max = [float(bound) for bound in definition['box']]
+            mask &= lat >= lat_min
+            mask &= lat <= lat_max if lat_max >= 90.0 else lat < lat_max
+            if lon_max - lon_min < 360.0:
+                lon_min, lon_max = wrap_longitude([lon_min, lon_max])
+                if lon_max == -180.0:
+                    lon_max = 180.0
+                if lon_min < lon_max:
+                    mask &= (lon >= lon_min) & (lon < lon_max)
+                else:
+                    mask &= (lon >= lon_min) | (lon < lon_max)
+
+    if 'polygon' in definition:
+        mask &= points_in_polygon(lon, lat, definition['polygon'])
+
+    return mask
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_region_index(masks):
+
+    """
+    Index the regions each location belongs to.
+
+    Locations belonging to the same regions share an index, so the statistics of all the regions
+    are accumulated with a single bincount over the index, even when the regions overlap.
+
+    Args:
+        masks (list): Boolean array of the locations in each region.
+
+    Returns:
+        tuple: Index of each location and the (number of indices, number of regions) membership
+               of the indices in the regions.
+    """
+
+    number_of_regions = len(masks)
+    codes = np.zeros(masks[0].shape, dtype=np.int64)
+    for bit, mask in enumerate(masks):
+        codes |= mask.astype(np.int64) << bit
+
+    if number_of_regions <= max_bit_regions:
+        # The bits of the index are the regions
+        index = codes
+        index_codes = np.arange(2 ** number_of_regions, dtype=np.int64)
+    else:
+        index_codes, index = np.unique(codes, return_inverse=True)
+
+    membership = (index_codes[:, np.newaxis] >> np.arange(number_of_regions)) & 1
+
+    return index.ravel(), membership.astype(np.float64)
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def region_stats(config, data_collections):
+
+    """
+    Computes statistics of variables in geographic regions.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        data_collections (DataCollections): An instance of the DataCollections class containing
+        input data.
+
+    Returns:
+        None
+
+    This function computes statistics of the values of variables in regions given by name (e.g.
+    Global, NorthernExtratropics, Tropics, SouthernExtratropics, NorthernPolar, SouthernPolar,
+    CONUS) or as a latitude/longitude box or polygon. The mask of each region is computed once
+    and kept by the data collections for later transforms. The regions of each location are
+    combined into a single index, and the statistics of every region and channel of a variable
+    are accumulated in one pass over its values. Each statistic is added to a group named after
+    the new group, the region and the statistic, for example ObsValueMinusHofxTropicsMean, with
+    the dimensions of channel_stats results.
+
+    Example:
+        ::
+
+                config = {
+                    'longitude': 'experiment::MetaData::longitude',
+                    'latitude': 'experiment::MetaData::latitude',
+                    'regions': ['Global', 'Tropics',
+                                {'name': 'NorthAtlantic', 'box': [-80, 0, 20, 60]},
+                                {'name': 'Triangle', 'polygon': [[0, 0], [10, 0], [0, 10]]}],
+                    'statistic list': ['Count', 'Mean', 'Std', 'RMS'],
+                    'new name': 'experiment::ObsValueMinusHofx::${variable}',
+                    'starting field': 'experiment::ObsValueMinusHofx::${variable}',
+                    'for': {'variable': ['airTemperature']}
+                }
+                region_stats(config, data_collections)
+    """
+
+    # Create a logger
+    logger = Logger('RegionStatsTransform')
+
+    # Parse the for dictionary
+    [collections, groups, variables] = parse_for_dict(config, logger)
+
+    # Parse config for the new collection/group/variable naming
+    new_name_template = get(config, logger, 'new name')
+    starting_field_template = get(config, logger, 'starting field')
+
+    statistics = get(config, logger, 'statistic list', ['Count', 'Mean', 'Std', 'RMS'])
+    for statistic in statistics:
+        logger.assert_abort(statistic in bin_statistics, f'The statistic \'{statistic}\' is ' +
+                            f'not supported. Supported statistics are {bin_statistics}.')
+
+    definitions = get_region_definitions(get(config, logger, 'regions'), logger)
+    region_names = [definition['name'] for definition in definitions]
+
+    # Locations
+    lon_name = get(config, logger, 'longitude')
+    lat_name = get(config, logger, 'latitude')
+    cgv = split_collectiongroupvariable(logger, lon_name)
+    lon = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+    cgv = split_collectiongroupvariable(logger, lat_name)
+    lat = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+    if lon.dims != lat.dims:
+        logger.abort(f'The longitude {lon.dims} and latitude {lat.dims} must have the same ' +
+                     'dimensions.')
+    location_dims = lon.dims
+
+    # Mask of each region, computed the first time it is needed
+    masks = []
+    lon_values = None
+    for definition in definitions:
+        region_key = f'region {definition} of {lon_name} and {lat_name}'
+        mask = data_collections.get_mask(region_key)
+        if mask is None:
+            if lon_values is None:
+                lon_values = wrap_longitude(lon.values)
+            mask = DataArray(compute_region_mask(lon_values, lat.values.astype(np.float64),
+                                                 definition), dims=location_dims)
+            data_collections.add_mask(region_key, [lon_name, lat_name], mask)
+        masks.append(mask.values)
+
+    # Index of the regions of each location, shared by all the variables
+    index, membership = compute_region_index(masks)
+    for name, mask in zip(region_names, masks):
+        logger.info(f'Region {name} has {np.count_nonzero(mask)} of {mask.size} locations.')
+
+    # Loop over the templates
+    for collection in collections:
+        for group in groups:
+            for variable in variables:
+
+                if variable is not None:
+                    # Replace collection, group, variable in template
+                    [new_name, starting_field] = replace_cgv(logger, collection, group, variable,
+                                                             new_name_template,
+                                                             starting_field_template)
+                else:
+                    new_name = new_name_template
+                    starting_field = starting_field_template
+
+                # Get the variable
+                cgv = split_collectiongroupvariable(logger, starting_field)
+                var_array = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+                if not set(location_dims).issubset(var_array.dims):
+                    logger.abort(f'Variable {starting_field} with dimensions {var_array.dims} ' +
+                                 f'does not have the location dimensions {location_dims}.')
+
+                results = bin_data_array(var_array, location_dims, index,
+                                         (len(region_names),), ('Region',), statistics,
+                                         membership)
+
+                # Add a group for each region and statistic
+                cgv_new = split_collectiongroupvariable(logger, new_name)
+                variables_to_add = {}
+                for statistic in statistics:
+                    for region, name in enumerate(region_names):
+                        variables_to_add[cgv_new[1] + name + statistic + '::' + cgv_new[2]] = \
+                            results[statistic].isel(Region=region)
+
+                data_collections.add_variables_to_collection(cgv_new[0], variables_to_add)
+
+
+# --------------------------------------------------------------------------------------------------
@@ -0,0 +1,349 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import hashlib
+import os
+
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from xarray import DataArray
+
+from eva.transforms.transform_utils import parse_for_dict, split_collectiongroupvariable
+from eva.transforms.transform_utils import replace_cgv
+from eva.utilities.config import get
+from eva.utilities.logger import Logger
+from eva.utilities.utils import get_cache_directory
+
+
+# --------------------------------------------------------------------------------------------------
+
+# Version of the regridding weights, increment when the way they are computed changes
+regrid_weights_version = 1
+
+# Regridding weights already computed by this process, keyed by the hash of the grids
+regrid_weights_memo = {}
+
+# Names of the dimensions of the regular lat/lon grid
+regrid_dims = ('GridLatitude', 'GridLongitude')
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def lonlat_to_xyz(lon, lat):
+
+    """
+    Convert longitudes and latitudes in degrees to points on the unit sphere.
+
+    Args:
+        lon (np.ndarray): Longitudes in degrees.
+        lat (np.ndarray): Latitudes in degrees.
+
+    Returns:
+        np.ndarray: (n, 3) array of Cartesian coordinates.
+    """
+
+    lon = np.deg2rad(np.ravel(lon).astype(np.float64))
+    lat = np.deg2rad(np.ravel(lat).astype(np.float64))
+    cos_lat = np.cos(lat)
+
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def compute_regrid_weights(source_lon, source_lat, target_lon, target_lat, method,
+                           number_of_neighbours):
+
+    """
+    Compute the sparse matrix mapping values on the source points to the target points.
+
+    Neighbours are found with a KD-tree on the unit sphere so the weights do not depend on how the
+    longitudes are wrapped or on the pole singularities of the source grid.
+
+    Args:
+        source_lon (np.ndarray): Longitudes of the source points in degrees.
+        source_lat (np.ndarray): Latitudes of the source points in degrees.
+        target_lon (np.ndarray): Longitudes of the target points in degrees.
+        target_lat (np.ndarray): Latitudes of the target points in degrees.
+        method (str): 'nearest' or 'inverse_distance'.
+        number_of_neighbours (int): Number of neighbours used by the inverse distance method.
+
+    Returns:
+        scipy.sparse.csr_matrix: (number of targets, number of sources) weights.
+    """
+
+    source_xyz = lonlat_to_xyz(source_lon, source_lat)
+    target_xyz = lonlat_to_xyz(target_lon, target_lat)
+    n_source = source_xyz.shape[0]
+    n_target = target_xyz.shape[0]
+
+    # Source points with missing coordinates are never used
+    valid = np.isfinite(source_xyz).all(axis=1)
+    source_index = np.flatnonzero(valid)
+    tree = cKDTree(source_xyz[valid])
+
+    k = 1 if method == 'nearest' else min(number_of_neighbours, source_index.size)
+    distance, neighbour = tree.query(target_xyz, k=k)
+    distance = distance.reshape(n_target, k)
+    columns = source_index[neighbour.reshape(n_target, k)]
+
+    if k == 1:
+        weights = np.ones((n_target, 1))
+    else:
+        # Inverse distance weights, a target on top of a source point takes its value
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distance
+        exact = np.isinf(weights)
+        exact_rows = exact.any(axis=1)
+        weights[exact_rows] = exact[exact_rows]
+        weights /= weights.sum(axis=1, keepdims=True)
+
+    rows = np.repeat(np.arange(n_target), k)
+
+    return sparse.csr_matrix((weights.ravel(), (rows, columns.ravel())),
+                             shape=(n_target, n_source))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_regrid_weights(source_lon, source_lat, target_lon, target_lat, method,
+                       number_of_neighbours, cache_dir, logger):
+
+    """
+    Get the regridding weights, reusing weights computed earlier for the same grids when possible.
+
+    Weights are memoized for the life of the process and, if cache_dir is set, saved to disk. Both
+    are keyed by a hash of the source and target coordinates and of the method, so weights computed
+    for one grid file are reused by every variable and every run on the same grid.
+
+    Args:
+        source_lon (np.ndarray): Longitudes of the source points in degrees.
+        source_lat (np.ndarray): Latitudes of the source points in degrees.
+        target_lon (np.ndarray): Longitudes of the target points in degrees.
+        target_lat (np.ndarray): Latitudes of the target points in degrees.
+        method (str): 'nearest' or 'inverse_distance'.
+        number_of_neighbours (int): Number of neighbours used by the inverse distance method.
+        cache_dir (str): Directory of the on-disk cache, empty or None to disable it.
+        logger (Logger): An instance of the logger for logging messages.
+
+    Returns:
+        scipy.sparse.csr_matrix: (number of targets, number of sources) weights.
+    """
+
+    grid_hash = hashlib.sha1()
+    for array in (source_lon, source_lat, target_lon, target_lat):
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        grid_hash.update(repr(array.shape).encode())
+        grid_hash.update(array.tobytes())
+    grid_hash.update(repr((method, number_of_neighbours, regrid_weights_version)).encode())
+    key = grid_hash.hexdigest()
+
+    weights = regrid_weights_memo.get(key)
+
+    # Look in the on-disk cache
+    cache_file = None
+    if weights is None and cache_dir:
+        cache_file = os.path.join(cache_dir, key + '.npz')
+        try:
+            weights = sparse.load_npz(cache_file).tocsr()
+        except (OSError, ValueError):
+            weights = None
+
+    # Compute the weights
+    if weights is None:
+        logger.info(f'Computing {method} regridding weights for {np.size(source_lon)} points')
+        weights = compute_regrid_weights(source_lon, source_lat, target_lon, target_lat, method,
+                                         number_of_neighbours)
+
+        if cache_file is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_file = f'{cache_file}.{os.getpid()}.tmp.npz'
+                sparse.save_npz(tmp_file, weights)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                logger.info(f'Warning: unable to write regridding weights cache {cache_file}')
+
+    regrid_weights_memo[key] = weights
+
+    return weights
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def apply_regrid_weights(weights, values):
+
+    """
+    Apply regridding weights to the columns of a (number of sources, n) array.
+
+    Missing (NaN) source values are left out and the weights of the remaining neighbours are
+    renormalized. Targets without any valid neighbour are NaN.
+
+    Args:
+        weights (scipy.sparse.csr_matrix): (number of targets, number of sources) weights.
+        values (np.ndarray): (number of sources, n) values.
+
+    Returns:
+        np.ndarray: (number of targets, n) regridded values.
+    """
+
+    missing = np.isnan(values)
+    if not missing.any():
+        return weights @ values
+
+    regridded = weights @ np.where(missing, 0.0, values)
+    weight_sum = weights @ (~missing).astype(values.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        regridded /= weight_sum
+    regridded[weight_sum == 0.0] = np.nan
+
+    return regridded
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def regrid(config, data_collections):
+
+    """
+    Regrids variables on a native curvilinear grid, for example the FV3 cubed sphere or the SOCA
+    tripolar grid, onto a regular lat/lon grid.
+
+    Args:
+        config (dict): A configuration dictionary containing transformation parameters.
+        data_collections (DataCollections): An instance of the DataCollections class containing
+        input data.
+
+    Returns:
+        None
+
+    The weights mapping the native grid to the regular grid are computed once as a sparse matrix
+    and applied to every variable, and to all the levels of a variable, with a single sparse
+    product. They are cached on disk, under the cache_directory of the configuration, so later runs
+    on the same grid do not recompute them. The regular grid is described by its resolution in
+    degrees and optional domain, and the longitude and latitude of its points are added to the
+    group of the new variables, with dimensions GridLatitude and GridLongitude, for use by
+    MapGridded.
+
+    Example:
+        ::
+
+                config = {
+                    'longitude': 'experiment::FV3Orog::geolon',
+                    'latitude': 'experiment::FV3Orog::geolat',
+                    'resolution': 1.0,
+                    'domain': [-180, 180, -90, 90],
+                    'method': 'nearest',
+                    'new name': 'experiment::Regridded::${variable}',
+                    'starting field': 'experiment::FV3Vars2D::${variable}',
+                    'for': {'variable': ['t2m']}
+                }
+                regrid(config, data_collections)
+    """
+
+    # Create a logger
+    logger = Logger('RegridTransform')
+
+    # Parse config for dictionary
+    [collections, groups, variables] = parse_for_dict(config, logger)
+
+    # Parse config for the expression and new collection/group/variable naming
+    new_name_template = get(config, logger, 'new name')
+    starting_field_template = get(config, logger, 'starting field')
+
+    # Regridding method
+    method = get(config, logger, 'method', 'nearest')
+    if method not in ['nearest', 'inverse_distance']:
+        logger.abort(f'Regridding method \'{method}\' is not one of nearest or inverse_distance.')
+    number_of_neighbours = int(get(config, logger, 'number of neighbours', 4))
+
+    # Directory of the on-disk cache of the weights, empty if the cache is disabled
+    cache_dir = get_cache_directory(config, 'regrid_weights')
+
+    # Source grid
+    cgv = split_collectiongroupvariable(logger, get(config, logger, 'longitude'))
+    source_lon = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+    cgv = split_collectiongroupvariable(logger, get(config, logger, 'latitude'))
+    source_lat = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+    if source_lon.dims != source_lat.dims:
+        logger.abort(f'The longitude {source_lon.dims} and latitude {source_lat.dims} must have ' +
+                     'the same dimensions.')
+    grid_dims = source_lon.dims
+
+    # Regular target grid, the points are at the center of the grid cells
+    resolution = float(get(config, logger, 'resolution', 1.0))
+    lon_min, lon_max, lat_min, lat_max = get(config, logger, 'domain', [-180.0, 180.0,
+                                                                        -90.0, 90.0])
+    target_lon_1d = np.arange(lon_min + resolution / 2, lon_max, resolution)
+    target_lat_1d = np.arange(lat_min + resolution / 2, lat_max, resolution)
+    target_lon, target_lat = np.meshgrid(target_lon_1d, target_lat_1d)
+
+    weights = get_regrid_weights(source_lon.values, source_lat.values, target_lon, target_lat,
+                                 method, number_of_neighbours, cache_dir, logger)
+
+    # Longitude and latitude of the regular grid are added to each new group once
+    grids_added = set()
+
+    # Loop over the templates
+    for collection in collections:
+        for group in groups:
+            for variable in variables:
+
+                if variable is not None:
+                    # Replace collection, group, variable in template
+                    [new_name, starting_field] = replace_cgv(logger, collection, group, variable,
+                                                             new_name_template,
+                                                             starting_field_template)
+                else:
+                    new_name = new_name_template
+                    starting_field = starting_field_template
+
+                # Get the variable to regrid
+                cgv = split_collectiongroupvariable(logger, starting_field)
+                var_array = data_collections.get_variable_data_array(cgv[0], cgv[1], cgv[2])
+
+                if not set(grid_dims).issubset(var_array.dims):
+                    logger.abort(f'Variable {starting_field} with dimensions {var_array.dims} ' +
+                                 f'is not on the grid of the longitude, dimensions {grid_dims}.')
+
+                # Move the grid dimensions last and flatten them, other dimensions are kept
+                other_dims = [dim for dim in var_array.dims if dim not in grid_dims]
+                var_array = var_array.transpose(*other_dims, *grid_dims)
+                other_shape = var_array.shape[:len(other_dims)]
+                values = var_array.values.reshape(-1, weights.shape[1]).T
+                if not np.issubdtype(values.dtype, np.floating):
+                    values = values.astype(np.float64)
+
+                # Single sparse product for all the levels of the variable
+                regridded = apply_regrid_weights(weights, values).astype(values.dtype).T
+                regridded = regridded.reshape(other_shape + target_lon.shape)
+
+                # Get the collection, group, var for new dataset and add the regridded variable
+                cgv_new = split_collectiongroupvariable(logger, new_name)
+                regridded = DataArray(regridded, dims=(*other_dims, *regrid_dims))
+                data_collections.add_variable_to_collection(cgv_new[0], cgv_new[1], cgv_new[2],
+                                                            regridded)
+
+                if (cgv_new[0], cgv_new[1]) not in grids_added:
+                    grids_added.add((cgv_new[0], cgv_new[1]))
+                    for name, coordinate in [('longitude', target_lon), ('latitude', target_lat)]:
+                        data_collections.add_variable_to_collection(
+                            cgv_new[0], cgv_new[1], name, DataArray(coordinate, dims=regrid_dims))
+
+
+# --------------------------------------------------------------------------------------------------
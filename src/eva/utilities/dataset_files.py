@@ -0,0 +1,163 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import glob
+import os
+from datetime import datetime
+
+import netCDF4 as nc
+import numpy as np
+import xarray as xr
+
+from eva.time_series.time_series import date_template_dict, date_template_formats
+from eva.time_series.time_series import time_series_dates
+from eva.utilities.config import get
+from eva.utilities.duration import iso_duration_to_timedelta
+from eva.utilities.parallel import parallel_map
+from eva.utilities.utils import replace_vars_str
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_dataset_files(dataset_config, logger, key):
+
+    """
+    Get the list of files of a dataset from a key holding a file, a list of files, glob patterns
+    or date templates.
+
+    A file containing date tokens (e.g. /path/increment.${cycle}.nc) is expanded for each date from
+    the begin_date to the final_date (inclusive) of the dataset configuration, every interval.
+    Dates for which the file does not exist are skipped with a warning.
+
+    Args:
+        dataset_config (dict): The dataset configuration.
+        logger (Logger): An instance of the logger for logging messages.
+        key (str): The key of the dataset configuration holding the file(s).
+
+    Returns:
+        tuple: List of files and list of the date of each file, None unless all the files are
+               expanded from date templates.
+    """
+
+    file_entries = get(dataset_config, logger, key)
+    if isinstance(file_entries, str):
+        file_entries = [file_entries]
+
+    files = []
+    dates = []
+    for file_entry in file_entries:
+
+        if any('${' + token + '}' in file_entry for token in date_template_formats):
+
+            # Expand the date template
+            begin_date = datetime.fromisoformat(get(dataset_config, logger, 'begin_date'))
+            final_date = datetime.fromisoformat(get(dataset_config, logger, 'final_date'))
+            interval = iso_duration_to_timedelta(logger, get(dataset_config, logger, 'interval'))
+
+            for date in time_series_dates(logger, begin_date, final_date, interval):
+                file = replace_vars_str(file_entry, **date_template_dict(date))
+                if os.path.exists(file):
+                    files.append(file)
+                    dates.append(date)
+                else:
+                    logger.info(f'Warning: skipping {date.isoformat()} since the file {file} ' +
+                                'is missing.')
+
+        elif glob.has_magic(file_entry):
+
+            # Expand the glob pattern
+            files += sorted(glob.glob(file_entry))
+
+        else:
+            files.append(file_entry)
+
+    if not files:
+        logger.abort(f'No files were found for \'{key}\': {file_entries}')
+
+    return files, dates if len(dates) == len(files) else None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_netcdf_variables(file, variables, indices=None):
+
+    """
+    Read the requested variables of a netCDF file into memory.
+
+    Only the requested variables, and the coordinates of the dimensions, are opened so the other
+    variables of the file are never decoded or read.
+
+    Args:
+        file (str): Path to the netCDF file.
+        variables (list): Names of the variables to read.
+        indices (dict, optional): Indices to read along some dimensions, e.g. a subset of the
+                                  levels. The subset is selected before any data is read.
+
+    Returns:
+        xr.Dataset: The requested variables of the file.
+    """
+
+    with nc.Dataset(file, mode='r') as f:
+        drop_variables = [v for v in f.variables if v not in variables and v not in f.dimensions]
+
+    with xr.open_dataset(file, drop_variables=drop_variables) as ds:
+        if indices:
+            ds = ds.isel(indices)
+        return ds.load()
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_netcdf_files(files, variables, number_of_workers, dimension, dates=None, indices=None):
+
+    """
+    Read the requested variables of a list of netCDF files concurrently and concatenate them.
+
+    The files are read by a pool of processes since the netCDF and HDF5 libraries are not thread
+    safe.
+
+    Args:
+        files (list): Paths to the netCDF files.
+        variables (list): Names of the variables to read.
+        number_of_workers (int): Number of processes reading the files.
+        dimension (str): Dimension along which the files are concatenated. If the files do not
+                         have this dimension a new dimension is created. A single file is
+                         returned as it is read.
+        dates (list, optional): Date of each file, used as the coordinate of a new dimension.
+        indices (dict, optional): Indices to read along some dimensions of each file.
+
+    Returns:
+        xr.Dataset: The concatenated variables of all the files.
+    """
+
+    datasets = parallel_map(read_netcdf_variables, [(file, variables, indices) for file in files],
+                            number_of_workers, use_processes=True)
+
+    if len(datasets) == 1:
+        return datasets[0]
+
+    # Along a new dimension all the variables are stacked, along an existing dimension the
+    # variables without that dimension are taken from the first file
+    new_dimension = dimension not in datasets[0].dims
+    ds = xr.concat(datasets, dim=dimension, data_vars='all' if new_dimension else 'minimal',
+                   coords='minimal', compat='override', join='override')
+
+    if new_dimension and dates is not None:
+        ds = ds.assign_coords({dimension: np.array(dates, dtype='datetime64[ns]')})
+
+    return ds
+
+
+# --------------------------------------------------------------------------------------------------
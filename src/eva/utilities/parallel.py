@@ -0,0 +1,109 @@
+# (C) Copyright 2024- NOAA/NWS/EMC
+#
+# (C) Copyright 2024- United States Government as represented by the Administrator of the
+# National Aeronautics and Space Administration. All Rights Reserved.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from eva.utilities.config import get
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def get_number_of_workers(config, logger, number_of_tasks):
+
+    """
+    Get the number of workers to use for a set of tasks from the configuration.
+
+    The number of workers is read from the optional 'number_of_workers' key and defaults to the
+    number of processors available. It is never more than the number of tasks.
+
+    Args:
+        config (dict): The configuration dictionary (e.g. a dataset configuration).
+        logger (Logger): An instance of the logger for logging messages.
+        number_of_tasks (int): Number of tasks that will be shared among the workers.
+
+    Returns:
+        int: The number of workers to use.
+    """
+
+    number_of_workers = int(get(config, logger, 'number_of_workers', os.cpu_count() or 1))
+
+    logger.assert_abort(number_of_workers > 0, 'number_of_workers must be greater than zero, ' +
+                        f'found {number_of_workers}.')
+
+    return max(1, min(number_of_workers, number_of_tasks))
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parallel_imap(function, arguments_list, number_of_workers, use_processes=False):
+
+    """
+    Call a function for each set of arguments using a pool of workers, yielding the results.
+
+    Results are yielded in the order of the arguments list as soon as they are available, so the
+    caller can consume each result (e.g. copy it into a preallocated array) and release it while
+    the remaining calls are still running. With a single worker the calls are made serially in the
+    calling process.
+
+    Args:
+        function (callable): The function to call. Must be picklable if use_processes is True.
+        arguments_list (list): List of tuples, each containing the arguments of one call.
+        number_of_workers (int): Number of workers in the pool.
+        use_processes (bool): Use a pool of processes instead of threads.
+
+    Yields:
+        The result of each call.
+    """
+
+    if number_of_workers <= 1 or len(arguments_list) <= 1:
+        for arguments in arguments_list:
+            yield function(*arguments)
+        return
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=number_of_workers) as executor:
+        futures = [executor.submit(function, *arguments) for arguments in arguments_list]
+        for ind in range(len(futures)):
+            yield futures[ind].result()
+            futures[ind] = None
+
+
+# --------------------------------------------------------------------------------------------------
+
+
+def parallel_map(function, arguments_list, number_of_workers, use_processes=False):
+
+    """
+    Call a function for each set of arguments using a pool of workers.
+
+    Results are returned in the order of the arguments list, so the outcome does not depend on the
+    number of workers. With a single worker the calls are made serially in the calling process.
+
+    Args:
+        function (callable): The function to call. Must be picklable if use_processes is True.
+        arguments_list (list): List of tuples, each containing the arguments of one call.
+        number_of_workers (int): Number of workers in the pool.
+        use_processes (bool): Use a pool of processes instead of threads. Threads suit readers
+                              whose work is mostly in compiled code, processes suit pure Python
+                              work such as text parsing.
+
+    Returns:
+        list: The result of each call.
+    """
+
+    return list(parallel_imap(function, arguments_list, number_of_workers, use_processes))
+
+
+# --------------------------------------------------------------------------------------------------
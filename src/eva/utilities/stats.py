@@ -47,14 +47,19 @@ def get_field_data(logger, field, data_collections):
         channel = field['channel']
 
     # Get the field data
-    field_data = data_collections.get_variable_data(var_cgv[0], var_cgv[1], var_cgv[2], channel)
+    field_data = data_collections.get_variable_data(var_cgv[0], var_cgv[1], var_cgv[2], channel,
+                                                    apply_selection=False)
+    selection = data_collections.get_variable_selection(var_cgv[0], var_cgv[1], var_cgv[2],
+                                                        channel)
 
     # See if we need to slice data
     field_data = slice_var_from_str(field, field_data, logger)
 
-    # Flatten and mask missing data
+    # Flatten and mask missing data, and data outside the selection of a filtered view
     field_data = field_data.flatten()
     mask = ~np.isnan(field_data)
+    if selection is not None:
+        mask &= slice_var_from_str(field, selection, logger).flatten()
     field_data = field_data[mask]
 
     return field_data
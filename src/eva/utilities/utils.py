@@ -7,6 +7,7 @@
 # --------------------------------------------------------------------------------------------------
 
 
+import os
 import re
 import string
 import yaml
@@ -240,6 +241,35 @@ def parse_channel_list(channels_str_or_list, logger):
 # --------------------------------------------------------------------------------------------------
 
 
+def get_level_indices(levels, number_of_levels, logger):
+
+    """
+    Convert a list of model level numbers into the indices of the levels in a file.
+
+    Model levels are numbered from 1, the first level stored in the file. The indices are sorted
+    and unique so that they can be used directly for hyperslab reads.
+
+    Args:
+        levels (list): The model level numbers, as returned by parse_channel_list.
+        number_of_levels (int): The number of levels of the variable in the file.
+        logger (Logger): The logger object for logging error messages.
+
+    Returns:
+        list: The zero based indices of the levels, sorted and unique.
+    """
+
+    levels = sorted(set(levels))
+
+    if levels[0] < 1 or levels[-1] > number_of_levels:
+        logger.abort(f'The requested levels {levels} are not all between 1 and the number of ' +
+                     f'levels in the file ({number_of_levels}).')
+
+    return [level - 1 for level in levels]
+
+
+# --------------------------------------------------------------------------------------------------
+
+
 def replace_vars_str(s, **defs):
 
     """
@@ -475,3 +505,30 @@ def is_number(s):
         return False
 
 # --------------------------------------------------------------------------------------------------
+
+
+def get_cache_directory(config, cache_name):
+
+    """
+    Get the directory of an on-disk cache.
+
+    All the caches live under one root directory, given by the cache_directory key of the
+    configuration, else by the EVA_CACHE_DIR environment variable, else ~/.cache/eva. Setting
+    either to an empty string disables the on-disk caches.
+
+    Parameters:
+        config (dict): Configuration that may hold the cache_directory key.
+        cache_name (str): Name of the cache, used as the sub directory.
+
+    Returns:
+        str: Path to the cache directory, or an empty string if the caches are disabled. The
+             directory is not created.
+    """
+
+    default_cache_root = os.path.join(os.path.expanduser('~'), '.cache', 'eva')
+    cache_root = config.get('cache_directory', os.environ.get('EVA_CACHE_DIR', default_cache_root))
+    if not cache_root:
+        return ''
+    return os.path.join(os.path.expanduser(cache_root), cache_name)
+
+# --------------------------------------------------------------------------------------------------